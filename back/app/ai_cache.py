@@ -0,0 +1,91 @@
+# app/ai_cache.py
+"""
+Cache endereçado por conteúdo para os resultados da IA (geração e OCR).
+
+A chave é o SHA-256 de (tipo, versão do prompt, modelo, quantidade,
+dificuldade, texto normalizado). Os valores ficam no Redis com TTL; o
+despejo por memória fica a cargo da política LRU do próprio Redis
+(maxmemory-policy allkeys-lru). Qualquer falha do Redis é tratada como
+miss: o cache nunca impede uma geração.
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+from typing import Any, Optional
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+KEY_PREFIX = "ai_cache"
+
+_client: Optional[redis.Redis] = None
+
+def _get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+def normalize_text(text: str) -> str:
+    """Normaliza espaços para que o mesmo conteúdo gere a mesma chave."""
+    return re.sub(r"\s+", " ", text).strip()
+
+def make_key(kind: str, text: str, prompt_version: str, model: str, count: int, difficulty: str) -> str:
+    digest = hashlib.sha256()
+    for part in (kind, prompt_version, model, str(count), difficulty, normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return f"{KEY_PREFIX}:{kind}:{digest.hexdigest()}"
+
+def make_ocr_page_key(file_hash: str, page_number: int, backend: str) -> str:
+    """Chave do texto OCR de uma página: (hash do arquivo, número da página, backend)."""
+    return f"{KEY_PREFIX}:ocr_page:{backend}:{file_hash}:{page_number}"
+
+def _record(kind: str, outcome: str) -> None:
+    try:
+        _get_client().hincrby(f"{KEY_PREFIX}:stats", f"{kind}:{outcome}", 1)
+    except redis.RedisError:
+        pass
+
+def lookup(key: str, kind: str) -> Optional[Any]:
+    """Retorna o resultado em cache (já desserializado) ou None em caso de miss."""
+    if not AI_CACHE_ENABLED:
+        return None
+    try:
+        raw = _get_client().get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Cache de IA indisponível (get): {e}")
+        return None
+
+    if raw is None:
+        _record(kind, "miss")
+        return None
+
+    _record(kind, "hit")
+    return json.loads(raw)
+
+def store(key: str, value: Any) -> None:
+    if not AI_CACHE_ENABLED:
+        return
+    try:
+        _get_client().set(key, json.dumps(value, ensure_ascii=False), ex=AI_CACHE_TTL_SECONDS)
+    except redis.RedisError as e:
+        logger.warning(f"Cache de IA indisponível (set): {e}")
+
+def get_stats() -> dict[str, int]:
+    """Contadores de hit/miss por tipo, ex.: {"flashcards:hit": 10, "quiz:miss": 3}."""
+    try:
+        raw = _get_client().hgetall(f"{KEY_PREFIX}:stats")
+    except redis.RedisError:
+        return {}
+    return {field.decode(): int(value) for field, value in raw.items()}
@@ -1,31 +1,242 @@
 # back/app/ai_generator.py
 import os
+import re
 import json
 import time
-from typing import List, Dict, Any, Optional
+import asyncio
+import threading
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Callable, Iterable, List, Dict, Any, Optional, Tuple
 import google.generativeai as genai
 from dotenv import load_dotenv
+from . import ai_cache
+from .cancellation import CANCEL_POLL_INTERVAL_SECONDS
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-if not GOOGLE_API_KEY:
+# O backend "fake" (testes de carga) não precisa da chave
+if not GOOGLE_API_KEY and os.getenv("AI_BACKEND", "gemini").lower() != "fake":
     raise ValueError("A variável de ambiente GOOGLE_API_KEY não foi configurada.")
 
 genai.configure(api_key=GOOGLE_API_KEY)
 
-# --- Função existente (permanece igual) ---
-def chat_about_flashcard(
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# Incrementar sempre que o prompt mudar, para invalidar o cache de resultados
+FLASHCARDS_PROMPT_VERSION = "1"
+QUIZ_PROMPT_VERSION = "1"
+
+# Textos longos são divididos em trechos deste tamanho (map-reduce)
+MAX_CHUNK_CHARS = int(os.getenv("AI_MAX_CHUNK_CHARS", 15000))
+# Máximo de trechos enviados por geração e de chamadas simultâneas ao Gemini
+MAX_CHUNKS_PER_GENERATION = int(os.getenv("AI_MAX_CHUNKS_PER_GENERATION", 8))
+AI_GENERATION_CONCURRENCY = int(os.getenv("AI_GENERATION_CONCURRENCY", 4))
+
+# --- Cliente do modelo ---
+# "gemini" (padrão) ou "fake" (respostas locais, para testes de carga)
+AI_BACKEND = os.getenv("AI_BACKEND", "gemini").lower()
+# Chamadas simultâneas ao modelo por processo (por event loop no caminho async)
+AI_MAX_CONCURRENT_REQUESTS = int(os.getenv("AI_MAX_CONCURRENT_REQUESTS", 16))
+AI_FAKE_LATENCY_SECONDS = float(os.getenv("AI_FAKE_LATENCY_SECONDS", "0.5"))
+
+CHAT_TIMEOUT_SECONDS = 60.0
+FLASHCARDS_TIMEOUT_SECONDS = 60.0
+QUIZ_TIMEOUT_SECONDS = 90.0
+
+FLASHCARDS_GENERATION_CONFIG = {
+    "temperature": 0.7, "top_p": 1, "top_k": 1, "max_output_tokens": 8192,
+}
+QUIZ_GENERATION_CONFIG = {
+    "temperature": 0.8, "top_p": 1, "top_k": 1, "max_output_tokens": 8192,
+}
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
+]
+
+class ModelClient:
+    """
+    Interface do cliente do modelo. generate() é bloqueante (workers do
+    Celery); agenerate() é assíncrono (chat da API), para que uma chamada
+    longa não ocupe uma thread do servidor; astream() é a versão assíncrona
+    que entrega o texto em trechos (chat em streaming).
+    """
+    name = "base"
+
+    def generate(self, prompt, generation_config: Optional[dict] = None, timeout: float = 60.0) -> str:
+        raise NotImplementedError
+
+    async def agenerate(self, prompt, generation_config: Optional[dict] = None, timeout: float = 60.0) -> str:
+        raise NotImplementedError
+
+    async def astream(self, prompt, generation_config: Optional[dict] = None, timeout: float = 60.0) -> AsyncIterator[str]:
+        """Gera os trechos do texto conforme chegam; por padrão, tudo de uma vez."""
+        yield await self.agenerate(prompt, generation_config, timeout)
+
+class GeminiModelClient(ModelClient):
+    """
+    Gemini com os modelos (e os clientes gRPC do SDK) reaproveitados entre
+    chamadas, limite de chamadas simultâneas por processo e timeout.
+    """
+    name = "gemini"
+
+    def __init__(self, model_name: str = GEMINI_MODEL, max_concurrent: int = AI_MAX_CONCURRENT_REQUESTS):
+        self.model_name = model_name
+        self.max_concurrent = max_concurrent
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._sync_slots = threading.BoundedSemaphore(max_concurrent)
+        # asyncio.Semaphore pertence a um event loop: um por loop, descartado
+        # junto com o loop (o id de um loop morto pode ser reutilizado)
+        self._async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+    def _model(self, generation_config: Optional[dict]):
+        key = json.dumps(generation_config, sort_keys=True)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(
+                    model_name=self.model_name,
+                    generation_config=generation_config,
+                    safety_settings=SAFETY_SETTINGS if generation_config else None,
+                )
+                self._models[key] = model
+            return model
+
+    def _async_slot(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slot = self._async_slots.get(loop)
+            if slot is None:
+                slot = asyncio.Semaphore(self.max_concurrent)
+                self._async_slots[loop] = slot
+            return slot
+
+    def generate(self, prompt, generation_config: Optional[dict] = None, timeout: float = 60.0) -> str:
+        with self._sync_slots:
+            response = self._model(generation_config).generate_content(
+                prompt, request_options={"timeout": timeout}
+            )
+        return response.text
+
+    async def agenerate(self, prompt, generation_config: Optional[dict] = None, timeout: float = 60.0) -> str:
+        async with self._async_slot():
+            response = await asyncio.wait_for(
+                self._model(generation_config).generate_content_async(
+                    prompt, request_options={"timeout": timeout}
+                ),
+                timeout,
+            )
+        return response.text
+
+    async def astream(self, prompt, generation_config: Optional[dict] = None, timeout: float = 60.0) -> AsyncIterator[str]:
+        # O slot fica ocupado até o fim do stream; o timeout vale para o stream
+        # inteiro (um stream travado não prende o slot nem a conexão SSE)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        async with self._async_slot():
+            response = await asyncio.wait_for(
+                self._model(generation_config).generate_content_async(
+                    prompt, stream=True, request_options={"timeout": timeout}
+                ),
+                timeout,
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(anext(chunks), max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    return
+                if chunk.parts:
+                    yield chunk.text
+
+class FakeModelClient(ModelClient):
+    """
+    Respostas locais e determinísticas no formato esperado pelos parsers,
+    com latência configurável (AI_FAKE_LATENCY_SECONDS). Para testes de carga
+    sem gastar cota: AI_BACKEND=fake.
+    """
+    name = "fake"
+
+    def __init__(self, latency: float = AI_FAKE_LATENCY_SECONDS):
+        self.latency = latency
+
+    def _respond(self, prompt) -> str:
+        text = "\n".join(prompt) if isinstance(prompt, list) else str(prompt)
+        if '"questions"' in text:
+            match = re.search(r"(\d+) perguntas", text)
+            count = int(match.group(1)) if match else 5
+            return json.dumps({
+                "title": "Quiz de teste",
+                "questions": [
+                    {
+                        "text": f"Pergunta de teste {i + 1}?",
+                        "answers": [
+                            {"text": f"Alternativa {letter}", "is_correct": letter == "A", "explanation": "Resposta de teste."}
+                            for letter in "ABCDE"
+                        ],
+                    }
+                    for i in range(count)
+                ],
+            }, ensure_ascii=False)
+        if '"flashcards"' in text:
+            match = re.search(r"(\d+) flashcards", text)
+            count = int(match.group(1)) if match else 10
+            return json.dumps({
+                "flashcards": [
+                    {"front": f"Pergunta de teste {i + 1}?", "back": f"Resposta de teste {i + 1}.", "type": "concept"}
+                    for i in range(count)
+                ]
+            }, ensure_ascii=False)
+        return "Resposta de teste do tutor."
+
+    def generate(self, prompt, generation_config: Optional[dict] = None, timeout: float = 60.0) -> str:
+        time.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def agenerate(self, prompt, generation_config: Optional[dict] = None, timeout: float = 60.0) -> str:
+        await asyncio.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def astream(self, prompt, generation_config: Optional[dict] = None, timeout: float = 60.0) -> AsyncIterator[str]:
+        words = self._respond(prompt).split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
+
+_model_client: Optional[ModelClient] = None
+_model_client_lock = threading.Lock()
+
+def get_model_client() -> ModelClient:
+    """Cliente do modelo do processo, criado uma única vez sob demanda."""
+    global _model_client
+    if _model_client is None:
+        with _model_client_lock:
+            if _model_client is None:
+                _model_client = FakeModelClient() if AI_BACKEND == "fake" else GeminiModelClient()
+    return _model_client
+
+def set_model_client(client: ModelClient) -> None:
+    """Substitui o cliente do modelo (ex.: FakeModelClient em testes)."""
+    global _model_client
+    _model_client = client
+
+def _clean_json_response(raw: str) -> Any:
+    return json.loads(raw.strip().replace("```json", "").replace("```", ""))
+
+# --- Chat sobre um flashcard ---
+def _chat_prompt(
     message: str,
     flashcard_front: str,
     flashcard_back: str,
     document_context: str,
-    conversation_history: list[dict] = None
+    conversation_history: Optional[list[dict]],
 ) -> str:
-    if not message or message.isspace():
-        return "Por favor, faça uma pergunta sobre este tópico."
-
     history_text = ""
     if conversation_history:
         for entry in conversation_history[-5:]:
@@ -64,40 +275,64 @@ def chat_about_flashcard(
     PERGUNTA DO USUÁRIO: {message}
 
     Responda como um professor dedicado que quer genuinamente ajudar o aluno a compreender e aprofundar o conhecimento:"""
+    return prompt
+
+def chat_about_flashcard(
+    message: str,
+    flashcard_front: str,
+    flashcard_back: str,
+    document_context: str,
+    conversation_history: list[dict] = None
+) -> str:
+    if not message or message.isspace():
+        return "Por favor, faça uma pergunta sobre este tópico."
 
+    prompt = _chat_prompt(message, flashcard_front, flashcard_back, document_context, conversation_history)
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return get_model_client().generate(prompt, timeout=CHAT_TIMEOUT_SECONDS).strip()
     except Exception as e:
         return f"Desculpe, ocorreu um erro ao processar sua pergunta: {e}"
 
-# --- Função nova e melhorada ---
-def generate_flashcards_from_text(
-    text: str, num_flashcards: int = 10, difficulty: str = "Médio"
-) -> List[Dict[str, Any]]:
+async def achat_about_flashcard(
+    message: str,
+    flashcard_front: str,
+    flashcard_back: str,
+    document_context: str,
+    conversation_history: list[dict] = None
+) -> str:
+    """Versão assíncrona de chat_about_flashcard (não ocupa thread da API)."""
+    if not message or message.isspace():
+        return "Por favor, faça uma pergunta sobre este tópico."
+
+    prompt = _chat_prompt(message, flashcard_front, flashcard_back, document_context, conversation_history)
+    try:
+        return (await get_model_client().agenerate(prompt, timeout=CHAT_TIMEOUT_SECONDS)).strip()
+    except Exception as e:
+        return f"Desculpe, ocorreu um erro ao processar sua pergunta: {e}"
+
+async def astream_chat_about_flashcard(
+    message: str,
+    flashcard_front: str,
+    flashcard_back: str,
+    document_context: str,
+    conversation_history: list[dict] = None
+) -> AsyncIterator[str]:
     """
-    Gera flashcards otimizados: perguntas diretas e respostas concisas.
+    Versão em streaming de chat_about_flashcard: gera os trechos da resposta
+    conforme chegam do modelo. Erros do modelo são propagados ao chamador,
+    que decide o que fazer com a resposta parcial.
     """
-    if not text or text.isspace():
-        print("Texto de entrada está vazio. Pulando a geração de flashcards.")
-        return []
+    if not message or message.isspace():
+        yield "Por favor, faça uma pergunta sobre este tópico."
+        return
 
-    generation_config = {
-        "temperature": 0.7, "top_p": 1, "top_k": 1, "max_output_tokens": 8192,
-    }
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    ]
-    model = genai.GenerativeModel(
-        model_name="gemini-2.0-flash",
-        generation_config=generation_config,
-        safety_settings=safety_settings,
-    )
-    
+    prompt = _chat_prompt(message, flashcard_front, flashcard_back, document_context, conversation_history)
+    async for piece in get_model_client().astream(prompt, timeout=CHAT_TIMEOUT_SECONDS):
+        yield piece
+
+# --- Flashcards ---
+def _flashcards_prompt(text: str, num_flashcards: int, difficulty: str) -> List[str]:
+    """Monta o prompt de flashcards: perguntas diretas e respostas concisas."""
     difficulty_map = {
         "Fácil": {
             "foco": "conceitos fundamentais e definições básicas",
@@ -217,7 +452,7 @@ Foque em {difficulty_instruction}."""
             instruction,
             "",
             "TEXTO PARA ANÁLISE:",
-            text[:15000],
+            text[:MAX_CHUNK_CHARS],
             "",
             "REGRAS CRÍTICAS PARA FLASHCARDS EFICIENTES:",
             "",
@@ -301,53 +536,57 @@ Foque em {difficulty_instruction}."""
             "✗ Copiar parágrafos inteiros do texto como resposta",
             "✗ Respostas incompletas que não respondem totalmente a pergunta",
         ]
+    return prompt_parts
+
+def _parse_flashcards_response(raw: str) -> List[Dict[str, Any]]:
+    data = _clean_json_response(raw)
+    if "flashcards" in data and isinstance(data["flashcards"], list):
+        return data["flashcards"]
+    print("❌ Erro: resposta da IA não continha a estrutura esperada ('flashcards').")
+    raise ValueError("Resposta da IA malformada.")
+
+def _flashcards_cache_key(text: str, num_flashcards: int, difficulty: str) -> str:
+    return ai_cache.make_key(
+        "flashcards", text, FLASHCARDS_PROMPT_VERSION, GEMINI_MODEL, num_flashcards, difficulty
+    )
+
+def _generate_flashcards_single(
+    text: str, num_flashcards: int = 10, difficulty: str = "Médio", use_cache: bool = True
+) -> List[Dict[str, Any]]:
+    """
+    Gera flashcards otimizados (uma única chamada ao modelo): perguntas diretas
+    e respostas concisas. Resultados são reaproveitados do cache de IA (use_cache=False ignora o cache).
+    """
+    if not text or text.isspace():
+        print("Texto de entrada está vazio. Pulando a geração de flashcards.")
+        return []
+
+    cache_key = _flashcards_cache_key(text, num_flashcards, difficulty)
+    if use_cache:
+        cached = ai_cache.lookup(cache_key, "flashcards")
+        if cached is not None:
+            print("♻️ Flashcards reaproveitados do cache de IA.")
+            return cached
 
     try:
         print(f"Enviando texto para o Gemini. Qtd: {num_flashcards}, Dificuldade: {difficulty}")
         start = time.time()
-        response = model.generate_content(
-            prompt_parts,
-            request_options={"timeout": 60.0}
+        raw = get_model_client().generate(
+            _flashcards_prompt(text, num_flashcards, difficulty),
+            FLASHCARDS_GENERATION_CONFIG, timeout=FLASHCARDS_TIMEOUT_SECONDS,
         )
-        elapsed = time.time() - start
-        print(f"⏱️ Tempo de resposta Gemini: {elapsed:.2f}s")
-        cleaned_response_text = response.text.strip().replace("```json", "").replace("```", "")
-        data = json.loads(cleaned_response_text)
-        if "flashcards" in data and isinstance(data["flashcards"], list):
-            print("✅ Flashcards gerados com sucesso pelo Gemini.")
-            return data["flashcards"]
-        else:
-            print("❌ Erro: resposta da IA não continha a estrutura esperada ('flashcards').")
-            raise ValueError("Resposta da IA malformada.")
+        print(f"⏱️ Tempo de resposta Gemini: {time.time() - start:.2f}s")
+        flashcards = _parse_flashcards_response(raw)
+        print("✅ Flashcards gerados com sucesso pelo Gemini.")
+        ai_cache.store(cache_key, flashcards)
+        return flashcards
     except Exception as e:
         print(f"🚨 Erro ao gerar flashcards: {type(e).__name__} - {e}")
         raise e
 
-def generate_quiz_from_text(
-    text: str, num_questions: int = 5, difficulty: str = "Médio"
-) -> Optional[Dict[str, Any]]:
-    """
-    Gera quizzes otimizados com alternativas equilibradas e não previsíveis.
-    """
-    if not text or text.isspace():
-        print("Texto de entrada está vazio. Pulando a geração de quiz.")
-        return None
-        
-    generation_config = {
-        "temperature": 0.8, "top_p": 1, "top_k": 1, "max_output_tokens": 8192,
-    }
-    safety_settings = [
-        {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-        {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_MEDIUM_AND_ABOVE"},
-    ]
-    model = genai.GenerativeModel(
-        model_name="gemini-2.0-flash",
-        generation_config=generation_config,
-        safety_settings=safety_settings,
-    )
-    
+# --- Quiz ---
+def _quiz_prompt(text: str, num_questions: int, difficulty: str) -> List[str]:
+    """Monta o prompt de quiz, com alternativas equilibradas e não previsíveis."""
     difficulty_map = {
         "Fácil": {
             "foco": "conceitos fundamentais que podem ser respondidos com conhecimento básico",
@@ -470,7 +709,7 @@ Foque em {difficulty_instruction}."""
             instruction,
             "",
             "TEXTO PARA ANÁLISE:",
-            text[:15000],
+            text[:MAX_CHUNK_CHARS],
             "",
             "REGRAS CRÍTICAS PARA QUIZZES EFICIENTES E NÃO PREVISÍVEIS:",
             "",
@@ -555,24 +794,275 @@ Foque em {difficulty_instruction}."""
             "✗ Perguntas que exigem conhecimento externo ao texto",
             "✗ Explicações que simplesmente repetem a alternativa",
         ]
+    return prompt_parts
+
+def _parse_quiz_response(raw: str) -> Dict[str, Any]:
+    data = _clean_json_response(raw)
+    if "title" in data and "questions" in data and isinstance(data["questions"], list):
+        return data
+    print("❌ Erro: resposta da IA não continha a estrutura esperada ('title', 'questions').")
+    raise ValueError("Resposta da IA malformada.")
+
+def _quiz_cache_key(text: str, num_questions: int, difficulty: str) -> str:
+    return ai_cache.make_key(
+        "quiz", text, QUIZ_PROMPT_VERSION, GEMINI_MODEL, num_questions, difficulty
+    )
+
+def _generate_quiz_single(
+    text: str, num_questions: int = 5, difficulty: str = "Médio", use_cache: bool = True
+) -> Optional[Dict[str, Any]]:
+    """
+    Gera quizzes otimizados (uma única chamada ao modelo) com alternativas
+    equilibradas e não previsíveis. Resultados são reaproveitados do cache de IA (use_cache=False ignora o cache).
+    """
+    if not text or text.isspace():
+        print("Texto de entrada está vazio. Pulando a geração de quiz.")
+        return None
+
+    cache_key = _quiz_cache_key(text, num_questions, difficulty)
+    if use_cache:
+        cached = ai_cache.lookup(cache_key, "quiz")
+        if cached is not None:
+            print("♻️ Quiz reaproveitado do cache de IA.")
+            return cached
 
     try:
         print(f"Enviando texto para o Gemini para gerar Quiz. Qtd: {num_questions}, Dificuldade: {difficulty}")
         start = time.time()
-        response = model.generate_content(
-            prompt_parts,
-            request_options={"timeout": 90.0}
+        raw = get_model_client().generate(
+            _quiz_prompt(text, num_questions, difficulty),
+            QUIZ_GENERATION_CONFIG, timeout=QUIZ_TIMEOUT_SECONDS,
         )
-        elapsed = time.time() - start
-        print(f"⏱️ Tempo de resposta Gemini (Quiz): {elapsed:.2f}s")
-        cleaned_response_text = response.text.strip().replace("```json", "").replace("```", "")
-        data = json.loads(cleaned_response_text)
-        if "title" in data and "questions" in data and isinstance(data["questions"], list):
-            print("✅ Quiz gerado com sucesso pelo Gemini.")
-            return data
-        else:
-            print("❌ Erro: resposta da IA não continha a estrutura esperada ('title', 'questions').")
-            raise ValueError("Resposta da IA malformada.")
+        print(f"⏱️ Tempo de resposta Gemini (Quiz): {time.time() - start:.2f}s")
+        quiz = _parse_quiz_response(raw)
+        print("✅ Quiz gerado com sucesso pelo Gemini.")
+        ai_cache.store(cache_key, quiz)
+        return quiz
     except Exception as e:
         print(f"🚨 Erro ao gerar quiz: {type(e).__name__} - {e}")
-        return None
\ No newline at end of file
+        return None
+
+# --- Geração map-reduce para documentos longos ---
+
+def split_text_into_chunks(text: str, max_chars: int = MAX_CHUNK_CHARS) -> List[str]:
+    """
+    Divide o texto em trechos de até max_chars, respeitando limites de
+    parágrafo e, quando um parágrafo não cabe, limites de frase.
+    """
+    pieces: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            if sentence:
+                pieces.append(sentence)
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _select_chunks(chunks: List[str], max_chunks: int) -> List[str]:
+    """Escolhe até max_chunks trechos espaçados uniformemente ao longo do documento."""
+    if len(chunks) <= max_chunks:
+        return chunks
+    step = len(chunks) / max_chunks
+    return [chunks[int(i * step)] for i in range(max_chunks)]
+
+def _distribute(total: int, parts: int) -> List[int]:
+    """Distribui total itens entre parts trechos (os primeiros recebem o resto)."""
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+def _dedup_key(value: str) -> str:
+    return re.sub(r"\W+", " ", value.lower()).strip()
+
+def _round_robin_unique(
+    groups: List[List[Dict[str, Any]]], field: str, limit: int, exclude: Iterable[str] = ()
+) -> List[Dict[str, Any]]:
+    """
+    Intercala os resultados de cada trecho (preservando a cobertura do
+    documento inteiro), descartando itens repetidos pelo campo informado e
+    os que já existem (exclude, textos já gerados anteriormente).
+    """
+    merged: List[Dict[str, Any]] = []
+    seen = {_dedup_key(value) for value in exclude}
+    for position in range(max((len(group) for group in groups), default=0)):
+        for group in groups:
+            if position >= len(group) or len(merged) >= limit:
+                continue
+            key = _dedup_key(str(group[position].get(field, "")))
+            if key and key not in seen:
+                seen.add(key)
+                merged.append(group[position])
+    return merged
+
+def _map_chunks(
+    generate, chunks: List[str], counts: List[int],
+    should_stop: Optional[Callable[[], bool]] = None, skipped: Any = None
+) -> List[Any]:
+    """
+    Executa generate(trecho, quantidade) em paralelo, com concorrência limitada.
+    Cada trecho só é enviado ao executor depois de verificar should_stop(),
+    com no máximo AI_GENERATION_CONCURRENCY chamadas em andamento. Ao cancelar,
+    o executor é liberado sem esperar (os trechos na fila são descartados) e
+    os trechos sem resultado retornam `skipped`.
+    """
+    results = [skipped] * len(chunks)
+    max_workers = min(AI_GENERATION_CONCURRENCY, len(chunks))
+    pending = {}
+    next_chunk = 0
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while next_chunk < len(chunks) or pending:
+            if should_stop and should_stop():
+                break
+            while next_chunk < len(chunks) and len(pending) < max_workers:
+                future = executor.submit(generate, chunks[next_chunk], counts[next_chunk])
+                pending[future] = next_chunk
+                next_chunk += 1
+            done, _ = wait(pending, timeout=CANCEL_POLL_INTERVAL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+def generate_flashcards_from_text(
+    text: str, num_flashcards: int = 10, difficulty: str = "Médio", use_cache: bool = True,
+    should_stop: Optional[Callable[[], bool]] = None,
+    existing: Optional[List[Tuple[str, str]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Gera flashcards a partir do texto. Textos maiores que MAX_CHUNK_CHARS são
+    divididos em trechos, gerados em paralelo e depois mesclados/deduplicados
+    até num_flashcards (em vez de truncar o texto). should_stop permite
+    interromper os trechos restantes (cancelamento).
+
+    existing (pares frente/verso já gerados) vai no prompt de cada trecho,
+    e os flashcards que repetirem uma frente existente são descartados.
+    """
+    existing = existing or []
+    existing_fronts = [front for front, _ in existing]
+
+    def generate(chunk: str, count: int) -> List[Dict[str, Any]]:
+        if existing:
+            chunk = _add_flashcards_text(existing, chunk, count)
+        return _generate_flashcards_single(chunk, count, difficulty, use_cache)
+
+    if not text or len(text) <= MAX_CHUNK_CHARS:
+        flashcards = generate(text, num_flashcards)
+        return _round_robin_unique([flashcards], "front", num_flashcards, existing_fronts) if existing else flashcards
+
+    chunks = _select_chunks(
+        split_text_into_chunks(text), min(MAX_CHUNKS_PER_GENERATION, num_flashcards)
+    )
+    # Pede um pouco a mais por trecho para compensar as duplicatas descartadas
+    counts = [count + 1 for count in _distribute(num_flashcards, len(chunks))]
+    print(f"📚 Texto longo ({len(text)} caracteres): gerando flashcards em {len(chunks)} trechos.")
+
+    groups = _map_chunks(generate, chunks, counts, should_stop=should_stop, skipped=[])
+    return _round_robin_unique(groups, "front", num_flashcards, existing_fronts)
+
+def generate_quiz_from_text(
+    text: str, num_questions: int = 5, difficulty: str = "Médio", use_cache: bool = True,
+    should_stop: Optional[Callable[[], bool]] = None,
+    existing: Optional[List[Tuple[str, List[str]]]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Gera um quiz a partir do texto. Textos maiores que MAX_CHUNK_CHARS são
+    divididos em trechos, gerados em paralelo e depois mesclados/deduplicados
+    até num_questions (em vez de truncar o texto). should_stop permite
+    interromper os trechos restantes (cancelamento).
+
+    existing (enunciados e alternativas já gerados) vai no prompt de cada
+    trecho, e as perguntas que repetirem um enunciado existente são descartadas.
+    """
+    existing = existing or []
+    existing_texts = [question_text for question_text, _ in existing]
+
+    def generate(chunk: str, count: int) -> Optional[Dict[str, Any]]:
+        if existing:
+            chunk = _add_questions_text(existing, chunk, count)
+        return _generate_quiz_single(chunk, count, difficulty, use_cache)
+
+    if not text or len(text) <= MAX_CHUNK_CHARS:
+        quiz = generate(text, num_questions)
+        if quiz and existing:
+            quiz = {**quiz, "questions": _round_robin_unique([quiz["questions"]], "text", num_questions, existing_texts)}
+        return quiz
+
+    chunks = _select_chunks(
+        split_text_into_chunks(text), min(MAX_CHUNKS_PER_GENERATION, num_questions)
+    )
+    counts = [count + 1 for count in _distribute(num_questions, len(chunks))]
+    print(f"📚 Texto longo ({len(text)} caracteres): gerando quiz em {len(chunks)} trechos.")
+
+    partial_quizzes = [
+        quiz for quiz in _map_chunks(generate, chunks, counts, should_stop=should_stop)
+        if quiz
+    ]
+    if not partial_quizzes:
+        return None
+
+    questions = _round_robin_unique(
+        [quiz["questions"] for quiz in partial_quizzes], "text", num_questions, existing_texts
+    )
+    return {"title": partial_quizzes[0]["title"], "questions": questions}
+
+def _add_flashcards_text(existing_flashcards: List[Tuple[str, str]], document_text: str, requested_count: int) -> str:
+    """Texto (de um trecho) para gerar flashcards novos sem repetir os existentes (pares frente/verso)."""
+    existing_flashcards_text = [
+        f"Pergunta: {front}\nResposta: {back}"
+        for front, back in existing_flashcards
+    ]
+    existing_content = "\n\n---\n\n".join(existing_flashcards_text)
+
+    return f"""
+IMPORTANTE: Você já gerou os seguintes flashcards para este conteúdo. NÃO REPITA NENHUM DELES:
+
+{existing_content}
+
+---
+
+Agora, com base no MESMO CONTEÚDO ORIGINAL abaixo, gere {requested_count} NOVOS flashcards INÉDITOS que NÃO tenham sido abordados nos flashcards acima:
+
+{document_text}
+"""
+
+def _add_questions_text(existing_questions: List[Tuple[str, List[str]]], document_text: str, requested_count: int) -> str:
+    """Texto (de um trecho) para gerar perguntas novas sem repetir as existentes (enunciado e alternativas)."""
+    existing_questions_text = []
+    for question_text, answers in existing_questions:
+        answers_text = "\n".join([f"  - {answer}" for answer in answers])
+        existing_questions_text.append(
+            f"Pergunta: {question_text}\nAlternativas:\n{answers_text}"
+        )
+
+    existing_content = "\n\n---\n\n".join(existing_questions_text)
+
+    return f"""
+IMPORTANTE: Você já gerou as seguintes perguntas para este conteúdo. NÃO REPITA NENHUMA DELAS:
+
+{existing_content}
+
+---
+
+Agora, com base no MESMO CONTEÚDO ORIGINAL abaixo, gere {requested_count} NOVAS perguntas INÉDITAS que NÃO tenham sido abordadas no quiz acima:
+
+{document_text}
+"""
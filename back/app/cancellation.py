@@ -0,0 +1,91 @@
+# app/cancellation.py
+"""
+Cancelamento cooperativo do processamento de documentos.
+
+O endpoint de cancelamento grava CANCELLED no banco, marca uma flag no
+Redis e revoga a task no Celery (o que descarta execuções ainda na fila e
+retentativas agendadas). A task em execução consulta a flag nos pontos de
+verificação entre as etapas e enquanto espera pela IA; ao ver o
+cancelamento, para de esperar, não dispara novos trechos e sai sem salvar.
+"""
+import os
+import time
+import logging
+import threading
+from typing import Optional
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+CANCEL_FLAG_TTL_SECONDS = 24 * 3600
+# Intervalo mínimo entre consultas à flag por um mesmo token
+CANCEL_POLL_INTERVAL_SECONDS = float(os.getenv("CANCEL_POLL_INTERVAL_SECONDS", "1"))
+
+KEY_PREFIX = "document_cancel"
+
+_client: Optional[redis.Redis] = None
+
+def _get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+class DocumentCancelled(Exception):
+    """O processamento do documento foi cancelado pelo usuário."""
+
+def request_cancel(document_id: int) -> None:
+    try:
+        _get_client().set(f"{KEY_PREFIX}:{document_id}", 1, ex=CANCEL_FLAG_TTL_SECONDS)
+    except redis.RedisError as e:
+        logger.warning(f"Flag de cancelamento indisponível (set): {e}")
+
+def clear_cancel(document_id: int) -> None:
+    """Descarta um pedido de cancelamento antigo antes de uma nova execução."""
+    try:
+        _get_client().delete(f"{KEY_PREFIX}:{document_id}")
+    except redis.RedisError as e:
+        logger.warning(f"Flag de cancelamento indisponível (delete): {e}")
+
+def is_cancel_requested(document_id: int) -> bool:
+    try:
+        return bool(_get_client().exists(f"{KEY_PREFIX}:{document_id}"))
+    except redis.RedisError as e:
+        logger.warning(f"Flag de cancelamento indisponível (get): {e}")
+        return False
+
+class CancellationToken:
+    """
+    Consulta a flag de um documento no máximo a cada poll_interval segundos
+    (seguro para uso em várias threads). Uma vez cancelado, fica cancelado.
+    """
+
+    def __init__(self, document_id: int, poll_interval: float = CANCEL_POLL_INTERVAL_SECONDS):
+        self.document_id = document_id
+        self.poll_interval = poll_interval
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_check >= self.poll_interval:
+                self._last_check = now
+                if is_cancel_requested(self.document_id):
+                    self._cancelled.set()
+        return self._cancelled.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.is_cancelled():
+            raise DocumentCancelled(f"Processamento do documento {self.document_id} cancelado.")
@@ -1,9 +1,15 @@
 # back/app/crud.py
 from sqlmodel import Session, select, func, distinct
-from . import models, schemas, security
+from . import models, schemas, security, spaced_repetition, text_storage, text_index
 from typing import List, Optional
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, time, timezone, timedelta
+from sqlalchemy import Date, Integer, cast, literal, or_, tuple_, update, text as sql_text
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import selectinload
+import hashlib
+import json
+import os
 import random
 
 DAILY_GENERATION_LIMIT = 10
@@ -70,11 +76,13 @@ def get_document(session: Session, document_id: int) -> models.Document | None:
     return session.get(models.Document, document_id)
 
 def create_document_for_user(
-    session: Session, user_id: int, file_path: str, folder_id: Optional[int] = None, generates_flashcards: bool = True, generates_quizzes: bool = False
+    session: Session, user_id: int, file_path: str, folder_id: Optional[int] = None, generates_flashcards: bool = True, generates_quizzes: bool = False,
+    content_hash: Optional[str] = None
 ) -> models.Document:
     db_document = models.Document(
         user_id=user_id, 
         file_path=file_path, 
+        content_hash=content_hash,
         folder_id=folder_id, 
         generates_flashcards=generates_flashcards, 
         generates_quizzes=generates_quizzes,
@@ -86,50 +94,347 @@ def create_document_for_user(
     session.refresh(db_document)
     return db_document
 
+def get_or_create_document_blob(
+    session: Session, content_hash: str, size_bytes: int, storage_path: Optional[str] = None
+) -> models.DocumentBlob:
+    """
+    Registra o conteúdo pelo hash. Se outro usuário já enviou o mesmo
+    conteúdo, reaproveita o blob existente (e o texto já extraído).
+    """
+    table = models.DocumentBlob.__table__
+    session.exec(
+        pg_insert(table)
+        .values(content_hash=content_hash, storage_path=storage_path, size_bytes=size_bytes)
+        .on_conflict_do_nothing(index_elements=[table.c.content_hash])
+    )
+    session.commit()
+    return session.get(models.DocumentBlob, content_hash)
+
+def store_document_text(session: Session, content_hash: str, text: str) -> None:
+    """
+    Grava o texto extraído (comprimido) para o conteúdo, junto com o índice
+    de trechos usado pelo chat. O texto é derivado do conteúdo, então uma
+    gravação concorrente do mesmo hash é ignorada, e o índice só é construído
+    quando o texto foi de fato inserido. Não faz commit.
+    """
+    compression, data = text_storage.compress_text(text)
+    table = models.DocumentText.__table__
+    inserted = session.exec(
+        pg_insert(table)
+        .values(content_hash=content_hash, compression=compression, text_length=len(text), data=data)
+        .on_conflict_do_nothing(index_elements=[table.c.content_hash])
+        .returning(table.c.content_hash)
+    ).first()
+    if inserted is not None:
+        _store_document_text_index(session, content_hash, text_index.build_index(text))
+
+def _store_document_text_index(session: Session, content_hash: str, index: dict) -> None:
+    """Grava (ou substitui, se de outra versão) o índice do texto. Não faz commit."""
+    compression, data = text_storage.compress_text(json.dumps(index, ensure_ascii=False))
+    table = models.DocumentTextIndex.__table__
+    values = dict(
+        version=index["version"], passage_count=len(index["passages"]),
+        compression=compression, data=data
+    )
+    session.exec(
+        pg_insert(table)
+        .values(content_hash=content_hash, **values)
+        .on_conflict_do_update(index_elements=[table.c.content_hash], set_=values)
+    )
+
+def get_document_text_index(session: Session, document: models.Document, text: str) -> Optional[dict]:
+    """
+    Carrega o índice de trechos do documento (text é o texto do documento,
+    de onde os trechos são recortados). Só lê: se o índice ainda não existe
+    (ou é de versão antiga), é construído em memória para esta chamada; a
+    gravação fica com store_document_text e migrate_legacy_document_texts.
+    """
+    if not document.content_hash:
+        return None
+    row = session.get(models.DocumentTextIndex, document.content_hash)
+    if row is not None and row.version == text_index.TEXT_INDEX_VERSION:
+        return json.loads(text_storage.decompress_text(row.compression, row.data))
+    return text_index.build_index(text)
+
+def get_document_text(session: Session, document: models.Document) -> Optional[str]:
+    """
+    Carrega e descomprime o texto do documento. Só os geradores e o chat
+    devem chamar isto; as rotas de metadados não tocam na tabela de texto.
+    """
+    if not document.content_hash:
+        return None
+    row = session.get(models.DocumentText, document.content_hash)
+    if row is None:
+        return None
+    return text_storage.decompress_text(row.compression, row.data)
+
+# Chave do advisory lock que serializa as migrações de esquema entre os
+# processos da API e os workers que sobem ao mesmo tempo
+SCHEMA_MIGRATION_LOCK_KEY = 7_357_001
+
+def _lock_schema_migrations(session: Session) -> None:
+    """Trava as migrações até o fim da transação atual (liberado no commit)."""
+    session.exec(sql_text("SELECT pg_advisory_xact_lock(:key)").bindparams(key=SCHEMA_MIGRATION_LOCK_KEY))
+
+def migrate_document_content_hash(session: Session) -> bool:
+    """
+    Bancos criados antes do DocumentBlob não têm document.content_hash
+    (create_all não altera tabelas existentes), e sem a coluna nenhum
+    Document carrega. Cria as tabelas de blob/texto se faltarem, adiciona a
+    coluna com a chave estrangeira e o índice. Idempotente; retorna se a
+    coluna precisou ser criada.
+    """
+    _lock_schema_migrations(session)
+    connection = session.connection()
+    for model in (models.DocumentBlob, models.DocumentText, models.DocumentTextIndex):
+        model.__table__.create(connection, checkfirst=True)
+
+    added = session.exec(sql_text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = 'document' AND column_name = 'content_hash'"
+    )).first() is None
+    session.exec(sql_text("ALTER TABLE document ADD COLUMN IF NOT EXISTS content_hash VARCHAR"))
+
+    fk_exists = session.exec(sql_text(
+        "SELECT 1 FROM pg_constraint "
+        "WHERE conrelid = 'document'::regclass AND conname = 'document_content_hash_fkey'"
+    )).first()
+    if not fk_exists:
+        session.exec(sql_text(
+            "ALTER TABLE document ADD CONSTRAINT document_content_hash_fkey "
+            "FOREIGN KEY (content_hash) REFERENCES documentblob (content_hash)"
+        ))
+    session.exec(sql_text("CREATE INDEX IF NOT EXISTS ix_document_content_hash ON document (content_hash)"))
+    session.commit()
+    return added
+
+def migrate_legacy_document_texts(session: Session, batch_size: int = 100) -> int:
+    """
+    Move o texto da antiga coluna document.extracted_text (se ainda existir no
+    banco) para DocumentBlob/DocumentText, criando antes a coluna
+    document.content_hash se faltar. Depois reconstrói os índices de trechos
+    que faltam ou são de versão antiga. Retorna quantos documentos migrou.
+    """
+    migrate_document_content_hash(session)
+
+    column_exists = session.exec(sql_text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = 'document' AND column_name = 'extracted_text'"
+    )).first()
+    migrated = 0
+    while column_exists:
+        rows = session.exec(sql_text(
+            "SELECT id, extracted_text FROM document "
+            "WHERE extracted_text IS NOT NULL AND content_hash IS NULL "
+            "ORDER BY id LIMIT :limit"
+        ).bindparams(limit=batch_size)).all()
+        if not rows:
+            break
+        for document_id, legacy_text in rows:
+            text_bytes = legacy_text.encode("utf-8")
+            content_hash = hashlib.sha256(text_bytes).hexdigest()
+            get_or_create_document_blob(session, content_hash=content_hash, size_bytes=len(text_bytes))
+            store_document_text(session, content_hash, legacy_text)
+            session.exec(
+                sql_text("UPDATE document SET content_hash = :hash, extracted_text = NULL WHERE id = :id")
+                .bindparams(hash=content_hash, id=document_id)
+            )
+        session.commit()
+        migrated += len(rows)
+
+    rebuild_document_text_indexes(session, batch_size)
+    return migrated
+
+def rebuild_document_text_indexes(session: Session, batch_size: int = 100) -> int:
+    """
+    Constrói e grava o índice de trechos dos textos que ainda não têm índice
+    ou têm índice de versão antiga. Retorna quantos índices gravou.
+    """
+    rebuilt = 0
+    while True:
+        rows = session.exec(
+            select(models.DocumentText)
+            .outerjoin(models.DocumentTextIndex, models.DocumentTextIndex.content_hash == models.DocumentText.content_hash)
+            .where(or_(
+                models.DocumentTextIndex.content_hash.is_(None),
+                models.DocumentTextIndex.version != text_index.TEXT_INDEX_VERSION,
+            ))
+            .order_by(models.DocumentText.content_hash)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return rebuilt
+        for row in rows:
+            text = text_storage.decompress_text(row.compression, row.data)
+            _store_document_text_index(session, row.content_hash, text_index.build_index(text))
+        session.commit()
+        rebuilt += len(rows)
+
+# Índices adicionados a tabelas que já existiam em produção (create_all só
+# cria índices junto com tabelas novas): (nome, tabela, colunas)
+CONCURRENT_INDEXES = [
+    ("ix_document_user_created_id", "document", "user_id, created_at, id"),
+    ("ix_flashcard_document_id", "flashcard", "document_id"),
+    ("ix_studylog_flashcard_id", "studylog", "flashcard_id"),
+    ("ix_studylog_user_flashcard", "studylog", "user_id, flashcard_id"),
+    ("ix_studylog_user_studied_at", "studylog", "user_id, studied_at"),
+    ("ix_quizattempt_user_completed_at", "quizattempt", "user_id, completed_at"),
+]
+
+def create_missing_indexes(engine: Engine) -> list[str]:
+    """
+    Cria os índices de CONCURRENT_INDEXES que faltam no banco com CREATE
+    INDEX CONCURRENTLY, sem bloquear as escritas nas tabelas. CONCURRENTLY
+    não roda dentro de transação, então usa uma conexão em autocommit. Um
+    índice deixado inválido por uma criação interrompida é recriado.
+    Retorna os nomes dos índices criados.
+    """
+    created = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for name, table, columns in CONCURRENT_INDEXES:
+            is_valid = connection.execute(sql_text(
+                "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name"
+            ).bindparams(name=name)).scalar()
+            if is_valid:
+                continue
+            if is_valid is not None:
+                connection.execute(sql_text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            connection.execute(sql_text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+            created.append(name)
+    return created
+
+def delete_orphan_document_blobs(session: Session, older_than: timedelta = timedelta(days=1)) -> int:
+    """
+    Remove os blobs (com texto, índice e arquivo em disco) que nenhum
+    documento referencia mais. Blobs criados há menos de older_than são
+    mantidos: o upload cria o blob antes do documento. Retorna quantos removeu.
+    """
+    orphan_hashes = (
+        select(models.DocumentBlob.content_hash)
+        .where(
+            models.DocumentBlob.created_at < datetime.now(timezone.utc) - older_than,
+            ~select(models.Document.id)
+            .where(models.Document.content_hash == models.DocumentBlob.content_hash)
+            .exists(),
+        )
+        .with_for_update(skip_locked=True)
+    )
+    content_hashes = session.exec(orphan_hashes).all()
+    if not content_hashes:
+        session.commit()
+        return 0
+
+    for model in (models.DocumentTextIndex, models.DocumentText):
+        table = model.__table__
+        session.exec(table.delete().where(table.c.content_hash.in_(content_hashes)))
+    blob_table = models.DocumentBlob.__table__
+    storage_paths = session.exec(
+        blob_table.delete()
+        .where(blob_table.c.content_hash.in_(content_hashes))
+        .returning(blob_table.c.storage_path)
+    ).scalars().all()
+    session.commit()
+
+    # Os arquivos só saem do disco depois que a exclusão foi gravada
+    for storage_path in storage_paths:
+        if storage_path and os.path.exists(storage_path):
+            os.remove(storage_path)
+    return len(content_hashes)
+
 def create_flashcards_for_document(
     session: Session, flashcards_data: list[dict], document_id: int
 ) -> list[models.Flashcard]:
-    db_flashcards = []
-    for fc_data in flashcards_data:
-        if "front" in fc_data and "back" in fc_data:
-            db_flashcard = models.Flashcard(**fc_data, document_id=document_id)
-            db_flashcards.append(db_flashcard)
-    if db_flashcards:
-        session.add_all(db_flashcards)
-        session.commit()
-        for db_fc in db_flashcards:
-            session.refresh(db_fc)
+    """
+    Insere todos os flashcards num único INSERT ... RETURNING (sem um
+    refresh por flashcard). Itens sem frente/verso são ignorados.
+    """
+    rows = [
+        {
+            "front": fc_data["front"],
+            "back": fc_data["back"],
+            "type": fc_data.get("type") or models.FlashcardType.CONCEPT,
+            "document_id": document_id,
+        }
+        for fc_data in flashcards_data
+        if "front" in fc_data and "back" in fc_data
+    ]
+    if not rows:
+        return []
+
+    table = models.Flashcard.__table__
+    result = session.exec(
+        pg_insert(table).returning(*table.c, sort_by_parameter_order=True), params=rows
+    )
+    db_flashcards = [models.Flashcard(**row._mapping) for row in result.all()]
+    session.commit()
     return db_flashcards
 
 def get_flashcards_by_document(session: Session, document_id: int) -> list[models.Flashcard]:
     return session.exec(select(models.Flashcard).where(models.Flashcard.document_id == document_id)).all()
 
-def get_documents_by_user(
-    session: Session, user_id: int, in_folder: Optional[bool] = None
-) -> list[models.Document]:
+def claim_document_for_generation(session: Session, document_id: int, step: str) -> bool:
     """
-    Busca documentos de um usuário.
-    - Se in_folder for True, busca apenas docs que estão em alguma pasta.
-    - Se in_folder for False, busca apenas docs que estão na raiz (sem pasta).
-    - Se in_folder for None, busca todos os docs do usuário.
+    Marca o documento como PROCESSING para um job de geração com um único
+    UPDATE condicional: só um pedido concorrente consegue o documento.
+    Retorna False se ele já estava em processamento.
     """
-    # ✅ ADICIONADO: selectinload para carregar as relações
-    stmt = (
-        select(models.Document)
-        .where(models.Document.user_id == user_id)
-        .options(
-            selectinload(models.Document.flashcards),
-            selectinload(models.Document.quiz).selectinload(models.Quiz.questions)
+    claimed = session.exec(
+        update(models.Document)
+        .where(models.Document.id == document_id)
+        .where(models.Document.status != models.DocumentStatus.PROCESSING)
+        .values(
+            status=models.DocumentStatus.PROCESSING,
+            current_step=step,
+            processing_progress=0,
+            can_cancel=False,
+        )
+        .returning(models.Document.id)
+    ).first()
+    session.commit()
+    return claimed is not None
+
+def release_document_from_generation(
+    session: Session, document_id: int, status: models.DocumentStatus, step: str
+) -> bool:
+    """
+    Devolve ao status anterior um documento preso num job de geração (falha
+    ao enfileirar ou cancelamento). Retorna False se ele não estava em processamento.
+    """
+    released = session.exec(
+        update(models.Document)
+        .where(models.Document.id == document_id)
+        .where(models.Document.status == models.DocumentStatus.PROCESSING)
+        .values(status=status, current_step=step, processing_progress=100, can_cancel=True)
+        .returning(models.Document.id)
+    ).first()
+    session.commit()
+    return released is not None
+
+def get_document_status(session: Session, document_id: int, user_id: int) -> Optional[schemas.DocumentStatusRead]:
+    """
+    Lê apenas as colunas de progresso do documento (sem carregar a entidade),
+    então cada chamada vê o valor mais recente gravado pelo worker.
+    """
+    row = session.exec(
+        select(
+            models.Document.id,
+            models.Document.status,
+            models.Document.current_step,
+            models.Document.processing_progress,
+            models.Document.can_cancel,
         )
+        .where(models.Document.id == document_id, models.Document.user_id == user_id)
+    ).first()
+    if row is None:
+        return None
+    return schemas.DocumentStatusRead(
+        id=row.id,
+        status=row.status,
+        current_step=row.current_step,
+        processing_progress=row.processing_progress,
+        can_cancel=row.can_cancel,
     )
-    
-    if in_folder is True:
-        stmt = stmt.where(models.Document.folder_id != None)
-    elif in_folder is False:
-        stmt = stmt.where(models.Document.folder_id == None)
-    
-    stmt = stmt.order_by(models.Document.created_at.desc())
-    return session.exec(stmt).all()
 
 def get_document_with_details(session: Session, document_id: int) -> Optional[models.Document]:
     """
@@ -165,17 +470,672 @@ def get_flashcard(session: Session, flashcard_id: int, user_id: int) -> models.F
     )
     return session.exec(statement).first()
 
-def create_study_log(session: Session, user_id: int, flashcard_id: int, accuracy: float) -> models.StudyLog:
+# --- CONVERSAS DO CHAT SOBRE FLASHCARDS ---
+
+def create_flashcard_conversation(
+    session: Session, flashcard_id: int, user_message: str, assistant_response: str
+) -> models.FlashcardConversation:
+    conversation = models.FlashcardConversation(
+        flashcard_id=flashcard_id,
+        user_message=user_message,
+        assistant_response=assistant_response,
+    )
+    session.add(conversation)
+    session.commit()
+    session.refresh(conversation)
+    return conversation
+
+def get_flashcard_conversations(
+    session: Session,
+    flashcard_id: int,
+    limit: Optional[int] = None,
+    before_created_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+) -> list[models.FlashcardConversation]:
+    """
+    Histórico do chat de um flashcard em ordem cronológica.
+    - limit: só as `limit` mensagens mais recentes (ex.: contexto do prompt).
+    - before_created_at/before_id: paginação por keyset; retorna as mensagens
+      imediatamente anteriores ao cursor (created_at, id).
+    Usa o índice (flashcard_id, created_at, id): lê só as linhas da página.
+    """
+    stmt = select(models.FlashcardConversation).where(
+        models.FlashcardConversation.flashcard_id == flashcard_id
+    )
+    if before_created_at is not None and before_id is not None:
+        stmt = stmt.where(
+            tuple_(models.FlashcardConversation.created_at, models.FlashcardConversation.id)
+            < tuple_(before_created_at, before_id)
+        )
+
+    # Busca das mais recentes para as mais antigas e devolve em ordem cronológica
+    stmt = stmt.order_by(
+        models.FlashcardConversation.created_at.desc(), models.FlashcardConversation.id.desc()
+    )
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return list(reversed(session.exec(stmt).all()))
+
+def migrate_flashcard_conversation_timestamps(session: Session) -> bool:
+    """
+    Converte a antiga coluna flashcardconversation.created_at (texto) para
+    timestamptz e cria o índice do histórico (create_all não altera tabelas
+    existentes). Linhas sem data recebem o horário da migração. Retorna se
+    a coluna precisou ser convertida.
+    """
+    data_type = session.exec(sql_text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = 'flashcardconversation' AND column_name = 'created_at'"
+    )).first()
+    converted = data_type is not None and data_type[0] != "timestamp with time zone"
+    if converted:
+        session.exec(sql_text(
+            "ALTER TABLE flashcardconversation "
+            "ALTER COLUMN created_at TYPE TIMESTAMP WITH TIME ZONE "
+            "USING COALESCE(NULLIF(created_at, '')::timestamptz, now()), "
+            "ALTER COLUMN created_at SET DEFAULT now(), "
+            "ALTER COLUMN created_at SET NOT NULL"
+        ))
+    session.exec(sql_text(
+        "CREATE INDEX IF NOT EXISTS ix_flashcardconversation_flashcard_created_id "
+        "ON flashcardconversation (flashcard_id, created_at, id)"
+    ))
+    session.commit()
+    return converted
+
+def _bump_deck_progress(
+    session: Session,
+    user_id: int,
+    document_id: int,
+    studied_flashcards: int = 0,
+    quiz_score: Optional[float] = None,
+    quiz_completed_at: Optional[datetime] = None,
+) -> None:
+    """
+    Incrementa atomicamente (INSERT ... ON CONFLICT DO UPDATE) o resumo de
+    progresso de um deck. Não faz commit: roda na transação de quem chamou.
+    """
+    table = models.DeckProgress.__table__
+    values = {
+        "user_id": user_id,
+        "document_id": document_id,
+        "studied_flashcards": studied_flashcards,
+        "quiz_attempts": 0,
+        "quiz_score_sum": 0.0,
+    }
+    if quiz_score is not None:
+        values.update(
+            quiz_attempts=1,
+            quiz_score_sum=quiz_score,
+            last_quiz_score=quiz_score,
+            last_quiz_at=quiz_completed_at,
+        )
+
+    stmt = pg_insert(table).values(**values)
+    updates = {
+        "studied_flashcards": table.c.studied_flashcards + stmt.excluded.studied_flashcards,
+        "quiz_attempts": table.c.quiz_attempts + stmt.excluded.quiz_attempts,
+        "quiz_score_sum": table.c.quiz_score_sum + stmt.excluded.quiz_score_sum,
+    }
+    if quiz_score is not None:
+        updates["last_quiz_score"] = stmt.excluded.last_quiz_score
+        updates["last_quiz_at"] = stmt.excluded.last_quiz_at
+
+    session.exec(stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.document_id], set_=updates
+    ))
+
+def _bump_daily_activity(
+    session: Session,
+    user_id: int,
+    activity_date: date,
+    cards_studied: int = 0,
+    accuracy_sum: float = 0.0,
+    quizzes_completed: int = 0,
+    quiz_score_sum: float = 0.0,
+) -> None:
+    """
+    Incrementa atomicamente o resumo de atividade diária (dia em UTC).
+    Aceita valores negativos para descontar registos excluídos.
+    Não faz commit: roda na transação de quem chamou.
+    """
+    table = models.UserDailyActivity.__table__
+    stmt = pg_insert(table).values(
+        user_id=user_id,
+        activity_date=activity_date,
+        cards_studied=cards_studied,
+        accuracy_sum=accuracy_sum,
+        quizzes_completed=quizzes_completed,
+        quiz_score_sum=quiz_score_sum,
+    )
+    session.exec(stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.activity_date],
+        set_={
+            "cards_studied": table.c.cards_studied + stmt.excluded.cards_studied,
+            "accuracy_sum": table.c.accuracy_sum + stmt.excluded.accuracy_sum,
+            "quizzes_completed": table.c.quizzes_completed + stmt.excluded.quizzes_completed,
+            "quiz_score_sum": table.c.quiz_score_sum + stmt.excluded.quiz_score_sum,
+        },
+    ))
+
+def _apply_study_reviews(
+    session: Session, user_id: int, reviews: list[tuple[int, float, datetime]], log_ids: list[int]
+) -> set[int]:
+    """
+    Atualiza o estado SM-2 de cada flashcard revisado (flashcard_id, accuracy,
+    studied_at), aplicando as revisões em ordem cronológica. log_ids são os
+    registos de estudo que originaram as revisões.
+
+    Os estados que ainda não existem são criados com um único INSERT ... ON
+    CONFLICT DO NOTHING RETURNING: só a transação que de fato criou o estado
+    recebe o flashcard de volta, então o "primeiro estudo" é decidido de forma
+    atômica mesmo com revisões concorrentes. Retorna os flashcards estudados
+    pela primeira vez (estado criado agora e sem registos de estudo anteriores
+    ao estado, o caso dos dados de antes da revisão espaçada). Não faz commit.
+    """
+    if not reviews:
+        return set()
+
+    reviews = sorted(reviews, key=lambda review: review[2])
+    first_review_at: dict[int, datetime] = {}
+    for flashcard_id, _, studied_at in reviews:
+        first_review_at.setdefault(flashcard_id, studied_at)
+
+    table = models.FlashcardReviewState.__table__
+    created = set(session.exec(
+        pg_insert(table)
+        .values([
+            {"user_id": user_id, "flashcard_id": flashcard_id, "due_at": studied_at, "last_reviewed_at": studied_at}
+            for flashcard_id, studied_at in first_review_at.items()
+        ])
+        .on_conflict_do_nothing(index_elements=[table.c.user_id, table.c.flashcard_id])
+        .returning(table.c.flashcard_id)
+    ).scalars().all())
+
+    states = {
+        state.flashcard_id: state
+        for state in session.exec(
+            select(models.FlashcardReviewState)
+            .where(
+                models.FlashcardReviewState.user_id == user_id,
+                models.FlashcardReviewState.flashcard_id.in_(first_review_at.keys()),
+            )
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        ).all()
+    }
+
+    for flashcard_id, accuracy, studied_at in reviews:
+        # Estados recém-criados têm os valores iniciais do SM-2
+        db_state = states[flashcard_id]
+        current = spaced_repetition.ReviewState(
+            ease_factor=db_state.ease_factor,
+            interval_days=db_state.interval_days,
+            repetitions=db_state.repetitions,
+            due_at=db_state.due_at,
+        )
+        scheduled = spaced_repetition.schedule_review(current, accuracy=accuracy, reviewed_at=studied_at)
+        db_state.ease_factor = scheduled.ease_factor
+        db_state.interval_days = scheduled.interval_days
+        db_state.repetitions = scheduled.repetitions
+        db_state.due_at = scheduled.due_at
+        db_state.last_reviewed_at = studied_at
+        session.add(db_state)
+
+    if not created:
+        return set()
+    previously_studied = set(session.exec(
+        select(models.StudyLog.flashcard_id)
+        .where(
+            models.StudyLog.user_id == user_id,
+            models.StudyLog.flashcard_id.in_(created),
+            models.StudyLog.id.notin_(log_ids),
+        )
+        .distinct()
+    ).all())
+    return created - previously_studied
+
+def get_due_flashcards(session: Session, user_id: int, limit: int = 20) -> list[models.Flashcard]:
+    """
+    Retorna os flashcards com revisão vencida (due_at <= agora), os mais
+    atrasados primeiro, usando o índice (user_id, due_at). Se sobrar espaço,
+    completa com flashcards nunca estudados (sem estado de revisão), na
+    ordem dos decks do usuário.
+    """
+    due = session.exec(
+        select(models.Flashcard)
+        .join(
+            models.FlashcardReviewState,
+            models.FlashcardReviewState.flashcard_id == models.Flashcard.id,
+        )
+        .where(
+            models.FlashcardReviewState.user_id == user_id,
+            models.FlashcardReviewState.due_at <= datetime.now(timezone.utc),
+        )
+        .order_by(models.FlashcardReviewState.due_at)
+        .limit(limit)
+    ).all()
+    if len(due) >= limit:
+        return due
+
+    unseen = session.exec(
+        select(models.Flashcard)
+        .join(models.Document)
+        .outerjoin(
+            models.FlashcardReviewState,
+            (models.FlashcardReviewState.flashcard_id == models.Flashcard.id)
+            & (models.FlashcardReviewState.user_id == user_id),
+        )
+        .where(
+            models.Document.user_id == user_id,
+            models.FlashcardReviewState.flashcard_id.is_(None),
+        )
+        .order_by(models.Flashcard.document_id, models.Flashcard.id)
+        .limit(limit - len(due))
+    ).all()
+    return [*due, *unseen]
+
+def create_study_log(
+    session: Session, user_id: int, flashcard_id: int, accuracy: float, document_id: Optional[int] = None
+) -> models.StudyLog:
+    """
+    Regista um evento de estudo e atualiza, na mesma transação, os resumos
+    DeckProgress e UserDailyActivity.
+    """
+    if document_id is None:
+        document_id = session.exec(
+            select(models.Flashcard.document_id).where(models.Flashcard.id == flashcard_id)
+        ).one()
+
     db_study_log = models.StudyLog(
         user_id=user_id,
         flashcard_id=flashcard_id,
         accuracy=accuracy
     )
     session.add(db_study_log)
+    session.flush()
+
+    first_studied = _apply_study_reviews(
+        session, user_id=user_id,
+        reviews=[(flashcard_id, accuracy, db_study_log.studied_at)], log_ids=[db_study_log.id]
+    )
+    _bump_deck_progress(
+        session, user_id=user_id, document_id=document_id,
+        studied_flashcards=len(first_studied)
+    )
+    _bump_daily_activity(
+        session, user_id=user_id,
+        activity_date=db_study_log.studied_at.astimezone(timezone.utc).date(),
+        cards_studied=1, accuracy_sum=accuracy
+    )
+
     session.commit()
     session.refresh(db_study_log)
     return db_study_log
 
+def get_owned_flashcard_documents(session: Session, flashcard_ids: list[int], user_id: int) -> dict[int, int]:
+    """
+    Valida, com uma única query IN, quais flashcards pertencem ao usuário.
+    Retorna {flashcard_id: document_id} apenas para os flashcards válidos.
+    """
+    if not flashcard_ids:
+        return {}
+    statement = (
+        select(models.Flashcard.id, models.Flashcard.document_id)
+        .join(models.Document)
+        .where(models.Flashcard.id.in_(flashcard_ids))
+        .where(models.Document.user_id == user_id)
+    )
+    return {flashcard_id: document_id for flashcard_id, document_id in session.exec(statement).all()}
+
+def create_study_logs_batch(
+    session: Session, user_id: int, events: list[dict], flashcard_documents: dict[int, int]
+) -> int:
+    """
+    Insere vários registos de estudo com um único INSERT multi-linha.
+    Eventos cujo client_event_id já foi recebido são ignorados (ON CONFLICT
+    DO NOTHING), o que torna o replay da fila offline idempotente.
+    Atualiza os resumos DeckProgress/UserDailyActivity apenas com as linhas
+    realmente inseridas. Retorna a quantidade de registos inseridos.
+    """
+    if not events:
+        return 0
+
+    table = models.StudyLog.__table__
+    rows = [
+        {
+            "user_id": user_id,
+            "flashcard_id": event["flashcard_id"],
+            "accuracy": event["accuracy"],
+            "studied_at": event["studied_at"],
+            "client_event_id": event.get("client_event_id"),
+        }
+        for event in events
+    ]
+    stmt = (
+        pg_insert(table)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[table.c.user_id, table.c.client_event_id])
+        .returning(table.c.id, table.c.flashcard_id, table.c.accuracy, table.c.studied_at)
+    )
+    inserted = session.exec(stmt).all()
+    if not inserted:
+        session.commit()
+        return 0
+
+    first_studied = _apply_study_reviews(
+        session, user_id=user_id,
+        reviews=[(row.flashcard_id, row.accuracy, row.studied_at) for row in inserted],
+        log_ids=[row.id for row in inserted]
+    )
+
+    inserted_flashcard_ids = {row.flashcard_id for row in inserted}
+    new_studied_by_document: dict[int, int] = {}
+    for flashcard_id in first_studied:
+        document_id = flashcard_documents[flashcard_id]
+        new_studied_by_document[document_id] = new_studied_by_document.get(document_id, 0) + 1
+    for document_id in {flashcard_documents[fc_id] for fc_id in inserted_flashcard_ids}:
+        _bump_deck_progress(
+            session, user_id=user_id, document_id=document_id,
+            studied_flashcards=new_studied_by_document.get(document_id, 0)
+        )
+
+    activity_by_day: dict[date, list] = {}
+    for row in inserted:
+        day_totals = activity_by_day.setdefault(row.studied_at.astimezone(timezone.utc).date(), [0, 0.0])
+        day_totals[0] += 1
+        day_totals[1] += row.accuracy
+    for activity_date, (cards_studied, accuracy_sum) in activity_by_day.items():
+        _bump_daily_activity(
+            session, user_id=user_id, activity_date=activity_date,
+            cards_studied=cards_studied, accuracy_sum=accuracy_sum
+        )
+
+    session.commit()
+    return len(inserted)
+
+def migrate_study_log_client_event_ids(session: Session) -> bool:
+    """
+    Adiciona studylog.client_event_id e o índice único usado pelo
+    ON CONFLICT da sincronização offline em bancos criados antes dele
+    (create_all não altera tabelas existentes). Idempotente; retorna se a
+    coluna precisou ser criada.
+    """
+    _lock_schema_migrations(session)
+    added = session.exec(sql_text(
+        "SELECT 1 FROM information_schema.columns "
+        "WHERE table_name = 'studylog' AND column_name = 'client_event_id'"
+    )).first() is None
+    session.exec(sql_text("ALTER TABLE studylog ADD COLUMN IF NOT EXISTS client_event_id VARCHAR(64)"))
+    session.exec(sql_text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_studylog_user_client_event "
+        "ON studylog (user_id, client_event_id)"
+    ))
+    session.commit()
+    return added
+
+def create_quiz_attempt(
+    session: Session, quiz: models.Quiz, user_id: int, score: float, correct_answers: int, total_questions: int
+) -> models.QuizAttempt:
+    """
+    Regista uma tentativa de quiz e atualiza, na mesma transação, os resumos
+    DeckProgress e UserDailyActivity.
+    """
+    quiz_attempt = models.QuizAttempt(
+        score=score,
+        correct_answers=correct_answers,
+        total_questions=total_questions,
+        quiz_id=quiz.id,
+        user_id=user_id
+    )
+    session.add(quiz_attempt)
+
+    _bump_deck_progress(
+        session, user_id=user_id, document_id=quiz.document_id,
+        quiz_score=score, quiz_completed_at=quiz_attempt.completed_at
+    )
+    _bump_daily_activity(
+        session, user_id=user_id,
+        activity_date=quiz_attempt.completed_at.astimezone(timezone.utc).date(),
+        quizzes_completed=1, quiz_score_sum=score
+    )
+
+    session.commit()
+    session.refresh(quiz_attempt)
+    return quiz_attempt
+
+def get_deck_progress(session: Session, user_id: int, document_id: int) -> Optional[models.DeckProgress]:
+    return session.get(models.DeckProgress, (user_id, document_id))
+
+def get_user_activity_totals(session: Session, user_id: int) -> dict:
+    """
+    Soma os resumos diários do usuário (custo proporcional ao número de dias
+    com atividade, não ao número de registos de estudo).
+    """
+    row = session.exec(
+        select(
+            func.coalesce(func.sum(models.UserDailyActivity.cards_studied), 0),
+            func.coalesce(func.sum(models.UserDailyActivity.accuracy_sum), 0.0),
+            func.coalesce(func.sum(models.UserDailyActivity.quizzes_completed), 0),
+            func.coalesce(func.sum(models.UserDailyActivity.quiz_score_sum), 0.0),
+        ).where(models.UserDailyActivity.user_id == user_id)
+    ).one()
+    cards_studied, accuracy_sum, quizzes_completed, quiz_score_sum = row
+    return {
+        "cards_studied": int(cards_studied),
+        "accuracy_sum": float(accuracy_sum),
+        "quizzes_completed": int(quizzes_completed),
+        "quiz_score_sum": float(quiz_score_sum),
+    }
+
+def _local_date(column, user_timezone_delta: timedelta):
+    """Converte um timestamptz para a data local do usuário (UTC + deslocamento)."""
+    return cast(func.timezone("UTC", column) + user_timezone_delta, Date)
+
+def _utc_start_after_local_date(after_date: date, user_timezone_delta: timedelta) -> datetime:
+    """
+    Primeiro instante (em UTC) cuja data local é posterior a after_date.
+    Permite filtrar "data local > after_date" com uma comparação indexável.
+    """
+    local_midnight = datetime.combine(after_date + timedelta(days=1), time.min, tzinfo=timezone.utc)
+    return local_midnight - user_timezone_delta
+
+def get_study_counts_by_local_date(
+    session: Session, user_id: int, user_timezone_delta: timedelta, after_date: date
+) -> dict[date, int]:
+    """
+    Conta os registos de estudo por dia local do usuário (GROUP BY no banco),
+    apenas para os dias posteriores a after_date.
+    """
+    local_day = _local_date(models.StudyLog.studied_at, user_timezone_delta)
+    statement = (
+        select(local_day, func.count(models.StudyLog.id))
+        .where(
+            models.StudyLog.user_id == user_id,
+            models.StudyLog.studied_at >= _utc_start_after_local_date(after_date, user_timezone_delta),
+        )
+        .group_by(local_day)
+    )
+    return {day: count for day, count in session.exec(statement).all()}
+
+def get_latest_study_streak(
+    session: Session, user_id: int, user_timezone_delta: timedelta
+) -> tuple[Optional[date], int]:
+    """
+    Retorna (dia de estudo mais recente, tamanho da sequência de dias
+    consecutivos que termina nele), em datas locais do usuário.
+    Usa gaps-and-islands: em ordem decrescente, dia + row_number() é constante
+    dentro de cada sequência de dias consecutivos.
+    """
+    study_days = (
+        select(_local_date(models.StudyLog.studied_at, user_timezone_delta).label("day"))
+        .where(models.StudyLog.user_id == user_id)
+        .distinct()
+        .subquery()
+    )
+    islands = (
+        select(
+            study_days.c.day,
+            (study_days.c.day + cast(func.row_number().over(order_by=study_days.c.day.desc()), Integer)).label("island"),
+        )
+        .subquery()
+    )
+    statement = (
+        select(func.max(islands.c.day), func.count())
+        .group_by(islands.c.island)
+        .order_by(func.max(islands.c.day).desc())
+        .limit(1)
+    )
+    row = session.exec(statement).first()
+    if not row:
+        return None, 0
+    return row[0], row[1]
+
+def count_quiz_attempts_after_local_date(
+    session: Session, user_id: int, user_timezone_delta: timedelta, after_date: date
+) -> int:
+    """Conta as tentativas de quiz concluídas após after_date (data local do usuário)."""
+    statement = (
+        select(func.count(models.QuizAttempt.id))
+        .where(
+            models.QuizAttempt.user_id == user_id,
+            models.QuizAttempt.completed_at >= _utc_start_after_local_date(after_date, user_timezone_delta),
+        )
+    )
+    return session.exec(statement).one()
+
+def rebuild_progress_summaries(session: Session, user_id: Optional[int] = None) -> None:
+    """
+    Reconstrói DeckProgress e UserDailyActivity a partir das tabelas brutas
+    StudyLog e QuizAttempt (para todos os usuários ou apenas um).
+    """
+    deck_table = models.DeckProgress.__table__
+    daily_table = models.UserDailyActivity.__table__
+
+    delete_deck = deck_table.delete()
+    delete_daily = daily_table.delete()
+    if user_id is not None:
+        delete_deck = delete_deck.where(deck_table.c.user_id == user_id)
+        delete_daily = delete_daily.where(daily_table.c.user_id == user_id)
+    session.exec(delete_deck)
+    session.exec(delete_daily)
+
+    # --- DeckProgress: flashcards estudados ---
+    studied = (
+        select(
+            models.StudyLog.user_id,
+            models.Flashcard.document_id,
+            func.count(distinct(models.StudyLog.flashcard_id)),
+        )
+        .join(models.Flashcard, models.Flashcard.id == models.StudyLog.flashcard_id)
+        .group_by(models.StudyLog.user_id, models.Flashcard.document_id)
+    )
+    if user_id is not None:
+        studied = studied.where(models.StudyLog.user_id == user_id)
+    session.exec(
+        pg_insert(deck_table).from_select(
+            ["user_id", "document_id", "studied_flashcards"], studied
+        )
+    )
+
+    # --- DeckProgress: tentativas de quiz ---
+    quiz_totals = (
+        select(
+            models.QuizAttempt.user_id,
+            models.Quiz.document_id,
+            literal(0),
+            func.count(models.QuizAttempt.id),
+            func.sum(models.QuizAttempt.score),
+            func.array_agg(
+                aggregate_order_by(models.QuizAttempt.score, models.QuizAttempt.completed_at.desc())
+            )[1],
+            func.max(models.QuizAttempt.completed_at),
+        )
+        .join(models.Quiz, models.Quiz.id == models.QuizAttempt.quiz_id)
+        .group_by(models.QuizAttempt.user_id, models.Quiz.document_id)
+    )
+    if user_id is not None:
+        quiz_totals = quiz_totals.where(models.QuizAttempt.user_id == user_id)
+    insert_quiz = pg_insert(deck_table).from_select(
+        ["user_id", "document_id", "studied_flashcards", "quiz_attempts",
+         "quiz_score_sum", "last_quiz_score", "last_quiz_at"],
+        quiz_totals,
+    )
+    session.exec(insert_quiz.on_conflict_do_update(
+        index_elements=[deck_table.c.user_id, deck_table.c.document_id],
+        set_={
+            "quiz_attempts": insert_quiz.excluded.quiz_attempts,
+            "quiz_score_sum": insert_quiz.excluded.quiz_score_sum,
+            "last_quiz_score": insert_quiz.excluded.last_quiz_score,
+            "last_quiz_at": insert_quiz.excluded.last_quiz_at,
+        },
+    ))
+
+    # --- UserDailyActivity: estudo de flashcards ---
+    study_day = func.date(func.timezone("UTC", models.StudyLog.studied_at))
+    daily_study = (
+        select(
+            models.StudyLog.user_id,
+            study_day,
+            func.count(models.StudyLog.id),
+            func.sum(models.StudyLog.accuracy),
+        )
+        .group_by(models.StudyLog.user_id, study_day)
+    )
+    if user_id is not None:
+        daily_study = daily_study.where(models.StudyLog.user_id == user_id)
+    session.exec(
+        pg_insert(daily_table).from_select(
+            ["user_id", "activity_date", "cards_studied", "accuracy_sum"], daily_study
+        )
+    )
+
+    # --- UserDailyActivity: quizzes ---
+    quiz_day = func.date(func.timezone("UTC", models.QuizAttempt.completed_at))
+    daily_quiz = (
+        select(
+            models.QuizAttempt.user_id,
+            quiz_day,
+            func.count(models.QuizAttempt.id),
+            func.sum(models.QuizAttempt.score),
+        )
+        .group_by(models.QuizAttempt.user_id, quiz_day)
+    )
+    if user_id is not None:
+        daily_quiz = daily_quiz.where(models.QuizAttempt.user_id == user_id)
+    insert_daily_quiz = pg_insert(daily_table).from_select(
+        ["user_id", "activity_date", "quizzes_completed", "quiz_score_sum"], daily_quiz
+    )
+    session.exec(insert_daily_quiz.on_conflict_do_update(
+        index_elements=[daily_table.c.user_id, daily_table.c.activity_date],
+        set_={
+            "quizzes_completed": insert_daily_quiz.excluded.quizzes_completed,
+            "quiz_score_sum": insert_daily_quiz.excluded.quiz_score_sum,
+        },
+    ))
+
+    session.commit()
+
+def backfill_progress_summaries(session: Session) -> bool:
+    """
+    Reconstrói os resumos (DeckProgress/UserDailyActivity) a partir do
+    histórico quando eles ainda estão vazios mas já existem estudos ou
+    quizzes registados, o caso do primeiro deploy com os resumos. Roda sob
+    o lock das migrações, então só um processo reconstrói. Retorna se
+    reconstruiu.
+    """
+    _lock_schema_migrations(session)
+    has_summaries = session.exec(select(models.UserDailyActivity.user_id).limit(1)).first() is not None
+    has_history = (
+        session.exec(select(models.StudyLog.id).limit(1)).first() is not None
+        or session.exec(select(models.QuizAttempt.id).limit(1)).first() is not None
+    )
+    if has_summaries or not has_history:
+        session.commit()
+        return False
+    rebuild_progress_summaries(session)
+    return True
+
 def get_study_logs_for_user(session: Session, user_id: int) -> list[models.StudyLog]:
     """Busca todos os registos de estudo para um utilizador específico."""
     statement = select(models.StudyLog).where(models.StudyLog.user_id == user_id)
@@ -183,15 +1143,102 @@ def get_study_logs_for_user(session: Session, user_id: int) -> list[models.Study
 
 def get_studied_flashcards_count(session: Session, document_id: int) -> int:
     """
-    Conta o número de flashcards únicos estudados para um determinado documento.
+    Conta o número de flashcards únicos estudados para um determinado documento
+    (lido do resumo DeckProgress).
     """
     statement = (
-        select(func.count(distinct(models.StudyLog.flashcard_id)))
-        .join(models.Flashcard)
-        .where(models.Flashcard.document_id == document_id)
+        select(func.coalesce(func.sum(models.DeckProgress.studied_flashcards), 0))
+        .where(models.DeckProgress.document_id == document_id)
     )
-    count = session.exec(statement).one_or_none()
-    return count or 0
+    return session.exec(statement).one()
+
+def get_document_cards_for_user(
+    session: Session,
+    user_id: int,
+    in_folder: Optional[bool] = None,
+    folder_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    before_created_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+) -> list[schemas.DocumentCardData]:
+    """
+    Monta os cards da biblioteca (total de flashcards, flashcards estudados e
+    se possui quiz) para todos os decks do usuário em UMA única query agregada,
+    sem carregar flashcards/quiz de cada documento.
+    - in_folder=True: só decks em pastas; False: só decks na raiz; None: todos.
+    - folder_id restringe o resultado aos decks de uma pasta específica.
+    - limit/before_created_at/before_id fazem paginação por keyset: retorna os
+      decks imediatamente "mais antigos" que o cursor (created_at, id).
+    """
+    flashcard_totals = (
+        select(
+            models.Flashcard.document_id.label("document_id"),
+            func.count(models.Flashcard.id).label("total_flashcards"),
+        )
+        .join(models.Document, models.Document.id == models.Flashcard.document_id)
+        .where(models.Document.user_id == user_id)
+        .group_by(models.Flashcard.document_id)
+        .subquery()
+    )
+    has_quiz = (
+        select(models.Quiz.id)
+        .where(models.Quiz.document_id == models.Document.id)
+        .exists()
+    )
+
+    stmt = (
+        select(
+            models.Document.id,
+            models.Document.file_path,
+            models.Document.status,
+            models.Document.created_at,
+            models.Document.folder_id,
+            func.coalesce(flashcard_totals.c.total_flashcards, 0),
+            func.coalesce(models.DeckProgress.studied_flashcards, 0),
+            has_quiz,
+        )
+        .outerjoin(flashcard_totals, flashcard_totals.c.document_id == models.Document.id)
+        .outerjoin(
+            models.DeckProgress,
+            (models.DeckProgress.document_id == models.Document.id)
+            & (models.DeckProgress.user_id == user_id),
+        )
+        .where(models.Document.user_id == user_id)
+    )
+
+    if folder_id is not None:
+        stmt = stmt.where(models.Document.folder_id == folder_id)
+    elif in_folder is True:
+        stmt = stmt.where(models.Document.folder_id != None)
+    elif in_folder is False:
+        stmt = stmt.where(models.Document.folder_id == None)
+
+    if before_created_at is not None and before_id is not None:
+        stmt = stmt.where(
+            tuple_(models.Document.created_at, models.Document.id)
+            < tuple_(before_created_at, before_id)
+        )
+
+    stmt = stmt.order_by(models.Document.created_at.desc(), models.Document.id.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    return [
+        schemas.DocumentCardData(
+            id=doc_id,
+            file_path=file_path,
+            status=doc_status,
+            created_at=created_at,
+            folder_id=doc_folder_id,
+            total_flashcards=total_flashcards,
+            studied_flashcards=studied_flashcards,
+            has_quiz=bool(doc_has_quiz),
+        )
+        for (
+            doc_id, file_path, doc_status, created_at, doc_folder_id,
+            total_flashcards, studied_flashcards, doc_has_quiz,
+        ) in session.exec(stmt).all()
+    ]
 
 def update_flashcard(db: Session, flashcard_id: int, front: str | None = None, back: str | None = None) -> models.Flashcard | None:
     """
@@ -216,7 +1263,8 @@ def update_flashcard(db: Session, flashcard_id: int, front: str | None = None, b
 
 def delete_document_and_related_data(db: Session, document_id: int) -> bool:
     """
-    Exclui um documento e todos os dados associados (flashcards, logs de estudo).
+    Exclui um documento e todos os dados associados (flashcards, logs de estudo,
+    conversas, tentativas de quiz), descontando-os dos resumos diários.
     """
     db_document = db.get(models.Document, document_id)
     if not db_document:
@@ -224,12 +1272,69 @@ def delete_document_and_related_data(db: Session, document_id: int) -> bool:
     
     flashcard_ids = [flashcard.id for flashcard in db_document.flashcards]
     if flashcard_ids:
+        # Desconta dos resumos diários os registos de estudo que serão excluídos
+        study_day = func.date(func.timezone("UTC", models.StudyLog.studied_at))
+        removed_activity = db.exec(
+            select(
+                models.StudyLog.user_id,
+                study_day,
+                func.count(models.StudyLog.id),
+                func.sum(models.StudyLog.accuracy),
+            )
+            .where(models.StudyLog.flashcard_id.in_(flashcard_ids))
+            .group_by(models.StudyLog.user_id, study_day)
+        ).all()
+        for log_user_id, activity_date, cards_studied, accuracy_sum in removed_activity:
+            _bump_daily_activity(
+                db, user_id=log_user_id, activity_date=activity_date,
+                cards_studied=-cards_studied, accuracy_sum=-accuracy_sum
+            )
+
+        db.exec(
+            models.FlashcardReviewState.__table__.delete()
+            .where(models.FlashcardReviewState.__table__.c.flashcard_id.in_(flashcard_ids))
+        )
+
         study_logs_to_delete = db.exec(
             select(models.StudyLog).where(models.StudyLog.flashcard_id.in_(flashcard_ids))
         ).all()
         for log in study_logs_to_delete:
             db.delete(log)
+
+        db.exec(
+            models.FlashcardConversation.__table__.delete()
+            .where(models.FlashcardConversation.__table__.c.flashcard_id.in_(flashcard_ids))
+        )
     
+    if db_document.quiz:
+        quiz_id = db_document.quiz.id
+        # Desconta dos resumos diários as tentativas de quiz que serão excluídas
+        quiz_day = func.date(func.timezone("UTC", models.QuizAttempt.completed_at))
+        removed_quizzes = db.exec(
+            select(
+                models.QuizAttempt.user_id,
+                quiz_day,
+                func.count(models.QuizAttempt.id),
+                func.sum(models.QuizAttempt.score),
+            )
+            .where(models.QuizAttempt.quiz_id == quiz_id)
+            .group_by(models.QuizAttempt.user_id, quiz_day)
+        ).all()
+        for attempt_user_id, activity_date, quizzes_completed, quiz_score_sum in removed_quizzes:
+            _bump_daily_activity(
+                db, user_id=attempt_user_id, activity_date=activity_date,
+                quizzes_completed=-quizzes_completed, quiz_score_sum=-quiz_score_sum
+            )
+
+        db.exec(
+            models.QuizAttempt.__table__.delete()
+            .where(models.QuizAttempt.__table__.c.quiz_id == quiz_id)
+        )
+
+    db.exec(
+        models.DeckProgress.__table__.delete()
+        .where(models.DeckProgress.__table__.c.document_id == document_id)
+    )
     db.delete(db_document)
     db.commit()
     return True
@@ -250,7 +1355,6 @@ def get_folders_by_user(db: Session, user_id: int) -> List[models.Folder]:
     statement = (
         select(models.Folder)
         .where(models.Folder.user_id == user_id)
-        .options(selectinload(models.Folder.documents))
         .order_by(models.Folder.name)
     )
     return db.exec(statement).all()
@@ -304,33 +1408,6 @@ def update_document_folder(db: Session, document_id: int, folder_id: Optional[in
     db.refresh(db_document)
     return db_document
 
-def create_quiz_for_document(db: Session, quiz_data: schemas.QuizCreate, document_id: int) -> models.Quiz:
-    """
-    Cria um novo quiz completo, com todas as suas perguntas e respostas,
-    e associa-o a um documento existente.
-    """
-    questions_to_create = []
-    for question_schema in quiz_data.questions:
-        answers_to_create = [
-            models.Answer(**ans.dict()) for ans in question_schema.answers
-        ]
-        question_obj = models.Question(
-            text=question_schema.text, answers=answers_to_create
-        )
-        questions_to_create.append(question_obj)
-
-    db_quiz = models.Quiz(
-        title=quiz_data.title,
-        document_id=document_id,
-        questions=questions_to_create
-    )
-    
-    db.add(db_quiz)
-    db.commit()
-    db.refresh(db_quiz)
-    
-    return db_quiz
-
 def get_question_if_owned_by_user(session: Session, question_id: int, user_id: int) -> Optional[models.Question]:
     """
     Busca uma pergunta e verifica se ela pertence a um documento do utilizador especificado.
@@ -446,35 +1523,76 @@ def shuffle_quiz_answers(quiz_data: dict) -> dict:
     
     return shuffled_quiz
 
+def _bulk_insert_questions(session: Session, quiz_id: int, questions: list[tuple[str, list[dict]]]) -> list[models.Question]:
+    """
+    Insere perguntas e alternativas em dois INSERT ... RETURNING (um por
+    tabela). Não faz commit. Retorna as perguntas já com as alternativas.
+    """
+    if not questions:
+        return []
+
+    question_table = models.Question.__table__
+    question_rows = session.exec(
+        pg_insert(question_table).returning(*question_table.c, sort_by_parameter_order=True),
+        params=[{"text": text, "quiz_id": quiz_id} for text, _ in questions],
+    ).all()
+
+    answer_params = [
+        {
+            "text": answer["text"],
+            "is_correct": answer.get("is_correct", False),
+            "explanation": answer.get("explanation"),
+            "question_id": question_row.id,
+        }
+        for question_row, (_, answers) in zip(question_rows, questions)
+        for answer in answers
+    ]
+    answers_by_question: dict[int, list[models.Answer]] = {row.id: [] for row in question_rows}
+    if answer_params:
+        answer_table = models.Answer.__table__
+        answer_rows = session.exec(
+            pg_insert(answer_table).returning(*answer_table.c, sort_by_parameter_order=True),
+            params=answer_params,
+        ).all()
+        for row in answer_rows:
+            answers_by_question[row.question_id].append(models.Answer(**row._mapping))
+
+    return [
+        models.Question(**row._mapping, answers=answers_by_question[row.id])
+        for row in question_rows
+    ]
+
 def create_quiz_for_document(db: Session, quiz_data: schemas.QuizCreate, document_id: int) -> models.Quiz:
     """
     Cria um novo quiz completo, com todas as suas perguntas e respostas,
     e associa-o a um documento existente.
     
     🆕 AGORA COM EMBARALHAMENTO DE ALTERNATIVAS
+    Quiz, perguntas e alternativas são gravados com três INSERT ... RETURNING;
+    o objeto retornado é montado a partir do RETURNING, sem novas consultas.
     """
-    questions_to_create = []
+    questions = []
     for question_schema in quiz_data.questions:
         # 🆕 Embaralha as alternativas antes de criar
         shuffled_answers = question_schema.answers.copy()
         random.shuffle(shuffled_answers)
-        
-        answers_to_create = [
-            models.Answer(**ans.dict()) for ans in shuffled_answers
-        ]
-        question_obj = models.Question(
-            text=question_schema.text, answers=answers_to_create
-        )
-        questions_to_create.append(question_obj)
+        questions.append((question_schema.text, [ans.model_dump() for ans in shuffled_answers]))
 
-    db_quiz = models.Quiz(
-        title=quiz_data.title,
-        document_id=document_id,
-        questions=questions_to_create
-    )
-    
-    db.add(db_quiz)
+    quiz_table = models.Quiz.__table__
+    quiz_row = db.exec(
+        pg_insert(quiz_table)
+        .values(title=quiz_data.title, document_id=document_id)
+        .returning(*quiz_table.c)
+    ).one()
+    db_questions = _bulk_insert_questions(db, quiz_row.id, questions)
     db.commit()
-    db.refresh(db_quiz)
-    
-    return db_quiz
\ No newline at end of file
+
+    return models.Quiz(**quiz_row._mapping, questions=db_questions)
+
+def add_questions_to_quiz(session: Session, quiz_id: int, questions_data: list[dict]) -> list[models.Question]:
+    """Acrescenta perguntas (dicts com text e answers) a um quiz existente, em lote."""
+    db_questions = _bulk_insert_questions(
+        session, quiz_id, [(q["text"], q["answers"]) for q in questions_data]
+    )
+    session.commit()
+    return db_questions
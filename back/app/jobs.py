@@ -0,0 +1,87 @@
+# app/jobs.py
+"""
+Jobs de geração sob demanda (gerar/adicionar flashcards e perguntas).
+
+O job é uma task do Celery cujo ID é o job_id; aqui ficam só os metadados
+(tipo, documento e dono) no Redis, para que GET /jobs/{id} possa validar o
+acesso. O estado e o resultado vêm do result backend do Celery, e o
+progresso dos campos de processamento do próprio documento.
+"""
+import os
+import json
+import uuid
+import logging
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+JOB_TTL_SECONDS = 24 * 3600
+# Limite de tempo de um job no worker: ao estourar, o job falha e o documento
+# volta ao status anterior (em vez de ficar PROCESSING para sempre)
+JOB_SOFT_TIME_LIMIT_SECONDS = int(os.getenv("GENERATION_JOB_TIME_LIMIT_SECONDS", 600))
+
+KEY_PREFIX = "job"
+# Job em andamento de cada documento (usado pelo cancelamento)
+ACTIVE_KEY_PREFIX = "document_job"
+
+# Tipos de job
+GENERATE_FLASHCARDS = "generate_flashcards"
+GENERATE_QUIZ = "generate_quiz"
+ADD_FLASHCARDS = "add_flashcards"
+ADD_QUESTIONS = "add_questions"
+
+_client: Optional[redis.Redis] = None
+
+def _get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+def create_job(kind: str, document_id: int, user_id: int, restore_status: str) -> str:
+    """
+    Registra um novo job como o job em andamento do documento e retorna o seu
+    ID (usado também como ID da task). restore_status é o status para o qual
+    o documento volta quando o job termina ou é cancelado.
+    """
+    job_id = uuid.uuid4().hex
+    metadata = {
+        "job_id": job_id,
+        "kind": kind,
+        "document_id": document_id,
+        "user_id": user_id,
+        "restore_status": restore_status,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    pipe = _get_client().pipeline()
+    pipe.set(f"{KEY_PREFIX}:{job_id}", json.dumps(metadata), ex=JOB_TTL_SECONDS)
+    pipe.set(f"{ACTIVE_KEY_PREFIX}:{document_id}", job_id, ex=JOB_TTL_SECONDS)
+    pipe.execute()
+    return job_id
+
+def get_job(job_id: str) -> Optional[dict[str, Any]]:
+    raw = _get_client().get(f"{KEY_PREFIX}:{job_id}")
+    return json.loads(raw) if raw is not None else None
+
+def get_active_job(document_id: int) -> Optional[dict[str, Any]]:
+    """Metadados do job em andamento do documento, se houver."""
+    job_id = _get_client().get(f"{ACTIVE_KEY_PREFIX}:{document_id}")
+    return get_job(job_id.decode()) if job_id is not None else None
+
+def clear_active_job(document_id: int, job_id: str) -> None:
+    """Remove a marca de job em andamento, se ainda for deste job."""
+    key = f"{ACTIVE_KEY_PREFIX}:{document_id}"
+    try:
+        client = _get_client()
+        current = client.get(key)
+        if current is not None and current.decode() == job_id:
+            client.delete(key)
+    except redis.RedisError as e:
+        logger.warning(f"Registro de jobs indisponível (clear): {e}")
@@ -3,8 +3,10 @@
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from sqlmodel import SQLModel
-from .database import engine 
+from sqlmodel import Session, SQLModel
+from .database import engine
+from . import crud
+from .upload_limit import UploadSizeLimitMiddleware, MULTIPART_OVERHEAD_BYTES
 from .routers import auth
 from .routers import folders
 from .routers import documents
@@ -12,12 +14,19 @@ from .routers import flashcards
 from .routers import progress
 from .routers import quizzes
 from .routers import stats
+from .routers import jobs
 
 # Importe o modelo para que ele seja registrado pelo SQLModel
 from . import models
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    # create_all não altera tabelas existentes: as migrações abaixo são
+    # idempotentes e completam bancos criados por versões anteriores
+    with Session(engine) as session:
+        crud.migrate_document_content_hash(session)
+        crud.migrate_study_log_client_event_ids(session)
+        crud.backfill_progress_summaries(session)
 
 frontend_url = os.getenv("FRONTEND_URL", "http://localhost:4000")
 
@@ -34,6 +43,14 @@ origins = [
     "frontend_url"
 ]
 
+# Rejeita uploads grandes antes de o corpo multipart ser lido (registrado
+# antes do CORS para que a resposta 413 também leve os cabeçalhos de CORS)
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    max_body_bytes=documents.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    paths=["/documents/upload"],
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -50,6 +67,7 @@ app.include_router(progress.router)
 app.include_router(folders.router)
 app.include_router(quizzes.router)
 app.include_router(stats.router)
+app.include_router(jobs.router)
 
 @app.on_event("startup")
 def on_startup():
@@ -2,10 +2,10 @@
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
 from enum import Enum # Importe Enum
-from sqlalchemy import Column, Text, JSON,func, DateTime, Integer
+from sqlalchemy import Column, Text, JSON,func, DateTime, Integer, Index, LargeBinary
 from sqlalchemy.dialects.postgresql import ARRAY
 from typing import Annotated
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
 # Crie uma Enum para o status do documento
 class DocumentStatus(str, Enum):
@@ -78,13 +78,50 @@ class Folder(SQLModel, table=True):
     user: User = Relationship(back_populates="folders")
     documents: List["Document"] = Relationship(back_populates="folder")
 
+# CONTEÚDO DO DOCUMENTO, DEDUPLICADO POR HASH (compartilhado entre usuários)
+# Uploads têm o arquivo em storage_path; decks criados a partir de texto não têm arquivo.
+class DocumentBlob(SQLModel, table=True):
+    content_hash: str = Field(primary_key=True, max_length=64)  # SHA-256 hexadecimal
+    storage_path: Optional[str] = Field(default=None)
+    size_bytes: int
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), server_default=func.now(), nullable=False),
+        default_factory=lambda: datetime.now(timezone.utc)
+    )
+
+    documents: List["Document"] = Relationship(back_populates="blob")
+
+# TEXTO EXTRAÍDO, FORA DAS LINHAS DE METADADOS
+# Fica numa tabela própria para que listagem, polling de status e cancelamento
+# não carreguem o texto; só os geradores e o chat leem esta tabela.
+class DocumentText(SQLModel, table=True):
+    content_hash: str = Field(primary_key=True, foreign_key="documentblob.content_hash", max_length=64)
+    compression: str = Field(default="none", max_length=16)  # "zstd", "zlib" ou "none"
+    text_length: int  # Tamanho do texto descomprimido, em caracteres
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+# ÍNDICE BM25 DOS TRECHOS DO TEXTO (chat busca só as partes relevantes)
+# Também compartilhado pelo hash; data é o JSON do índice, comprimido como o texto.
+class DocumentTextIndex(SQLModel, table=True):
+    content_hash: str = Field(primary_key=True, foreign_key="documentblob.content_hash", max_length=64)
+    version: int  # text_index.TEXT_INDEX_VERSION usada na construção
+    passage_count: int
+    compression: str = Field(default="none", max_length=16)
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
 class Document(SQLModel, table=True):
+    # Índice para a listagem paginada por keyset (user_id, created_at, id)
+    __table_args__ = (
+        Index("ix_document_user_created_id", "user_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
+    # Nome exibido pelo app (título do deck); para uploads o arquivo real fica no DocumentBlob
     file_path: str
+    content_hash: Optional[str] = Field(default=None, foreign_key="documentblob.content_hash", index=True)
     status: DocumentStatus = Field(default=DocumentStatus.PROCESSING)
     generates_flashcards: bool = Field(default=True)
     generates_quizzes: bool = Field(default=False)
-    extracted_text: Optional[str] = Field(default=None, sa_column=Column(Text))
     processing_progress: int = Field(default=0)
     current_step: Optional[str] = Field(default=None)
     can_cancel: bool = Field(default=True)
@@ -113,6 +150,7 @@ class Document(SQLModel, table=True):
 
     folder_id: Optional[int] = Field(default=None, foreign_key="folder.id")
     folder: Optional[Folder] = Relationship(back_populates="documents")
+    blob: Optional["DocumentBlob"] = Relationship(back_populates="documents")
     flashcards: List["Flashcard"] = Relationship(
         back_populates="document",
         sa_relationship_kwargs={"cascade": "all, delete"}
@@ -126,7 +164,7 @@ class Flashcard(SQLModel, table=True):
     back: str = Field(sa_column=Column(Text))  # Use Text para suportar conteúdo longo
     type: FlashcardType = Field(default=FlashcardType.CONCEPT)
 
-    document_id: int = Field(foreign_key="document.id")
+    document_id: int = Field(foreign_key="document.id", index=True)
     document: Document = Relationship(back_populates="flashcards")
     
     # Relacionamento para conversas sobre o flashcard
@@ -134,10 +172,18 @@ class Flashcard(SQLModel, table=True):
 
 # Modelo para armazenar conversas sobre flashcards
 class FlashcardConversation(SQLModel, table=True):
+    # Índice para o histórico por flashcard em ordem de criação (últimas N e keyset)
+    __table_args__ = (
+        Index("ix_flashcardconversation_flashcard_created_id", "flashcard_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_message: str = Field(sa_column=Column(Text))
     assistant_response: str = Field(sa_column=Column(Text))
-    created_at: Optional[str] = Field(default=None)  # Timestamp da mensagem
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), server_default=func.now(), nullable=False),
+        default_factory=lambda: datetime.now(timezone.utc)
+    )
     
     flashcard_id: int = Field(foreign_key="flashcard.id")
     flashcard: Flashcard = Relationship(back_populates="conversations")
@@ -154,7 +200,70 @@ class StudyLog(SQLModel, table=True):
 
     # Chaves estrangeiras
     user_id: int = Field(foreign_key="user.id")
-    flashcard_id: int = Field(foreign_key="flashcard.id")
+    flashcard_id: int = Field(foreign_key="flashcard.id", index=True)
+
+    # Chave de idempotência enviada pelo app ao sincronizar eventos offline
+    client_event_id: Optional[str] = Field(default=None, max_length=64)
+
+    # Índice usado para saber rapidamente se o usuário já estudou o flashcard
+    __table_args__ = (
+        Index("ix_studylog_user_flashcard", "user_id", "flashcard_id"),
+        Index("ix_studylog_user_studied_at", "user_id", "studied_at"),
+        Index("ux_studylog_user_client_event", "user_id", "client_event_id", unique=True),
+    )
+
+# ESTADO DE REPETIÇÃO ESPAÇADA (SM-2) POR USUÁRIO E FLASHCARD
+class FlashcardReviewState(SQLModel, table=True):
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    flashcard_id: int = Field(foreign_key="flashcard.id", primary_key=True)
+
+    ease_factor: float = Field(default=2.5)
+    interval_days: int = Field(default=0)
+    repetitions: int = Field(default=0)
+    due_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+    last_reviewed_at: datetime = Field(sa_column=Column(DateTime(timezone=True), nullable=False))
+
+    # Fila de revisão: "cards vencidos do usuário" sem varrer todos os estados
+    __table_args__ = (
+        Index("ix_flashcardreviewstate_user_due", "user_id", "due_at"),
+    )
+
+# RESUMO MATERIALIZADO DE PROGRESSO POR DECK (mantido incrementalmente)
+class DeckProgress(SQLModel, table=True):
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    document_id: int = Field(foreign_key="document.id", primary_key=True)
+
+    # Flashcards distintos já estudados pelo usuário neste deck
+    studied_flashcards: int = Field(
+        sa_column=Column(Integer, server_default="0", nullable=False),
+        default=0
+    )
+    quiz_attempts: int = Field(
+        sa_column=Column(Integer, server_default="0", nullable=False),
+        default=0
+    )
+    quiz_score_sum: float = Field(default=0.0)
+    last_quiz_score: Optional[float] = Field(default=None)
+    last_quiz_at: Optional[datetime] = Field(
+        sa_column=Column(DateTime(timezone=True), nullable=True),
+        default=None
+    )
+
+# RESUMO MATERIALIZADO DE ATIVIDADE DIÁRIA (dia em UTC)
+class UserDailyActivity(SQLModel, table=True):
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    activity_date: date = Field(primary_key=True)
+
+    cards_studied: int = Field(
+        sa_column=Column(Integer, server_default="0", nullable=False),
+        default=0
+    )
+    accuracy_sum: float = Field(default=0.0)
+    quizzes_completed: int = Field(
+        sa_column=Column(Integer, server_default="0", nullable=False),
+        default=0
+    )
+    quiz_score_sum: float = Field(default=0.0)
 
 class Quiz(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -198,4 +307,8 @@ class QuizAttempt(SQLModel, table=True):
     quiz: "Quiz" = Relationship(back_populates="attempts")
 
     user_id: int = Field(foreign_key="user.id")
-    user: "User" = Relationship(back_populates="quiz_attempts")
\ No newline at end of file
+    user: "User" = Relationship(back_populates="quiz_attempts")
+
+    __table_args__ = (
+        Index("ix_quizattempt_user_completed_at", "user_id", "completed_at"),
+    )
\ No newline at end of file
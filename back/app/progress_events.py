@@ -0,0 +1,91 @@
+# app/progress_events.py
+"""
+Eventos de progresso do processamento de documentos via Redis pub/sub.
+
+O worker publica cada transição de passo no canal do documento; a API
+repassa esses eventos aos clientes por Server-Sent Events. Não há replay de
+eventos antigos: quem se inscreve lê o estado atual no banco depois de já
+estar inscrito, então nada se perde entre a leitura e a inscrição e um
+evento final de uma execução anterior (ex.: o COMPLETED de antes de um job
+de geração) nunca é reenviado. Falhas do Redis nunca interrompem o
+processamento: o banco continua sendo a fonte da verdade.
+"""
+import os
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+from . import models, schemas
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+KEY_PREFIX = "document_events"
+
+_client: Optional[redis.Redis] = None
+
+def _get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+    return _client
+
+def channel_name(document_id: int) -> str:
+    return f"{KEY_PREFIX}:{document_id}"
+
+def document_event(document: models.Document) -> dict[str, Any]:
+    """Evento no mesmo formato de GET /documents/{id}/status."""
+    return schemas.DocumentStatusRead(
+        id=document.id,
+        status=document.status,
+        current_step=document.current_step,
+        processing_progress=document.processing_progress,
+        can_cancel=document.can_cancel,
+    ).model_dump(mode="json")
+
+def publish(document_id: int, event: dict[str, Any]) -> None:
+    """Publica um evento de progresso (síncrono; usado pelo worker e pela API)."""
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+    try:
+        _get_client().publish(channel_name(document_id), payload)
+    except redis.RedisError as e:
+        logger.warning(f"Eventos de progresso indisponíveis (publish): {e}")
+
+async def subscribe(
+    document_id: int,
+    keepalive_seconds: float,
+    current_state: Callable[[], Awaitable[Optional[dict[str, Any]]]],
+) -> AsyncIterator[Optional[dict[str, Any]]]:
+    """
+    Gera os eventos publicados para o documento, começando pelo estado
+    atual retornado por current_state() (lido já com a inscrição ativa).
+    Gera None a cada keepalive_seconds sem eventos, para o chamador manter
+    a conexão viva. Se o Redis falhar, simplesmente termina (o cliente volta
+    ao polling).
+    """
+    client = aioredis.Redis.from_url(REDIS_URL)
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(channel_name(document_id))
+        # Já inscrito: o estado atual cobre o que foi publicado antes da inscrição
+        state = await current_state()
+        if state is not None:
+            yield state
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=keepalive_seconds)
+            if message is None:
+                yield None
+                continue
+            yield json.loads(message["data"])
+    except redis.RedisError as e:
+        logger.warning(f"Eventos de progresso indisponíveis (subscribe): {e}")
+    finally:
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,83 @@
+# app/progress_reporter.py
+import os
+import time
+from typing import Optional
+
+from sqlmodel import Session
+
+from . import models, progress_events
+
+# Intervalo mínimo entre gravações de progresso no banco para um documento
+PROGRESS_MIN_WRITE_INTERVAL_SECONDS = float(os.getenv("PROGRESS_MIN_WRITE_INTERVAL_SECONDS", "2"))
+
+class ProgressReporter:
+    """
+    Reporta os passos do processamento de um documento.
+
+    Todo passo é publicado imediatamente (SSE), mas as gravações no banco são
+    agrupadas: passos marcados como persist=True (os que antecedem um
+    trabalho longo) são sempre gravados, para o app que consulta o banco ver
+    o passo durante toda a espera. Os demais só são gravados se a última
+    gravação tiver mais de min_write_interval segundos; senão vão junto com
+    a próxima gravação (ou com finish). Também mede quanto tempo cada passo levou.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        document: models.Document,
+        min_write_interval: float = PROGRESS_MIN_WRITE_INTERVAL_SECONDS,
+    ):
+        self.session = session
+        self.document = document
+        self.min_write_interval = min_write_interval
+        self.timings: list[tuple[str, float]] = []
+        self.writes = 0
+        self._last_write_at: Optional[float] = None
+        self._current_step: Optional[str] = None
+        self._step_started_at = time.monotonic()
+
+    def _close_step(self) -> None:
+        now = time.monotonic()
+        if self._current_step is not None:
+            self.timings.append((self._current_step, now - self._step_started_at))
+        self._step_started_at = now
+
+    def _write(self) -> None:
+        self.session.add(self.document)
+        self.session.commit()
+        self.writes += 1
+        self._last_write_at = time.monotonic()
+
+    def _publish(self) -> None:
+        progress_events.publish(self.document.id, progress_events.document_event(self.document))
+        print(f"[TASK] Doc {self.document.id} - Passo: {self.document.current_step}")
+
+    def step(self, name: str, persist: bool = False) -> None:
+        """Inicia um novo passo; grava no banco se persist ou fora do intervalo mínimo."""
+        self._close_step()
+        self._current_step = name
+        self.document.current_step = name
+
+        throttled = (
+            self._last_write_at is None
+            or time.monotonic() - self._last_write_at < self.min_write_interval
+        )
+        if persist or not throttled:
+            self._write()
+        self._publish()
+
+    def finish(self, status: models.DocumentStatus, step: str, progress: Optional[int] = None) -> None:
+        """Estado final (concluído, falha ou nova tentativa): sempre gravado."""
+        self._close_step()
+        self._current_step = None
+        self.document.status = status
+        self.document.current_step = step
+        if progress is not None:
+            self.document.processing_progress = progress
+        self._write()
+        self._publish()
+        print(f"[TASK] Doc {self.document.id} - {self.writes} gravação(ões) de progresso; tempos: {self.format_timings()}")
+
+    def format_timings(self) -> str:
+        return ", ".join(f"{name} {seconds:.1f}s" for name, seconds in self.timings) or "-"
@@ -1,18 +1,26 @@
 # back/app/routers/documents.py
 
-import shutil
+import os
+import asyncio
+import hashlib
+import tempfile
 from pathlib import Path
 import re
+from datetime import datetime
 from typing import Optional, List
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status, Response
-from sqlmodel import Session
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Query, Request, status, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import exists
+from sqlmodel import Session, select
 from typing_extensions import Annotated
 
-from .. import crud, models, security, schemas
-from ..database import get_session
+from .. import crud, models, security, schemas, progress_events, cancellation, jobs
+from ..database import engine, get_session
+from ..sse import SSE_HEADERS, format_sse
 from ..security import get_current_user
-from ..tasks import process_document 
-from ..ai_generator import generate_flashcards_from_text, generate_quiz_from_text
+from ..tasks import process_document, process_document_task_id, generate_document_content
+from ..worker import celery_app
 from pydantic import BaseModel, Field
 
 
@@ -21,6 +29,21 @@ CurrentUser = Annotated[models.User, Depends(security.get_current_user)]
 
 UPLOAD_DIRECTORY = Path("uploads")
 UPLOAD_DIRECTORY.mkdir(exist_ok=True)
+# Temporários ficam no mesmo sistema de arquivos para o rename ser atômico
+UPLOAD_TEMP_DIRECTORY = UPLOAD_DIRECTORY / ".tmp"
+UPLOAD_TEMP_DIRECTORY.mkdir(exist_ok=True)
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", 25)) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Long-poll do status: intervalo entre leituras e espera máxima permitida
+STATUS_POLL_INTERVAL_SECONDS = float(os.getenv("STATUS_POLL_INTERVAL_SECONDS", "1"))
+STATUS_MAX_WAIT_SECONDS = 30
+
+# SSE de progresso: intervalo do keep-alive e duração máxima de uma conexão
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_MAX_STREAM_SECONDS = int(os.getenv("EVENTS_MAX_STREAM_SECONDS", "600"))
+
+UPLOAD_SUFFIXES = {"image/jpeg": ".jpg", "image/png": ".png", "application/pdf": ".pdf"}
 
 class AddFlashcardsRequest(BaseModel):
     num_flashcards: int = Field(ge=1, le=20)
@@ -47,8 +70,42 @@ def sanitize_filename(name: str) -> str:
     name = re.sub(r'[^a-z0-9_.-]', '', name)
     return name[:100]
 
+async def save_upload_content_addressed(file: UploadFile, suffix: str) -> tuple[Path, str, int]:
+    """
+    Grava o upload em blocos num arquivo temporário calculando o SHA-256 e
+    abortando assim que o tamanho máximo é excedido. No fim, renomeia de
+    forma atômica para um caminho endereçado pelo conteúdo
+    (uploads/<sha256><sufixo>), de modo que uploads diferentes nunca se
+    sobrescrevem e arquivos idênticos ocupam um único lugar no disco.
+    Retorna (caminho final, hash hexadecimal, tamanho em bytes).
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Arquivo excede o tamanho máximo permitido.")
+
+    digest = hashlib.sha256()
+    total_size = 0
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_TEMP_DIRECTORY, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                total_size += len(chunk)
+                if total_size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Arquivo excede o tamanho máximo permitido.")
+                digest.update(chunk)
+                await run_in_threadpool(buffer.write, chunk)
+
+        content_hash = digest.hexdigest()
+        final_path = UPLOAD_DIRECTORY / f"{content_hash}{suffix}"
+        os.replace(temp_path, final_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+    return final_path, content_hash, total_size
+
 @router.post("/upload", response_model=models.Document, status_code=status.HTTP_202_ACCEPTED)
-def upload_document(
+async def upload_document(
     current_user: CurrentUser,
     session: Session = Depends(get_session),
     file: UploadFile = File(...),
@@ -61,11 +118,14 @@ def upload_document(
     difficulty: str = Form("Médio"),
     num_questions: int = Form(5),
 ):
+    # Handler assíncrono: o arquivo é lido em blocos sem ocupar uma thread do
+    # pool durante todo o upload; as chamadas ao banco vão para o threadpool.
+
     # 🆕 VERIFICAR LIMITE ANTES DE PROCESSAR
-    can_generate, remaining = crud.can_user_generate_deck(session, current_user)
+    can_generate, remaining = await run_in_threadpool(crud.can_user_generate_deck, session, current_user)
     
     if not can_generate:
-        generation_info = crud.get_user_generation_info(session, current_user)
+        generation_info = await run_in_threadpool(crud.get_user_generation_info, session, current_user)
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail={
@@ -76,33 +136,41 @@ def upload_document(
             }
         )
     
-    if not file.content_type in ["image/jpeg", "image/png", "application/pdf"]:
+    if not file.content_type in UPLOAD_SUFFIXES:
         raise HTTPException(status_code=400, detail="Tipo de arquivo inválido.")
 
-    original_suffix = Path(file.filename).suffix
+    suffix = UPLOAD_SUFFIXES[file.content_type]
+    file_path_on_disk, content_hash, size_bytes = await save_upload_content_addressed(file, suffix)
+    # Mesmo conteúdo enviado por outro usuário reaproveita o blob (e o texto extraído)
+    await run_in_threadpool(
+        crud.get_or_create_document_blob,
+        session, content_hash=content_hash, storage_path=str(file_path_on_disk), size_bytes=size_bytes
+    )
+
+    # file_path continua sendo o nome exibido pelo app; o arquivo real fica no DocumentBlob
     safe_basename = sanitize_filename(title)
-    final_filename = f"{current_user.id}_{safe_basename}{original_suffix}"
-    
-    file_path_on_disk = UPLOAD_DIRECTORY / final_filename
-    
-    with file_path_on_disk.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    display_path = UPLOAD_DIRECTORY / f"{current_user.id}_{safe_basename}{suffix}"
 
-    db_document = crud.create_document_for_user(
+    db_document = await run_in_threadpool(
+        crud.create_document_for_user,
         session,
         user_id=current_user.id,
-        file_path=str(file_path_on_disk),
+        file_path=str(display_path),
         folder_id=folder_id,
         generates_flashcards=generates_flashcards,
-        generates_quizzes=generates_quizzes
+        generates_quizzes=generates_quizzes,
+        content_hash=content_hash
     )
     
-    process_document.delay(
-        document_id=db_document.id,
-        content_type=content_type,
-        num_flashcards=num_flashcards,
-        difficulty=difficulty,
-        num_questions=num_questions
+    process_document.apply_async(
+        kwargs=dict(
+            document_id=db_document.id,
+            content_type=content_type,
+            num_flashcards=num_flashcards,
+            difficulty=difficulty,
+            num_questions=num_questions
+        ),
+        task_id=process_document_task_id(db_document.id)
     )
 
     return db_document
@@ -131,26 +199,32 @@ def create_document_from_text(
     if not text_input.text.strip():
         raise HTTPException(status_code=400, detail="Texto não pode estar vazio")
     
+    # O texto colado também é deduplicado por hash e guardado fora da linha do documento
+    text_bytes = text_input.text.encode("utf-8")
+    content_hash = hashlib.sha256(text_bytes).hexdigest()
+    crud.get_or_create_document_blob(session, content_hash=content_hash, size_bytes=len(text_bytes))
+    crud.store_document_text(session, content_hash, text_input.text)
+    session.commit()
+
     db_document = crud.create_document_for_user(
         session,
         user_id=current_user.id,
         file_path=text_input.title,
         folder_id=text_input.folder_id,
         generates_flashcards=text_input.generate_flashcards,
-        generates_quizzes=text_input.generate_quizzes
+        generates_quizzes=text_input.generate_quizzes,
+        content_hash=content_hash
     )
-
-    db_document.extracted_text = text_input.text
-    session.add(db_document)
-    session.commit()
-    session.refresh(db_document)
     
-    process_document.delay(
-        document_id=db_document.id,
-        content_type=text_input.content_type,
-        num_flashcards=text_input.num_flashcards,
-        difficulty=text_input.difficulty,
-        num_questions=text_input.num_questions
+    process_document.apply_async(
+        kwargs=dict(
+            document_id=db_document.id,
+            content_type=text_input.content_type,
+            num_flashcards=text_input.num_flashcards,
+            difficulty=text_input.difficulty,
+            num_questions=text_input.num_questions
+        ),
+        task_id=process_document_task_id(db_document.id)
     )
     
     return db_document
@@ -169,38 +243,146 @@ def get_generation_limit_status(
 @router.get("/", response_model=list[schemas.DocumentCardData])
 def get_user_documents(
     current_user: CurrentUser,
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    limit: Optional[int] = Query(default=None, ge=1, le=100),
+    before_created_at: Optional[datetime] = Query(default=None),
+    before_id: Optional[int] = Query(default=None),
 ):
-    db_documents = crud.get_documents_by_user(session, user_id=current_user.id)
-    
-    docs_with_progress = []
-    for doc in db_documents:
-        total_flashcards = len(doc.flashcards)
-        studied_flashcards = crud.get_studied_flashcards_count(session, document_id=doc.id)
-        
-        doc_data = schemas.DocumentCardData(
-            id=doc.id,
-            file_path=doc.file_path,
-            status=doc.status,
-            created_at=doc.created_at,
-            total_flashcards=total_flashcards,
-            studied_flashcards=studied_flashcards,
-            folder_id=doc.folder_id,
-            has_quiz=(doc.quiz is not None)
+    """
+    Lista os decks do usuário (mais recentes primeiro) a partir de uma query
+    agregada, sem carregar flashcards/perguntas.
+    Paginação por keyset: para a próxima página, envie o `created_at` e o `id`
+    do último item recebido em `before_created_at` e `before_id`.
+    Sem `limit`, retorna todos os decks (comportamento anterior).
+    """
+    if (before_created_at is None) != (before_id is None):
+        raise HTTPException(
+            status_code=400,
+            detail="Informe before_created_at e before_id juntos para paginar."
         )
-        docs_with_progress.append(doc_data)
-            
-    return docs_with_progress
+
+    return crud.get_document_cards_for_user(
+        session,
+        user_id=current_user.id,
+        limit=limit,
+        before_created_at=before_created_at,
+        before_id=before_id,
+    )
+
+def document_status_etag(doc_status: schemas.DocumentStatusRead) -> str:
+    """ETag forte derivado apenas dos campos de progresso."""
+    fingerprint = f"{doc_status.status.value}|{doc_status.current_step}|{doc_status.processing_progress}|{doc_status.can_cancel}"
+    return '"' + hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:16] + '"'
+
+@router.get("/{document_id}/status", response_model=schemas.DocumentStatusRead)
+async def get_document_status(
+    document_id: int,
+    response: Response,
+    current_user: CurrentUser,
+    session: Session = Depends(get_session),
+    if_none_match: Optional[str] = Header(None),
+    wait: int = Query(0, ge=0, le=STATUS_MAX_WAIT_SECONDS, description="Segundos para aguardar uma mudança (long-poll)")
+):
+    """
+    Status leve para o polling do processamento: só status, passo e progresso.
+    Com If-None-Match igual ao ETag atual responde 304; com wait > 0 segura a
+    requisição até o passo mudar (ou o tempo acabar) antes de responder.
+    """
+    doc_status = await run_in_threadpool(crud.get_document_status, session, document_id, current_user.id)
+    if doc_status is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    etag = document_status_etag(doc_status)
+
+    if if_none_match == etag and wait > 0:
+        # Libera a conexão do banco enquanto espera; cada leitura abre e fecha a sua
+        session.close()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while etag == if_none_match and loop.time() < deadline:
+            await asyncio.sleep(min(STATUS_POLL_INTERVAL_SECONDS, max(deadline - loop.time(), 0)))
+            doc_status = await run_in_threadpool(crud.get_document_status, session, document_id, current_user.id)
+            session.close()
+            if doc_status is None:
+                raise HTTPException(status_code=404, detail="Documento não encontrado")
+            etag = document_status_etag(doc_status)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return doc_status
+
+TERMINAL_STATUSES = {
+    models.DocumentStatus.COMPLETED.value,
+    models.DocumentStatus.FAILED.value,
+    models.DocumentStatus.CANCELLED.value,
+}
+
+@router.get("/{document_id}/events")
+async def stream_document_events(
+    document_id: int,
+    request: Request,
+    current_user: CurrentUser,
+    session: Session = Depends(get_session),
+):
+    """
+    Server-Sent Events com o progresso do processamento. O primeiro evento é
+    o estado atual (lido do banco); depois cada transição publicada pelo
+    worker no Redis. A conexão fecha quando o documento termina (concluído,
+    falhou ou cancelado).
+    """
+    doc_status = await run_in_threadpool(crud.get_document_status, session, document_id, current_user.id)
+    if doc_status is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    # A conexão do banco não é necessária durante o stream
+    session.close()
+
+    async def event_stream():
+        initial = doc_status.model_dump(mode="json")
+        yield format_sse("status", initial)
+        if initial["status"] in TERMINAL_STATUSES:
+            return
+
+        def read_status() -> Optional[dict]:
+            with Session(engine) as stream_session:
+                current = crud.get_document_status(stream_session, document_id, current_user.id)
+            return current.model_dump(mode="json") if current else None
+
+        async def current_state() -> Optional[dict]:
+            # Só reenvia o estado se mudou desde o primeiro evento
+            state = await run_in_threadpool(read_status)
+            return state if state != initial else None
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + EVENTS_MAX_STREAM_SECONDS
+        async for event in progress_events.subscribe(document_id, EVENTS_KEEPALIVE_SECONDS, current_state):
+            if await request.is_disconnected() or loop.time() > deadline:
+                return
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse("status", event)
+            if event.get("status") in TERMINAL_STATUSES:
+                return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
 
 @router.get("/{document_id}", response_model=schemas.DocumentDetail)
 def get_document_details(
     document_id: int,
     current_user: CurrentUser,
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    include_text: bool = Query(False, description="Inclui o texto extraído (pesado; não usar no polling)")
 ):
     """
     Obtém os detalhes completos de um documento, incluindo o quiz.
     ATUALIZADO: Agora força a leitura dos dados mais recentes do banco.
+    O texto extraído só é carregado com include_text=true.
     """
     # CORREÇÃO CRÍTICA: Expira todos os objetos em cache da sessão
     # Isso garante que vamos buscar dados frescos do banco, mesmo que
@@ -221,7 +403,7 @@ def get_document_details(
         id=db_document.id,
         status=db_document.status,
         file_path=db_document.file_path,
-        extracted_text=db_document.extracted_text,
+        extracted_text=crud.get_document_text(session, db_document) if include_text else None,
         quiz=db_document.quiz,
         total_flashcards=len(db_document.flashcards),
         has_quiz=(db_document.quiz is not None),
@@ -242,6 +424,31 @@ def get_document_flashcards(
     
     return crud.get_flashcards_by_document(session, document_id=document_id)
 
+def _cancel_generation_job(session: Session, document: models.Document) -> dict:
+    """
+    Cancela um job de geração: o documento volta ao status anterior (o deck
+    já existia, então não vira CANCELLED). Também recupera documentos presos
+    em PROCESSING por um worker que morreu no meio do job.
+    """
+    active_job = jobs.get_active_job(document.id)
+    restore_status = (
+        models.DocumentStatus(active_job["restore_status"]) if active_job
+        else models.DocumentStatus.COMPLETED
+    )
+    crud.release_document_from_generation(
+        session, document.id, restore_status, "Geração cancelada pelo usuário"
+    )
+    session.refresh(document)
+    progress_events.publish(document.id, progress_events.document_event(document))
+
+    # O job em execução vê a flag antes de salvar; se ainda estiver na fila, é descartado
+    cancellation.request_cancel(document.id)
+    if active_job:
+        celery_app.control.revoke(active_job["job_id"])
+        jobs.clear_active_job(document.id, active_job["job_id"])
+
+    return {"message": "Generation job cancelled successfully"}
+
 @router.post("/{document_id}/cancel")
 def cancel_document_processing(
     document_id: int,
@@ -254,11 +461,20 @@ def cancel_document_processing(
     
     if document.status != models.DocumentStatus.PROCESSING:
         raise HTTPException(status_code=400, detail="Document is not being processed")
+
+    if not document.can_cancel:
+        return _cancel_generation_job(session, document)
     
     document.status = models.DocumentStatus.CANCELLED
     document.current_step = "Processamento cancelado pelo usuário"
     session.add(document)
     session.commit()
+    progress_events.publish(document.id, progress_events.document_event(document))
+
+    # Para o trabalho em andamento: a task em execução vê a flag no próximo ponto
+    # de verificação; a revogação descarta execuções na fila e retentativas
+    cancellation.request_cancel(document.id)
+    celery_app.control.revoke(process_document_task_id(document.id))
     
     return {"message": "Document processing cancelled successfully"}
 
@@ -295,23 +511,99 @@ def move_document_to_folder(
         raise HTTPException(status_code=404, detail="Document or destination Folder not found")
     return db_document
 
-@router.post("/{document_id}/generate-quiz", response_model=schemas.Quiz, status_code=status.HTTP_201_CREATED)
+# As rotas de geração abaixo só validam o pedido e enfileiram um job no
+# Celery (202 + job_id); a chamada à IA roda no worker. O progresso aparece
+# nos mesmos campos do processamento (status, SSE) e o resultado em GET /jobs/{id}.
+
+def _enqueue_generation_job(
+    session: Session, db_document: models.Document, user_id: int, kind: str, count: int, difficulty: str
+) -> schemas.JobRead:
+    document_id = db_document.id
+    restore_status = db_document.status
+
+    # Marca o documento antes de enfileirar, para o app já ver o progresso.
+    # O UPDATE é condicional: de dois cliques simultâneos, só um enfileira.
+    step = "iniciando processamento"
+    if not crud.claim_document_for_generation(session, document_id, step):
+        raise HTTPException(status_code=409, detail="Este documento já está sendo processado.")
+    cancellation.clear_cancel(document_id)
+
+    try:
+        job_id = jobs.create_job(kind, document_id, user_id, restore_status.value)
+        generate_document_content.apply_async(
+            kwargs=dict(
+                document_id=document_id,
+                user_id=user_id,
+                kind=kind,
+                count=count,
+                difficulty=difficulty,
+                restore_status=restore_status.value
+            ),
+            task_id=job_id
+        )
+    except Exception as e:
+        # Sem fila (ou sem Redis) o job nunca rodaria: devolve o documento
+        print(f"❌ Falha ao enfileirar job para doc {document_id}: {e}")
+        crud.release_document_from_generation(
+            session, document_id, restore_status, "Não foi possível iniciar a geração"
+        )
+        raise HTTPException(status_code=503, detail="Não foi possível iniciar a geração. Tente novamente.")
+
+    session.refresh(db_document)
+    progress_events.publish(document_id, progress_events.document_event(db_document))
+
+    return schemas.JobRead(
+        job_id=job_id,
+        kind=kind,
+        document_id=document_id,
+        state="PENDING",
+        current_step=step,
+        processing_progress=0
+    )
+
+def _get_document_with_text(session: Session, current_user: models.User, document_id: int, detail: str) -> models.Document:
+    db_document = crud.get_document(session, document_id)
+    if not db_document or db_document.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+        
+    # Só verifica a existência: não carrega o texto extraído inteiro
+    has_text = db_document.content_hash is not None and session.exec(
+        select(exists().where(models.DocumentText.content_hash == db_document.content_hash))
+    ).one()
+    if not has_text:
+        raise HTTPException(status_code=400, detail=detail)
+
+    return db_document
+
+def _raise_if_generation_limit_reached(session: Session, current_user: models.User) -> None:
+    can_generate, remaining = crud.can_user_generate_deck(session, current_user)
+    
+    if not can_generate:
+        generation_info = crud.get_user_generation_info(session, current_user)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={
+                "message": "Limite diário de gerações atingido",
+                "limit": generation_info["limit"],
+                "used": generation_info["used"],
+                "hours_until_reset": generation_info["hours_until_reset"]
+            }
+        )
+
+@router.post("/{document_id}/generate-quiz", response_model=schemas.JobRead, status_code=status.HTTP_202_ACCEPTED)
 def generate_quiz_for_existing_document(
     document_id: int,
     current_user: CurrentUser,
     session: Session = Depends(get_session),
 ):
     """
-    Gera um quiz para um documento existente, com alternativas embaralhadas.
+    Enfileira a geração de um quiz para um documento existente, com alternativas embaralhadas.
     """
     # Verificações de limite omitidas para brevidade...
     
-    db_document = crud.get_document(session, document_id)
-    if not db_document or db_document.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Documento não encontrado")
-        
-    if not db_document.extracted_text:
-        raise HTTPException(status_code=400, detail="Documento não tem texto para gerar quiz.")
+    db_document = _get_document_with_text(
+        session, current_user, document_id, "Documento não tem texto para gerar quiz."
+    )
         
     if db_document.quiz:
         raise HTTPException(status_code=400, detail="Este documento já possui um quiz.")
@@ -319,54 +611,22 @@ def generate_quiz_for_existing_document(
     num_questions = 10
     difficulty = "Médio"
 
-    quiz_data_dict = generate_quiz_from_text(
-        text=db_document.extracted_text,
-        num_questions=num_questions,
-        difficulty=difficulty
+    return _enqueue_generation_job(
+        session, db_document, current_user.id, jobs.GENERATE_QUIZ, num_questions, difficulty
     )
 
-    if not quiz_data_dict:
-        raise HTTPException(status_code=500, detail="A IA não conseguiu gerar o quiz.")
-
-    # 🆕 EMBARALHAR AS ALTERNATIVAS ANTES DE CRIAR O QUIZ
-    quiz_data_dict = crud.shuffle_quiz_answers(quiz_data_dict)
-
-    quiz_schema = schemas.QuizCreate(**quiz_data_dict)
-    db_quiz = crud.create_quiz_for_document(
-        db=session, quiz_data=quiz_schema, document_id=document_id
-    )
-    
-    crud.increment_user_generation_count(session, current_user.id)
-    
-    return db_quiz
-
-@router.post("/{document_id}/generate-flashcards", response_model=List[models.Flashcard], status_code=status.HTTP_201_CREATED)
+@router.post("/{document_id}/generate-flashcards", response_model=schemas.JobRead, status_code=status.HTTP_202_ACCEPTED)
 def generate_flashcards_for_existing_document(
     document_id: int,
     current_user: CurrentUser,
     session: Session = Depends(get_session),
 ):
     # 🆕 VERIFICAR LIMITE ANTES DE GERAR
-    can_generate, remaining = crud.can_user_generate_deck(session, current_user)
+    _raise_if_generation_limit_reached(session, current_user)
     
-    if not can_generate:
-        generation_info = crud.get_user_generation_info(session, current_user)
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail={
-                "message": "Limite diário de gerações atingido",
-                "limit": generation_info["limit"],
-                "used": generation_info["used"],
-                "hours_until_reset": generation_info["hours_until_reset"]
-            }
-        )
-    
-    db_document = crud.get_document(session, document_id)
-    if not db_document or db_document.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Documento não encontrado")
-        
-    if not db_document.extracted_text:
-        raise HTTPException(status_code=400, detail="Documento não tem texto para gerar flashcards.")
+    db_document = _get_document_with_text(
+        session, current_user, document_id, "Documento não tem texto para gerar flashcards."
+    )
         
     if db_document.flashcards:
         raise HTTPException(status_code=400, detail="Este documento já possui flashcards.")
@@ -374,27 +634,11 @@ def generate_flashcards_for_existing_document(
     num_flashcards = 10
     difficulty = "Médio"
 
-    flashcards_data = generate_flashcards_from_text(
-        text=db_document.extracted_text,
-        num_flashcards=num_flashcards,
-        difficulty=difficulty
-    )
-
-    if not flashcards_data:
-        raise HTTPException(status_code=500, detail="A IA não conseguiu gerar os flashcards.")
-
-    db_flashcards = crud.create_flashcards_for_document(
-        session=session,
-        flashcards_data=flashcards_data,
-        document_id=document_id
+    return _enqueue_generation_job(
+        session, db_document, current_user.id, jobs.GENERATE_FLASHCARDS, num_flashcards, difficulty
     )
-    
-    # 🆕 INCREMENTAR CONTADOR APÓS SUCESSO
-    crud.increment_user_generation_count(session, current_user.id)
-    
-    return db_flashcards
 
-@router.post("/{document_id}/add-flashcards", response_model=List[models.Flashcard], status_code=status.HTTP_201_CREATED)
+@router.post("/{document_id}/add-flashcards", response_model=schemas.JobRead, status_code=status.HTTP_202_ACCEPTED)
 def add_more_flashcards(
     document_id: int,
     request: AddFlashcardsRequest,
@@ -402,28 +646,12 @@ def add_more_flashcards(
     session: Session = Depends(get_session),
 ):
     # 🆕 VERIFICAR LIMITE ANTES DE ADICIONAR
-    can_generate, remaining = crud.can_user_generate_deck(session, current_user)
-    
-    if not can_generate:
-        generation_info = crud.get_user_generation_info(session, current_user)
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail={
-                "message": "Limite diário de gerações atingido",
-                "limit": generation_info["limit"],
-                "used": generation_info["used"],
-                "hours_until_reset": generation_info["hours_until_reset"]
-            }
-        )
+    _raise_if_generation_limit_reached(session, current_user)
     
-    db_document = crud.get_document(session, document_id)
-    if not db_document or db_document.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Documento não encontrado")
-        
-    if not db_document.extracted_text:
-        raise HTTPException(status_code=400, detail="Documento não tem texto para gerar flashcards.")
+    db_document = _get_document_with_text(
+        session, current_user, document_id, "Documento não tem texto para gerar flashcards."
+    )
     
-    # Resto do código permanece igual...
     current_count = len(db_document.flashcards)
     max_flashcards = 20
     
@@ -442,49 +670,11 @@ def add_more_flashcards(
             detail=f"Você pode adicionar no máximo {available_slots} flashcards. Atualmente existem {current_count} de {max_flashcards}."
         )
 
-    existing_flashcards_text = [
-        f"Pergunta: {fc.front}\nResposta: {fc.back}" 
-        for fc in db_document.flashcards
-    ]
-    existing_content = "\n\n---\n\n".join(existing_flashcards_text)
-
-    enhanced_text = f"""
-IMPORTANTE: Você já gerou os seguintes flashcards para este conteúdo. NÃO REPITA NENHUM DELES:
-
-{existing_content}
-
----
-
-Agora, com base no MESMO CONTEÚDO ORIGINAL abaixo, gere {requested_count} NOVOS flashcards INÉDITOS que NÃO tenham sido abordados nos flashcards acima:
-
-{db_document.extracted_text}
-"""
-
-    try:
-        new_flashcards_data = generate_flashcards_from_text(
-            text=enhanced_text,
-            num_flashcards=requested_count,
-            difficulty=request.difficulty
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao gerar novos flashcards: {str(e)}")
-
-    if not new_flashcards_data:
-        raise HTTPException(status_code=500, detail="A IA não conseguiu gerar novos flashcards.")
-
-    db_flashcards = crud.create_flashcards_for_document(
-        session=session,
-        flashcards_data=new_flashcards_data,
-        document_id=document_id
+    return _enqueue_generation_job(
+        session, db_document, current_user.id, jobs.ADD_FLASHCARDS, requested_count, request.difficulty
     )
-    
-    # 🆕 INCREMENTAR CONTADOR APÓS SUCESSO
-    crud.increment_user_generation_count(session, current_user.id)
-    
-    return db_flashcards
-
 
-@router.post("/{document_id}/add-questions", response_model=schemas.Quiz, status_code=status.HTTP_201_CREATED)
+@router.post("/{document_id}/add-questions", response_model=schemas.JobRead, status_code=status.HTTP_202_ACCEPTED)
 def add_more_questions(
     document_id: int,
     request: AddQuestionsRequest,
@@ -492,16 +682,13 @@ def add_more_questions(
     session: Session = Depends(get_session),
 ):
     """
-    Adiciona mais perguntas a um quiz existente, com alternativas embaralhadas.
+    Enfileira novas perguntas para um quiz existente, com alternativas embaralhadas.
     """
     # Verificações de limite omitidas para brevidade...
     
-    db_document = crud.get_document(session, document_id)
-    if not db_document or db_document.user_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Documento não encontrado")
-        
-    if not db_document.extracted_text:
-        raise HTTPException(status_code=400, detail="Documento não tem texto para gerar quiz.")
+    db_document = _get_document_with_text(
+        session, current_user, document_id, "Documento não tem texto para gerar quiz."
+    )
     
     if not db_document.quiz:
         raise HTTPException(status_code=400, detail="Este documento não possui um quiz. Crie um primeiro.")
@@ -524,57 +711,6 @@ def add_more_questions(
             detail=f"Você pode adicionar no máximo {available_slots} perguntas. Atualmente existem {current_count} de {max_questions}."
         )
 
-    # Monta contexto com perguntas existentes
-    existing_questions_text = []
-    for question in db_document.quiz.questions:
-        answers_text = "\n".join([f"  - {ans.text}" for ans in question.answers])
-        existing_questions_text.append(
-            f"Pergunta: {question.text}\nAlternativas:\n{answers_text}"
-        )
-    
-    existing_content = "\n\n---\n\n".join(existing_questions_text)
-
-    enhanced_text = f"""
-IMPORTANTE: Você já gerou as seguintes perguntas para este conteúdo. NÃO REPITA NENHUMA DELAS:
-
-{existing_content}
-
----
-
-Agora, com base no MESMO CONTEÚDO ORIGINAL abaixo, gere {requested_count} NOVAS perguntas INÉDITAS que NÃO tenham sido abordadas no quiz acima:
-
-{db_document.extracted_text}
-"""
-
-    try:
-        new_quiz_data = generate_quiz_from_text(
-            text=enhanced_text,
-            num_questions=requested_count,
-            difficulty=request.difficulty
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erro ao gerar novas perguntas: {str(e)}")
-
-    if not new_quiz_data or 'questions' not in new_quiz_data:
-        raise HTTPException(status_code=500, detail="A IA não conseguiu gerar novas perguntas.")
-
-    # 🆕 EMBARALHAR AS ALTERNATIVAS DAS NOVAS PERGUNTAS
-    new_quiz_data = crud.shuffle_quiz_answers(new_quiz_data)
-
-    for question_data in new_quiz_data['questions']:
-        answers_to_create = [
-            models.Answer(**ans) for ans in question_data['answers']
-        ]
-        question_obj = models.Question(
-            text=question_data['text'],
-            answers=answers_to_create,
-            quiz_id=db_document.quiz.id
-        )
-        session.add(question_obj)
-    
-    session.commit()
-    session.refresh(db_document.quiz)
-    
-    crud.increment_user_generation_count(session, current_user.id)
-    
-    return db_document.quiz
\ No newline at end of file
+    return _enqueue_generation_job(
+        session, db_document, current_user.id, jobs.ADD_QUESTIONS, requested_count, request.difficulty
+    )
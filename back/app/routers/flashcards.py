@@ -1,16 +1,24 @@
 # app/routers/flashcards.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timezone
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
 from typing_extensions import Annotated
 from pydantic import BaseModel, Field
 
-from .. import crud, models, security, schemas 
-from ..database import get_session
-from ..ai_generator import chat_about_flashcard
+from .. import crud, models, security, schemas, text_index
+from ..database import engine, get_session
+from ..ai_generator import achat_about_flashcard, astream_chat_about_flashcard
+from ..sse import SSE_HEADERS, format_sse
 
 router = APIRouter(prefix="/flashcards", tags=["Flashcards"])
 CurrentUser = Annotated[models.User, Depends(security.get_current_user)]
 
+# Mensagens anteriores carregadas como contexto do chat
+CHAT_HISTORY_LIMIT = 10
+
 # --- Modelos Pydantic para a rota ---
 
 class ChatMessage(BaseModel):
@@ -25,36 +33,117 @@ class StudyLogInput(BaseModel):
     # O valor que virá do frontend (0.0 para Errei, 0.5 para Quase, 1.0 para Acertei)
     accuracy: float = Field(ge=0.0, le=1.0)
 
+class StudyLogBatchItem(BaseModel):
+    flashcard_id: int
+    accuracy: float = Field(ge=0.0, le=1.0)
+    studied_at: datetime
+    # Identificador único do evento gerado pelo app (idempotência no replay)
+    client_event_id: Optional[str] = Field(default=None, max_length=64)
+
+class StudyLogBatchInput(BaseModel):
+    events: List[StudyLogBatchItem] = Field(max_length=5000)
+
+class StudyLogBatchResponse(BaseModel):
+    received: int
+    inserted: int
+    duplicates: int
+    rejected_flashcard_ids: List[int]
+
 # --- Rotas existentes (mantidas) ---
 
-@router.post("/{flashcard_id}/chat", response_model=ChatResponse)
-def chat_with_flashcard(
-    flashcard_id: int,
-    chat_message: ChatMessage,
+@router.post("/log_study/batch", response_model=StudyLogBatchResponse, status_code=201)
+def log_study_batch(
+    batch: StudyLogBatchInput,
     current_user: CurrentUser,
     session: Session = Depends(get_session)
 ):
-    """Chat contextual sobre um flashcard específico."""
+    """
+    Regista em lote os eventos de estudo da fila offline do app.
+    A posse dos flashcards é validada com uma única query; eventos de
+    flashcards inexistentes ou de outro usuário são rejeitados (e reportados)
+    sem bloquear o restante do lote. Eventos repetidos (mesmo client_event_id)
+    são ignorados.
+    """
+    flashcard_ids = list({event.flashcard_id for event in batch.events})
+    flashcard_documents = crud.get_owned_flashcard_documents(
+        session, flashcard_ids=flashcard_ids, user_id=current_user.id
+    )
+
+    valid_events = []
+    for event in batch.events:
+        if event.flashcard_id not in flashcard_documents:
+            continue
+        studied_at = event.studied_at
+        if studied_at.tzinfo is None:
+            studied_at = studied_at.replace(tzinfo=timezone.utc)
+        valid_events.append({
+            "flashcard_id": event.flashcard_id,
+            "accuracy": event.accuracy,
+            "studied_at": studied_at,
+            "client_event_id": event.client_event_id,
+        })
+
+    inserted = crud.create_study_logs_batch(
+        session,
+        user_id=current_user.id,
+        events=valid_events,
+        flashcard_documents=flashcard_documents
+    )
+
+    return StudyLogBatchResponse(
+        received=len(batch.events),
+        inserted=inserted,
+        duplicates=len(valid_events) - inserted,
+        rejected_flashcard_ids=sorted(set(flashcard_ids) - set(flashcard_documents)),
+    )
+
+def _load_chat_context(session: Session, flashcard_id: int, user_id: int, message: str) -> dict:
     # 🔽 ALTERAÇÃO: Usar a nova função `get_flashcard` que já valida o dono 🔽
-    flashcard = crud.get_flashcard(session, flashcard_id, user_id=current_user.id)
+    flashcard = crud.get_flashcard(session, flashcard_id, user_id=user_id)
     if not flashcard:
         raise HTTPException(status_code=404, detail="Flashcard não encontrado ou acesso negado")
 
-    previous_conversations = crud.get_flashcard_conversations(session, flashcard_id)
+    previous_conversations = crud.get_flashcard_conversations(
+        session, flashcard_id, limit=CHAT_HISTORY_LIMIT
+    )
     conversation_history = [
         {"user": conv.user_message, "assistant": conv.assistant_response}
-        for conv in previous_conversations[-10:]
+        for conv in previous_conversations
     ]
-    
-    ai_response = chat_about_flashcard(
-        message=chat_message.message,
+
+    # Só os trechos do documento relevantes para o card e para a pergunta
+    document_text = crud.get_document_text(session, flashcard.document)
+    index = crud.get_document_text_index(session, flashcard.document, document_text) if document_text else None
+    document_context = text_index.retrieve_context(
+        index, document_text, f"{flashcard.front}\n{flashcard.back}\n{message}"
+    ) if index else ""
+
+    return dict(
         flashcard_front=flashcard.front,
         flashcard_back=flashcard.back,
-        document_context=flashcard.document.extracted_text or "",
-        conversation_history=conversation_history
+        document_context=document_context,
+        conversation_history=conversation_history,
     )
+
+@router.post("/{flashcard_id}/chat", response_model=ChatResponse)
+async def chat_with_flashcard(
+    flashcard_id: int,
+    chat_message: ChatMessage,
+    current_user: CurrentUser,
+    session: Session = Depends(get_session)
+):
+    """
+    Chat contextual sobre um flashcard específico. O banco é acessado no
+    threadpool e a resposta do modelo é aguardada sem ocupar uma thread.
+    """
+    context = await run_in_threadpool(
+        _load_chat_context, session, flashcard_id, current_user.id, chat_message.message
+    )
+    
+    ai_response = await achat_about_flashcard(message=chat_message.message, **context)
     
-    conversation = crud.create_flashcard_conversation(
+    conversation = await run_in_threadpool(
+        crud.create_flashcard_conversation,
         session=session,
         flashcard_id=flashcard_id,
         user_message=chat_message.message,
@@ -63,19 +152,91 @@ def chat_with_flashcard(
     
     return ChatResponse(response=ai_response, conversation_id=conversation.id)
 
+def _save_streamed_conversation(flashcard_id: int, user_message: str, assistant_response: str) -> models.FlashcardConversation:
+    # A sessão da requisição já foi fechada quando o stream termina
+    with Session(engine) as session:
+        return crud.create_flashcard_conversation(
+            session=session,
+            flashcard_id=flashcard_id,
+            user_message=user_message,
+            assistant_response=assistant_response
+        )
+
+@router.post("/{flashcard_id}/chat/stream")
+async def stream_chat_with_flashcard(
+    flashcard_id: int,
+    chat_message: ChatMessage,
+    current_user: CurrentUser,
+    session: Session = Depends(get_session)
+):
+    """
+    Versão em streaming do chat (Server-Sent Events): eventos "token" com os
+    trechos da resposta conforme chegam do modelo e, ao final, "done" com a
+    resposta completa e o conversation_id. A conversa só é gravada quando o
+    stream termina; em caso de erro é enviado "error" e nada é gravado.
+    """
+    context = await run_in_threadpool(
+        _load_chat_context, session, flashcard_id, current_user.id, chat_message.message
+    )
+    # A conexão do banco não é necessária durante o stream
+    session.close()
+
+    async def event_stream():
+        pieces = []
+        try:
+            async for piece in astream_chat_about_flashcard(message=chat_message.message, **context):
+                pieces.append(piece)
+                yield format_sse("token", {"text": piece})
+        except Exception as e:
+            yield format_sse("error", {"detail": f"Desculpe, ocorreu um erro ao processar sua pergunta: {e}"})
+            return
+
+        ai_response = "".join(pieces).strip()
+        conversation = await run_in_threadpool(
+            _save_streamed_conversation, flashcard_id, chat_message.message, ai_response
+        )
+        yield format_sse("done", {"response": ai_response, "conversation_id": conversation.id})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
 
 @router.get("/{flashcard_id}/conversations", response_model=list[models.FlashcardConversation])
 def get_flashcard_chat_history(
     flashcard_id: int,
     current_user: CurrentUser,
-    session: Session = Depends(get_session)
+    session: Session = Depends(get_session),
+    limit: Optional[int] = Query(default=None, ge=1, le=100),
+    before_created_at: Optional[datetime] = Query(default=None),
+    before_id: Optional[int] = Query(default=None),
 ):
-    """Recupera o histórico de conversas de um flashcard."""
+    """
+    Recupera o histórico de conversas de um flashcard, em ordem cronológica.
+    Paginação por keyset: com `limit`, retorna as mensagens mais recentes;
+    para a página anterior, envie o `created_at` e o `id` da primeira
+    (mais antiga) mensagem recebida em `before_created_at` e `before_id`.
+    Sem `limit`, retorna o histórico completo.
+    """
+    if (before_created_at is None) != (before_id is None):
+        raise HTTPException(
+            status_code=400,
+            detail="Informe before_created_at e before_id juntos para paginar."
+        )
+
     flashcard = crud.get_flashcard(session, flashcard_id, user_id=current_user.id)
     if not flashcard:
         raise HTTPException(status_code=404, detail="Flashcard não encontrado ou acesso negado")
     
-    return crud.get_flashcard_conversations(session, flashcard_id)
+    return crud.get_flashcard_conversations(
+        session,
+        flashcard_id,
+        limit=limit,
+        before_created_at=before_created_at,
+        before_id=before_id,
+    )
 
 
 @router.get("/{flashcard_id}", response_model=models.Flashcard)
@@ -113,7 +274,8 @@ def log_study_session(
         session=session,
         user_id=current_user.id,
         flashcard_id=flashcard_id,
-        accuracy=study_input.accuracy
+        accuracy=study_input.accuracy,
+        document_id=db_flashcard.document_id
     )
     return study_log
 
@@ -26,33 +26,25 @@ def get_library_data(
     e os decks que estão na raiz (sem pasta).
     """
     folders_from_db = crud.get_folders_by_user(db=db, user_id=current_user.id)
-    root_docs_from_db = crud.get_documents_by_user(session=db, user_id=current_user.id, in_folder=False)
-    
-    def to_card_data(doc: models.Document) -> schemas.DocumentCardData:
-        total_flashcards = len(doc.flashcards)
-        studied_flashcards = crud.get_studied_flashcards_count(session=db, document_id=doc.id)
-        return schemas.DocumentCardData(
-            id=doc.id,
-            file_path=doc.file_path,
-            status=doc.status,
-            created_at=doc.created_at,
-            total_flashcards=total_flashcards,
-            studied_flashcards=studied_flashcards,
-            folder_id=doc.folder_id,
-            has_quiz=doc.quiz is not None,  # ✅ ADICIONE ESTA LINHA!
-        )
+    # Uma única query agregada para todos os decks do usuário (sem N+1 por deck)
+    all_cards = crud.get_document_cards_for_user(session=db, user_id=current_user.id)
 
-    root_documents_data = [to_card_data(doc) for doc in root_docs_from_db]
+    root_documents_data = []
+    cards_by_folder: dict[int, List[schemas.DocumentCardData]] = {}
+    for card in all_cards:
+        if card.folder_id is None:
+            root_documents_data.append(card)
+        else:
+            cards_by_folder.setdefault(card.folder_id, []).append(card)
 
-    folders_data = []
-    for folder in folders_from_db:
-        docs_in_folder_data = [to_card_data(doc) for doc in folder.documents]
-        folder_data = schemas.FolderReadWithDocuments(
+    folders_data = [
+        schemas.FolderReadWithDocuments(
             id=folder.id,
             name=folder.name,
-            documents=docs_in_folder_data
+            documents=cards_by_folder.get(folder.id, [])
         )
-        folders_data.append(folder_data)
+        for folder in folders_from_db
+    ]
 
     return LibraryResponse(folders=folders_data, root_documents=root_documents_data)
 
@@ -71,21 +63,9 @@ def get_folder_details(
     if not folder:
         raise HTTPException(status_code=404, detail="Pasta não encontrada")
 
-    def to_card_data(doc: models.Document) -> schemas.DocumentCardData:
-        total_flashcards = len(doc.flashcards)
-        studied_flashcards = crud.get_studied_flashcards_count(session=db, document_id=doc.id)
-        return schemas.DocumentCardData(
-            id=doc.id,
-            file_path=doc.file_path,
-            status=doc.status,
-            created_at=doc.created_at,
-            total_flashcards=total_flashcards,
-            studied_flashcards=studied_flashcards,
-            folder_id=doc.folder_id,
-            has_quiz=doc.quiz is not None,  # ✅ ADICIONE ESTA LINHA!
-        )
-    
-    docs_in_folder_data = [to_card_data(doc) for doc in folder.documents]
+    docs_in_folder_data = crud.get_document_cards_for_user(
+        session=db, user_id=current_user.id, folder_id=folder.id
+    )
 
     return schemas.FolderReadWithDocuments(
         id=folder.id,
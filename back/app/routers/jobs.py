@@ -0,0 +1,41 @@
+# back/app/routers/jobs.py
+
+from celery.result import AsyncResult
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session
+from typing_extensions import Annotated
+
+from .. import crud, models, security, schemas, jobs
+from ..database import get_session
+from ..worker import celery_app
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+CurrentUser = Annotated[models.User, Depends(security.get_current_user)]
+
+@router.get("/{job_id}", response_model=schemas.JobRead)
+def get_job_status(
+    job_id: str,
+    current_user: CurrentUser,
+    session: Session = Depends(get_session),
+):
+    """
+    Estado de um job de geração: o estado da task no Celery, o progresso
+    atual do documento e, ao terminar, o resultado (IDs criados) ou o erro.
+    """
+    job = jobs.get_job(job_id)
+    if not job or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+
+    task_result = AsyncResult(job_id, app=celery_app)
+    doc_status = crud.get_document_status(session, job["document_id"], current_user.id)
+
+    return schemas.JobRead(
+        job_id=job_id,
+        kind=job["kind"],
+        document_id=job["document_id"],
+        state=task_result.state,
+        current_step=doc_status.current_step if doc_status else None,
+        processing_progress=doc_status.processing_progress if doc_status else 0,
+        result=task_result.result if task_result.successful() else None,
+        error=str(task_result.result) if task_result.failed() else None,
+    )
@@ -34,51 +34,46 @@ def get_progress_stats(
     user_timezone_delta = timedelta(minutes=-utc_offset_minutes)
     user_now = datetime.now(timezone.utc) + user_timezone_delta
 
-    # --- ESTATÍSTICAS DE FLASHCARDS ---
-    study_logs = crud.get_study_logs_for_user(session, user_id=current_user.id)
-    local_study_log_times = [(log.studied_at + user_timezone_delta) for log in study_logs]
+    user_today_date = user_now.date()
+    one_week_ago_date = user_today_date - timedelta(days=7)
 
-    one_week_ago_date = user_now.date() - timedelta(days=7)
-    cards_studied_week = sum(1 for log_time in local_study_log_times if log_time.date() > one_week_ago_date)
+    # --- ESTATÍSTICAS DE FLASHCARDS (agregadas no banco) ---
+    study_counts_by_day = crud.get_study_counts_by_local_date(
+        session, user_id=current_user.id,
+        user_timezone_delta=user_timezone_delta, after_date=one_week_ago_date
+    )
+    cards_studied_week = sum(study_counts_by_day.values())
 
     flashcard_weekly_activity = [0] * 7
-    start_of_week = user_now.date() - timedelta(days=6)
+    start_of_week = user_today_date - timedelta(days=6)
     for day_offset in range(7):
         current_day_local = start_of_week + timedelta(days=day_offset)
-        day_index = current_day_local.weekday()
-        count = sum(1 for log_time in local_study_log_times if log_time.date() == current_day_local)
-        flashcard_weekly_activity[day_index] = count
+        flashcard_weekly_activity[current_day_local.weekday()] = study_counts_by_day.get(current_day_local, 0)
+
+    # Totais de toda a vida vêm do resumo diário materializado
+    activity_totals = crud.get_user_activity_totals(session, user_id=current_user.id)
 
     flashcard_accuracy = 0.0
-    if study_logs:
-        total_accuracy_score = sum(log.accuracy for log in study_logs)
-        average_accuracy_ratio = total_accuracy_score / len(study_logs)
+    if activity_totals["cards_studied"] > 0:
+        average_accuracy_ratio = activity_totals["accuracy_sum"] / activity_totals["cards_studied"]
         flashcard_accuracy = round(average_accuracy_ratio * 100, 1)
 
     streak_days = 0
-    if local_study_log_times:
-        study_dates = sorted(list(set(log_time.date() for log_time in local_study_log_times)), reverse=True)
-        user_today_date = user_now.date()
-        
-        if study_dates[0] >= user_today_date - timedelta(days=1):
-            streak_days = 1
-            for i in range(len(study_dates) - 1):
-                if (study_dates[i] - study_dates[i+1]).days == 1:
-                    streak_days += 1
-                else:
-                    break
-    
-    # --- ESTATÍSTICAS DE QUIZZES (CORRIGIDO) ---
-    quiz_attempts = crud.get_quiz_attempts_for_user(session, user_id=current_user.id)
-    # ✅ USAR completed_at EM VEZ DE created_at
-    local_quiz_attempt_times = [(qa.completed_at + user_timezone_delta) for qa in quiz_attempts]
-    
-    quizzes_completed_week = sum(1 for attempt_time in local_quiz_attempt_times if attempt_time.date() > one_week_ago_date)
-    
+    latest_study_date, latest_streak = crud.get_latest_study_streak(
+        session, user_id=current_user.id, user_timezone_delta=user_timezone_delta
+    )
+    if latest_study_date and latest_study_date >= user_today_date - timedelta(days=1):
+        streak_days = latest_streak
+
+    # --- ESTATÍSTICAS DE QUIZZES ---
+    quizzes_completed_week = crud.count_quiz_attempts_after_local_date(
+        session, user_id=current_user.id,
+        user_timezone_delta=user_timezone_delta, after_date=one_week_ago_date
+    )
+
     quiz_average_score = 0.0
-    if quiz_attempts:
-        total_score = sum(qa.score for qa in quiz_attempts)
-        quiz_average_score = round(total_score / len(quiz_attempts), 1)
+    if activity_totals["quizzes_completed"] > 0:
+        quiz_average_score = round(activity_totals["quiz_score_sum"] / activity_totals["quizzes_completed"], 1)
 
     return ProgressStats(
         cards_studied_week=cards_studied_week,
@@ -87,4 +82,17 @@ def get_progress_stats(
         flashcard_weekly_activity=flashcard_weekly_activity,
         quizzes_completed_week=quizzes_completed_week,
         quiz_average_score=quiz_average_score,
-    )
\ No newline at end of file
+    )
+
+@router.get("/review-flashcards", response_model=List[models.Flashcard])
+def get_review_flashcards(
+    current_user: CurrentUser,
+    session: Session = Depends(get_session),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """
+    Retorna os flashcards cuja revisão (repetição espaçada SM-2) está vencida,
+    do mais atrasado para o mais recente, completando com flashcards ainda
+    não estudados.
+    """
+    return crud.get_due_flashcards(session, user_id=current_user.id, limit=limit)
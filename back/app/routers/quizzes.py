@@ -90,16 +90,13 @@ def submit_quiz_attempt(
     if not quiz or quiz.document.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quiz não encontrado.")
     
-    quiz_attempt = models.QuizAttempt(
+    crud.create_quiz_attempt(
+        session=session,
+        quiz=quiz,
+        user_id=current_user.id,
         score=request.score,
         correct_answers=request.correct_answers,
-        total_questions=request.total_questions,
-        quiz_id=quiz_id,
-        user_id=current_user.id
+        total_questions=request.total_questions
     )
     
-    session.add(quiz_attempt)
-    session.commit()
-    session.refresh(quiz_attempt)
-    
     return {"message": "Resultado do quiz guardado com sucesso."}
\ No newline at end of file
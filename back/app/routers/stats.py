@@ -5,7 +5,7 @@ from sqlmodel import Session, select, func
 from typing_extensions import Annotated
 from typing import List, Optional
 
-from .. import models, security
+from .. import crud, models, security
 from ..database import get_session
 
 router = APIRouter(prefix="/stats", tags=["Stats"])
@@ -39,26 +39,15 @@ def get_document_stats(
     if not document or document.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Documento não encontrado.")
 
-    # --- CORREÇÃO APLICADA AQUI ---
-    # A lógica foi reescrita para usar o modelo 'StudyLog' em vez de um modelo inexistente.
-    
-    total_flashcards = len(document.flashcards)
+    total_flashcards = session.exec(
+        select(func.count(models.Flashcard.id))
+        .where(models.Flashcard.document_id == document_id)
+    ).one()
 
-    # Obter os IDs de todos os flashcards do documento
-    flashcard_ids = [fc.id for fc in document.flashcards if fc.id is not None]
-    
-    studied_flashcards_count = 0
-    if flashcard_ids:
-        # Contar quantos flashcards distintos foram estudados pelo utilizador para este deck
-        studied_flashcards_count = session.exec(
-            select(func.count(func.distinct(models.StudyLog.flashcard_id)))
-            .where(
-                models.StudyLog.user_id == current_user.id,
-                models.StudyLog.flashcard_id.in_(flashcard_ids)
-            )
-        ).one()
+    # Resumo materializado, mantido a cada registo de estudo/tentativa de quiz
+    deck_progress = crud.get_deck_progress(session, user_id=current_user.id, document_id=document_id)
 
-    known_flashcards = studied_flashcards_count
+    known_flashcards = deck_progress.studied_flashcards if deck_progress else 0
     learning_flashcards = total_flashcards - known_flashcards
     flashcard_progress = (known_flashcards / total_flashcards) * 100 if total_flashcards > 0 else 0
 
@@ -69,23 +58,17 @@ def get_document_stats(
         progress_percentage=round(flashcard_progress, 2)
     )
 
-    # Estatísticas do Quiz (lógica existente mantida)
     quiz_stats = None
-    if document.quiz:
-        statement = select(models.QuizAttempt).where(
-            models.QuizAttempt.quiz_id == document.quiz.id,
-            models.QuizAttempt.user_id == current_user.id
-        ).order_by(models.QuizAttempt.completed_at.desc())
-        
-        attempts = session.exec(statement).all()
-        
-        total_attempts = len(attempts)
-        last_score = attempts[0].score if total_attempts > 0 else None
-        
+    has_quiz = session.exec(
+        select(models.Quiz.id).where(models.Quiz.document_id == document_id)
+    ).first() is not None
+    if has_quiz:
+        total_attempts = deck_progress.quiz_attempts if deck_progress else 0
+        last_score = deck_progress.last_quiz_score if total_attempts > 0 else None
+
         average_score = None
         if total_attempts > 0:
-            total_score = sum(attempt.score for attempt in attempts)
-            average_score = round(total_score / total_attempts, 2)
+            average_score = round(deck_progress.quiz_score_sum / total_attempts, 2)
 
         quiz_stats = QuizStatSummary(
             last_score=last_score,
@@ -2,7 +2,7 @@
 
 from sqlmodel import SQLModel
 from .models import DocumentStatus, AuthProvider
-from typing import List, Optional
+from typing import Any, List, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
 
@@ -105,6 +105,26 @@ class DocumentDetail(BaseModel):
     class Config:
         from_attributes = True
 
+# Resposta leve para o polling de progresso (sem texto, flashcards ou quiz)
+class DocumentStatusRead(BaseModel):
+    id: int
+    status: DocumentStatus
+    current_step: Optional[str] = None
+    processing_progress: int = 0
+    can_cancel: bool = True
+
+# Job de geração sob demanda (state é o estado da task no Celery:
+# PENDING, STARTED, SUCCESS ou FAILURE); o progresso vem do documento
+class JobRead(BaseModel):
+    job_id: str
+    kind: str
+    document_id: int
+    state: str
+    current_step: Optional[str] = None
+    processing_progress: int = 0
+    result: Optional[dict[str, Any]] = None
+    error: Optional[str] = None
+
 class DocumentCardData(SQLModel):
     id: int
     file_path: str
@@ -0,0 +1,51 @@
+# app/spaced_repetition.py
+"""
+Agendador de repetição espaçada (SM-2) usado pelo registo de estudo.
+
+A nota do SM-2 (0-5) é derivada do `accuracy` enviado pelo app:
+0.0 (Errei) -> 0, 0.5 (Quase) -> 3, 1.0 (Acertei) -> 5.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+DEFAULT_EASE_FACTOR = 2.5
+MIN_EASE_FACTOR = 1.3
+PASSING_QUALITY = 3
+
+@dataclass
+class ReviewState:
+    ease_factor: float = DEFAULT_EASE_FACTOR
+    interval_days: int = 0
+    repetitions: int = 0
+    due_at: Optional[datetime] = None
+
+def accuracy_to_quality(accuracy: float) -> int:
+    """Converte o accuracy (0.0 a 1.0) para a nota SM-2 (0 a 5), arredondando meio para cima."""
+    return max(0, min(5, int(accuracy * 5 + 0.5)))
+
+def schedule_review(state: ReviewState, accuracy: float, reviewed_at: datetime) -> ReviewState:
+    """Aplica uma revisão ao estado atual e retorna o novo estado (SM-2)."""
+    quality = accuracy_to_quality(accuracy)
+
+    if quality < PASSING_QUALITY:
+        repetitions = 0
+        interval_days = 1
+    else:
+        repetitions = state.repetitions + 1
+        if repetitions == 1:
+            interval_days = 1
+        elif repetitions == 2:
+            interval_days = 6
+        else:
+            interval_days = max(1, round(state.interval_days * state.ease_factor))
+
+    ease_factor = state.ease_factor + (0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    ease_factor = max(MIN_EASE_FACTOR, ease_factor)
+
+    return ReviewState(
+        ease_factor=ease_factor,
+        interval_days=interval_days,
+        repetitions=repetitions,
+        due_at=reviewed_at + timedelta(days=interval_days),
+    )
@@ -0,0 +1,8 @@
+# app/sse.py
+import json
+
+# Cabeçalhos para que proxies não façam buffer dos eventos
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
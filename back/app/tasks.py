@@ -1,20 +1,36 @@
 # back/app/tasks.py
 
 import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pathlib import Path
 from sqlmodel import Session, select  # ✅ ADICIONAR select aqui
 from .worker import celery_app
 from .database import engine
-from . import crud, models, schemas
-from .text_extractor import extract_text_from_pdf, extract_text_from_image
+from . import crud, models, schemas, jobs
+from .progress_reporter import ProgressReporter
+from .cancellation import CancellationToken, DocumentCancelled
+from .text_extractor import extract_text_from_pdf, extract_text_from_image, file_sha256
 from .ai_generator import generate_flashcards_from_text, generate_quiz_from_text
 from .email_service import email_service
 from datetime import datetime, timedelta, timezone
 import asyncio
 
+def process_document_task_id(document_id: int) -> str:
+    """ID fixo da task de um documento, para que o cancelamento possa revogá-la."""
+    return f"process_document:{document_id}"
+
+def _wait_for_result(future, cancel_token: CancellationToken):
+    """Espera o resultado da IA, verificando o cancelamento enquanto isso."""
+    while True:
+        try:
+            return future.result(timeout=cancel_token.poll_interval)
+        except FutureTimeoutError:
+            cancel_token.raise_if_cancelled()
+
 @celery_app.task(
     bind=True,
     autoretry_for=(Exception,),
+    dont_autoretry_for=(DocumentCancelled,),
     max_retries=3,
     default_retry_delay=60
 )
@@ -38,22 +54,23 @@ def process_document(
             print(f"[TASK] Processamento para o documento {document_id} foi cancelado.")
             return
 
+        # Agrupa as gravações de passo no banco (os eventos SSE saem todos)
+        progress = ProgressReporter(session, db_document)
+        cancel_token = CancellationToken(document_id)
+
         try:
             # --- PASSO 1: EXTRAÇÃO DE TEXTO ---
-            db_document.current_step = "iniciando processamento"
-            session.add(db_document)
-            session.commit()
-            print(f"[TASK] Doc {document_id} - Passo: {db_document.current_step}")
+            progress.step("iniciando processamento")
 
-            extracted_text = db_document.extracted_text
+            # O texto é compartilhado pelo hash do conteúdo: se o mesmo arquivo
+            # já foi processado (por qualquer usuário), pula a extração.
+            extracted_text = crud.get_document_text(session, db_document)
 
             if not extracted_text:
-                db_document.current_step = "extraindo texto"
-                session.add(db_document)
-                session.commit()
-                print(f"[TASK] Doc {document_id} - Passo: {db_document.current_step}")
+                progress.step("extraindo texto", persist=True)
                 
-                file_path = Path(db_document.file_path)
+                blob = session.get(models.DocumentBlob, db_document.content_hash) if db_document.content_hash else None
+                file_path = Path(blob.storage_path if blob and blob.storage_path else db_document.file_path)
                 
                 if file_path.suffix.lower() == ".pdf":
                     extracted_text = extract_text_from_pdf(str(file_path))
@@ -65,57 +82,75 @@ def process_document(
                 if not extracted_text or not extracted_text.strip():
                     raise ValueError("Nenhum texto pôde ser extraído do ficheiro.")
                 
-                db_document.extracted_text = extracted_text
-                session.add(db_document)
+                if blob is None:
+                    # Documento antigo, sem hash: registra o conteúdo agora
+                    blob = crud.get_or_create_document_blob(
+                        session, content_hash=file_sha256(str(file_path)),
+                        size_bytes=file_path.stat().st_size, storage_path=str(file_path)
+                    )
+                    db_document.content_hash = blob.content_hash
+                    session.add(db_document)
+                crud.store_document_text(session, blob.content_hash, extracted_text)
                 session.commit()
 
+            cancel_token.raise_if_cancelled()
+
             # --- PASSO 2: GERAÇÃO DE CONTEÚDO COM IA ---
+            # Flashcards e quiz são chamadas independentes (limitadas pela rede):
+            # as duas são disparadas juntas e o tempo total fica próximo ao da
+            # mais lenta. Os passos reportados seguem a mesma sequência de antes
+            # (o app compara current_step com palavras-chave). A sessão do banco
+            # só é usada nesta thread.
             flashcards_data = None
             quiz_data_dict = None
+            wants_flashcards = content_type in ["flashcards", "both"]
+            wants_quiz = content_type in ["quiz", "both"]
 
-            if content_type in ["flashcards", "both"]:
-                db_document.current_step = "gerando flashcards com ia"
-                session.add(db_document)
-                session.commit()
-                print(f"[TASK] Doc {document_id} - Passo: {db_document.current_step}")
-                
-                flashcards_data = generate_flashcards_from_text(
-                    text=extracted_text, num_flashcards=num_flashcards, difficulty=difficulty
-                )
-                
-                db_document.current_step = "parsing flashcards"
-                session.add(db_document)
-                session.commit()
-                print(f"[TASK] Doc {document_id} - Passo: {db_document.current_step}")
-                
-                db_document.current_step = "salvando flashcards"
-                session.add(db_document)
-                session.commit()
-                print(f"[TASK] Doc {document_id} - Passo: {db_document.current_step}")
-                
-            if content_type in ["quiz", "both"]:
-                db_document.current_step = "gerando quiz com ia"
-                session.add(db_document)
-                session.commit()
-                print(f"[TASK] Doc {document_id} - Passo: {db_document.current_step}")
-                
-                quiz_data_dict = generate_quiz_from_text(
-                    text=extracted_text, num_questions=num_questions, difficulty=difficulty
-                )
-                
-                # 🆕 EMBARALHAR AS ALTERNATIVAS ANTES DE SALVAR
-                if quiz_data_dict:
-                    quiz_data_dict = crud.shuffle_quiz_answers(quiz_data_dict)
-                
-                db_document.current_step = "parsing quiz"
-                session.add(db_document)
-                session.commit()
-                print(f"[TASK] Doc {document_id} - Passo: {db_document.current_step}")
-                
-                db_document.current_step = "salvando quiz"
-                session.add(db_document)
-                session.commit()
-                print(f"[TASK] Doc {document_id} - Passo: {db_document.current_step}")
+            # Em caso de cancelamento, o executor é liberado sem esperar: trechos
+            # ainda não iniciados não chamam a IA e a task termina na hora.
+            executor = ThreadPoolExecutor(max_workers=2)
+            try:
+                flashcards_future = executor.submit(
+                    generate_flashcards_from_text,
+                    text=extracted_text, num_flashcards=num_flashcards, difficulty=difficulty,
+                    should_stop=cancel_token.is_cancelled
+                ) if wants_flashcards else None
+                quiz_future = executor.submit(
+                    generate_quiz_from_text,
+                    text=extracted_text, num_questions=num_questions, difficulty=difficulty,
+                    should_stop=cancel_token.is_cancelled
+                ) if wants_quiz else None
+
+                if flashcards_future:
+                    progress.step("gerando flashcards com ia", persist=True)
+
+                    flashcards_data = _wait_for_result(flashcards_future, cancel_token)
+
+                    progress.step("parsing flashcards")
+                    
+                    progress.step("salvando flashcards")
+                    
+                if quiz_future:
+                    progress.step("gerando quiz com ia", persist=True)
+                    
+                    quiz_data_dict = _wait_for_result(quiz_future, cancel_token)
+                    
+                    # 🆕 EMBARALHAR AS ALTERNATIVAS ANTES DE SALVAR
+                    if quiz_data_dict:
+                        quiz_data_dict = crud.shuffle_quiz_answers(quiz_data_dict)
+                    
+                    progress.step("parsing quiz")
+                    
+                    progress.step("salvando quiz")
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+            # Último ponto de verificação: consulta também o banco, para nunca
+            # salvar como concluído um documento já cancelado
+            cancel_token.raise_if_cancelled()
+            current = crud.get_document_status(session, document_id, db_document.user_id)
+            if current is None or current.status == models.DocumentStatus.CANCELLED:
+                raise DocumentCancelled(f"Processamento do documento {document_id} cancelado.")
 
             if not flashcards_data and not quiz_data_dict:
                 raise ValueError("A IA não retornou nenhum conteúdo válido.")
@@ -135,35 +170,178 @@ def process_document(
                 )
                 success_parts.append("1 quiz")
 
-            db_document.status = models.DocumentStatus.COMPLETED
-            db_document.current_step = "concluído"
-            db_document.processing_progress = 100
-            session.add(db_document)
-            session.commit()
+            progress.finish(models.DocumentStatus.COMPLETED, "concluído", progress=100)
             
             # 🆕 INCREMENTAR CONTADOR APENAS QUANDO GERAÇÃO FOR BEM-SUCEDIDA
             crud.increment_user_generation_count(session, db_document.user_id)
             
-            print(f"[TASK] Doc {document_id} - Passo: {db_document.current_step}")
             print(f"[TASK] Documento {document_id} processado com sucesso.")
             print(f"[TASK] ✅ Contador de gerações incrementado para usuário {db_document.user_id}")
 
+        except DocumentCancelled:
+            # O endpoint de cancelamento já gravou o status; só descarta o trabalho
+            session.rollback()
+            print(f"[TASK] Processamento para o documento {document_id} foi cancelado durante a execução.")
+            return
+
         except Exception as e:
             session.rollback()
             error_message = f"Erro: {str(e)}"
             if self.request.retries >= self.max_retries:
                 final_error = f"Falha final após {self.max_retries + 1} tentativas. {error_message}"
-                db_document.status = models.DocumentStatus.FAILED
-                db_document.current_step = final_error
+                progress.finish(models.DocumentStatus.FAILED, final_error)
                 print(f"[TASK] Tarefa para doc {document_id} FALHOU PERMANENTEMENTE: {traceback.format_exc()}")
             else:
                 retry_count = self.request.retries + 1
-                db_document.current_step = f"Tentativa {retry_count}/{self.max_retries + 1} falhou. {error_message}"
+                progress.finish(
+                    db_document.status,
+                    f"Tentativa {retry_count}/{self.max_retries + 1} falhou. {error_message}"
+                )
                 print(f"[TASK] Tarefa para doc {document_id} falhou. Tentando novamente... Erro: {str(e)}")
-            session.add(db_document)
-            session.commit()
             raise e
         
+def _raise_if_job_cancelled(session: Session, cancel_token: CancellationToken, db_document: models.Document) -> None:
+    """Antes de salvar: confere a flag e o banco (o cancelamento devolve o documento)."""
+    cancel_token.raise_if_cancelled()
+    current = crud.get_document_status(session, db_document.id, db_document.user_id)
+    if current is None or current.status != models.DocumentStatus.PROCESSING:
+        raise DocumentCancelled(f"Job do documento {db_document.id} cancelado.")
+
+@celery_app.task(
+    bind=True,
+    soft_time_limit=jobs.JOB_SOFT_TIME_LIMIT_SECONDS,
+    time_limit=jobs.JOB_SOFT_TIME_LIMIT_SECONDS + 60
+)
+def generate_document_content(
+    self,
+    document_id: int,
+    user_id: int,
+    kind: str,
+    count: int,
+    difficulty: str,
+    restore_status: str
+):
+    """
+    Job de geração sob demanda para um documento já processado (gerar ou
+    acrescentar flashcards/perguntas). O ID da task é o job_id. A rota já
+    marcou o documento como PROCESSING; o progresso usa os mesmos campos
+    de process_document e, ao terminar (com sucesso ou não), o documento
+    volta ao status anterior (restore_status). O resultado fica no backend
+    do Celery. Não há retentativa automática para não gerar em dobro; o
+    limite de tempo (soft_time_limit) cai no mesmo caminho de erro.
+    """
+    job_id = self.request.id
+    print(f"[TASK] Job {job_id} ({kind}) para Doc ID: {document_id}")
+    
+    with Session(engine) as session:
+        db_document = crud.get_document(session=session, document_id=document_id)
+        if not db_document:
+            raise ValueError(f"Documento {document_id} não encontrado.")
+
+        if db_document.status != models.DocumentStatus.PROCESSING:
+            # Cancelado enquanto estava na fila: o documento já foi devolvido
+            print(f"[TASK] Job {job_id} cancelado antes de iniciar.")
+            return None
+
+        progress = ProgressReporter(session, db_document)
+        cancel_token = CancellationToken(document_id)
+        final_status = models.DocumentStatus(restore_status)
+
+        try:
+            document_text = crud.get_document_text(session, db_document)
+            if not document_text:
+                raise ValueError("Documento não tem texto para gerar conteúdo.")
+
+            if kind in (jobs.GENERATE_FLASHCARDS, jobs.ADD_FLASHCARDS):
+                # Ao adicionar, o deck atual (no momento da execução) não pode se repetir
+                existing_flashcards = (
+                    [(fc.front, fc.back) for fc in db_document.flashcards]
+                    if kind == jobs.ADD_FLASHCARDS else None
+                )
+                progress.step("gerando flashcards com ia", persist=True)
+                flashcards_data = generate_flashcards_from_text(
+                    text=document_text, num_flashcards=count, difficulty=difficulty,
+                    should_stop=cancel_token.is_cancelled, existing=existing_flashcards
+                )
+                if not flashcards_data:
+                    raise ValueError("A IA não conseguiu gerar os flashcards.")
+
+                _raise_if_job_cancelled(session, cancel_token, db_document)
+                progress.step("salvando flashcards")
+                db_flashcards = crud.create_flashcards_for_document(
+                    session=session, flashcards_data=flashcards_data, document_id=document_id
+                )
+                result = {"flashcard_ids": [fc.id for fc in db_flashcards]}
+
+            elif kind == jobs.GENERATE_QUIZ:
+                progress.step("gerando quiz com ia", persist=True)
+                quiz_data_dict = generate_quiz_from_text(
+                    text=document_text, num_questions=count, difficulty=difficulty,
+                    should_stop=cancel_token.is_cancelled
+                )
+                if not quiz_data_dict:
+                    raise ValueError("A IA não conseguiu gerar o quiz.")
+
+                # 🆕 EMBARALHAR AS ALTERNATIVAS ANTES DE CRIAR O QUIZ
+                quiz_data_dict = crud.shuffle_quiz_answers(quiz_data_dict)
+
+                _raise_if_job_cancelled(session, cancel_token, db_document)
+                progress.step("salvando quiz")
+                db_quiz = crud.create_quiz_for_document(
+                    db=session, quiz_data=schemas.QuizCreate(**quiz_data_dict), document_id=document_id
+                )
+                result = {"quiz_id": db_quiz.id, "question_ids": [q.id for q in db_quiz.questions]}
+
+            elif kind == jobs.ADD_QUESTIONS:
+                db_quiz = db_document.quiz
+                if not db_quiz:
+                    raise ValueError("Este documento não possui um quiz.")
+
+                existing_questions = [(q.text, [ans.text for ans in q.answers]) for q in db_quiz.questions]
+                progress.step("gerando quiz com ia", persist=True)
+                new_quiz_data = generate_quiz_from_text(
+                    text=document_text, num_questions=count, difficulty=difficulty,
+                    should_stop=cancel_token.is_cancelled, existing=existing_questions
+                )
+                if not new_quiz_data or 'questions' not in new_quiz_data:
+                    raise ValueError("A IA não conseguiu gerar novas perguntas.")
+
+                # 🆕 EMBARALHAR AS ALTERNATIVAS DAS NOVAS PERGUNTAS
+                new_quiz_data = crud.shuffle_quiz_answers(new_quiz_data)
+
+                _raise_if_job_cancelled(session, cancel_token, db_document)
+                progress.step("salvando quiz")
+                quiz_id = db_quiz.id
+                db_questions = crud.add_questions_to_quiz(session, quiz_id, new_quiz_data["questions"])
+                result = {"quiz_id": quiz_id, "question_ids": [q.id for q in db_questions]}
+
+            else:
+                raise ValueError(f"Tipo de job desconhecido: {kind}")
+
+            # 🆕 INCREMENTAR CONTADOR APENAS QUANDO GERAÇÃO FOR BEM-SUCEDIDA
+            crud.increment_user_generation_count(session, user_id)
+
+            db_document.can_cancel = True
+            progress.finish(final_status, "concluído", progress=100)
+            print(f"[TASK] Job {job_id} concluído: {result}")
+            return result
+
+        except DocumentCancelled:
+            # O endpoint de cancelamento já devolveu o documento; descarta o trabalho
+            session.rollback()
+            print(f"[TASK] Job {job_id} cancelado durante a execução.")
+            return None
+
+        except Exception as e:
+            session.rollback()
+            db_document.can_cancel = True
+            progress.finish(final_status, f"Erro: {str(e)}", progress=100)
+            print(f"[TASK] Job {job_id} FALHOU: {traceback.format_exc()}")
+            raise
+
+        finally:
+            jobs.clear_active_job(document_id, job_id)
+
 # 🆕 NOVA TASK: Enviar e-mails de inatividade
 @celery_app.task(name="send_inactivity_emails")
 def send_inactivity_emails():
@@ -272,4 +450,87 @@ def send_incomplete_deck_emails():
                 print(f"❌ Erro ao processar documento {doc.id}: {e}")
                 continue
         
-        print(f"✅ Processo de e-mails de decks incompletos concluído")
\ No newline at end of file
+        print(f"✅ Processo de e-mails de decks incompletos concluído")
+
+# 🆕 NOVA TASK: Reconstruir resumos de progresso a partir dos registos brutos
+@celery_app.task(name="rebuild_progress_summaries")
+def rebuild_progress_summaries(user_id: int | None = None):
+    """
+    Reconstrói as tabelas DeckProgress e UserDailyActivity a partir de
+    StudyLog e QuizAttempt. O backfill inicial roda sozinho quando a API
+    sobe (crud.backfill_progress_summaries); use para corrigir divergências.
+    Uso: celery -A app.worker call rebuild_progress_summaries [--args='[user_id]']
+    """
+    scope = f"usuário {user_id}" if user_id is not None else "todos os usuários"
+    print(f"🔄 Reconstruindo resumos de progresso para {scope}...")
+
+    with Session(engine) as session:
+        crud.rebuild_progress_summaries(session, user_id=user_id)
+
+    print(f"✅ Resumos de progresso reconstruídos para {scope}")
+
+@celery_app.task(name="migrate_legacy_document_texts")
+def migrate_legacy_document_texts():
+    """
+    Move o texto extraído dos documentos antigos para a tabela DocumentText
+    (criando antes document.content_hash, se o banco ainda não tiver) e
+    reconstrói os índices de trechos que faltam ou são de versão antiga.
+    Uso: celery -A app.worker call migrate_legacy_document_texts
+    """
+    print("🔄 Migrando textos extraídos para DocumentText...")
+
+    with Session(engine) as session:
+        migrated = crud.migrate_legacy_document_texts(session)
+
+    print(f"✅ {migrated} documento(s) migrado(s)")
+
+@celery_app.task(name="cleanup_orphan_document_blobs")
+def cleanup_orphan_document_blobs():
+    """Remove os blobs (texto, índice e arquivo) que nenhum documento usa mais."""
+    print("🧹 Removendo blobs de documentos sem referência...")
+
+    with Session(engine) as session:
+        removed = crud.delete_orphan_document_blobs(session)
+
+    print(f"✅ {removed} blob(s) removido(s)")
+
+@celery_app.task(name="migrate_study_log_client_event_ids")
+def migrate_study_log_client_event_ids():
+    """
+    Cria StudyLog.client_event_id e o índice único da sincronização offline
+    em bancos criados antes da mudança.
+    Uso: celery -A app.worker call migrate_study_log_client_event_ids
+    """
+    print("🔄 Migrando client_event_id dos registos de estudo...")
+
+    with Session(engine) as session:
+        added = crud.migrate_study_log_client_event_ids(session)
+
+    print("✅ Coluna client_event_id criada" if added else "✅ Coluna client_event_id já existia")
+
+@celery_app.task(name="create_missing_indexes")
+def create_missing_indexes():
+    """
+    Cria (CONCURRENTLY, sem bloquear escritas) os índices novos que bancos
+    criados antes deles não têm.
+    Uso: celery -A app.worker call create_missing_indexes
+    """
+    print("🔄 Criando índices ausentes...")
+
+    created = crud.create_missing_indexes(engine)
+
+    print(f"✅ Índices criados: {', '.join(created)}" if created else "✅ Nenhum índice ausente")
+
+@celery_app.task(name="migrate_flashcard_conversation_timestamps")
+def migrate_flashcard_conversation_timestamps():
+    """
+    Converte FlashcardConversation.created_at para timestamptz e cria o índice
+    do histórico em bancos criados antes da mudança.
+    Uso: celery -A app.worker call migrate_flashcard_conversation_timestamps
+    """
+    print("🔄 Migrando datas das conversas dos flashcards...")
+
+    with Session(engine) as session:
+        converted = crud.migrate_flashcard_conversation_timestamps(session)
+
+    print("✅ Coluna created_at convertida" if converted else "✅ Coluna created_at já estava atualizada")
@@ -1,31 +1,277 @@
 # app/text_extractor.py
+import io
+import os
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import billiard
 import pdfplumber
 from google.cloud import vision
 
-def extract_text_from_pdf(file_path: str) -> str:
-    """Extrai texto de um arquivo PDF."""
-    full_text = ""
+from . import ai_cache
+
+# Orçamento de extração: páginas além do limite (ou texto além do limite de
+# caracteres) são ignoradas para não travar o worker com PDFs enormes.
+MAX_PDF_PAGES = int(os.getenv("MAX_PDF_PAGES", 500))
+MAX_EXTRACTED_CHARS = int(os.getenv("MAX_EXTRACTED_CHARS", 2_000_000))
+# PDFs com pelo menos esta quantidade de páginas são divididos entre processos
+PARALLEL_PDF_MIN_PAGES = int(os.getenv("PARALLEL_PDF_MIN_PAGES", 40))
+PDF_EXTRACTION_WORKERS = int(os.getenv("PDF_EXTRACTION_WORKERS", max(1, (os.cpu_count() or 1) - 1)))
+
+# Páginas com menos caracteres que isto são tratadas como imagem (escaneadas)
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", 20))
+MAX_OCR_PAGES = int(os.getenv("MAX_OCR_PAGES", 50))
+OCR_RENDER_RESOLUTION = int(os.getenv("OCR_RENDER_RESOLUTION", 200))
+OCR_BACKEND = os.getenv("OCR_BACKEND", "vision")
+
+# --- Backends de OCR (plugáveis) ---
+
+class OcrBackend:
+    """Interface dos backends de OCR. `name` faz parte da chave do cache."""
+    name = "base"
+
+    def recognize(self, image_bytes: bytes) -> str:
+        raise NotImplementedError
+
+    def recognize_batch(self, images: List[bytes]) -> List[Optional[str]]:
+        """
+        OCR de várias imagens, na ordem recebida. Uma imagem que falhar
+        gera None, sem derrubar as demais.
+        """
+        results: List[Optional[str]] = []
+        for image in images:
+            try:
+                results.append(self.recognize(image))
+            except Exception as e:
+                print(f"⚠️ Falha no OCR de uma imagem: {e}")
+                results.append(None)
+        return results
+
+class VisionOcrBackend(OcrBackend):
+    """
+    OCR com o Google Cloud Vision. O cliente gRPC é criado uma única vez
+    (sob demanda, já dentro do processo do worker) e reutilizado.
+    """
+    name = "vision"
+    # Limite de imagens por requisição síncrona do batch_annotate_images
+    MAX_IMAGES_PER_REQUEST = 16
+
+    def __init__(self):
+        self._client: Optional[vision.ImageAnnotatorClient] = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> vision.ImageAnnotatorClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = vision.ImageAnnotatorClient()
+        return self._client
+
+    @staticmethod
+    def _text_from_response(response) -> str:
+        if response.error.message:
+            raise Exception(
+                f"{response.error.message}\nPara mais detalhes, veja https://cloud.google.com/apis/design/errors"
+            )
+        # O primeiro texto retornado é o texto completo detectado na imagem.
+        texts = response.text_annotations
+        return texts[0].description if texts else ""
+
+    def recognize(self, image_bytes: bytes) -> str:
+        response = self.client.text_detection(image=vision.Image(content=image_bytes))
+        return self._text_from_response(response)
+
+    def recognize_batch(self, images: List[bytes]) -> List[Optional[str]]:
+        """
+        Envia as imagens em lotes de até 16 por requisição (batch_annotate_images).
+        Cada imagem tem a sua própria resposta: as que falharem geram None.
+        """
+        feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+        results: List[Optional[str]] = []
+        for start in range(0, len(images), self.MAX_IMAGES_PER_REQUEST):
+            requests = [
+                vision.AnnotateImageRequest(image=vision.Image(content=image), features=[feature])
+                for image in images[start:start + self.MAX_IMAGES_PER_REQUEST]
+            ]
+            batch_response = self.client.batch_annotate_images(requests=requests)
+            for response in batch_response.responses:
+                try:
+                    results.append(self._text_from_response(response))
+                except Exception as e:
+                    print(f"⚠️ Falha no OCR de uma imagem: {e}")
+                    results.append(None)
+        return results
+
+class TesseractOcrBackend(OcrBackend):
+    """OCR local com Tesseract (requer pytesseract + binário tesseract), útil em testes."""
+    name = "tesseract"
+
+    def __init__(self, lang: str = "por"):
+        import pytesseract
+        from PIL import Image
+        self._pytesseract = pytesseract
+        self._image = Image
+        self.lang = lang
+
+    def recognize(self, image_bytes: bytes) -> str:
+        return self._pytesseract.image_to_string(self._image.open(io.BytesIO(image_bytes)), lang=self.lang)
+
+_ocr_backend: Optional[OcrBackend] = None
+_ocr_backend_lock = threading.Lock()
+
+def get_ocr_backend() -> OcrBackend:
+    """Backend de OCR do processo, criado uma única vez sob demanda."""
+    global _ocr_backend
+    if _ocr_backend is None:
+        with _ocr_backend_lock:
+            if _ocr_backend is None:
+                _ocr_backend = TesseractOcrBackend() if OCR_BACKEND == "tesseract" else VisionOcrBackend()
+    return _ocr_backend
+
+def set_ocr_backend(backend: Optional[OcrBackend]) -> None:
+    """Troca o backend de OCR do processo (ex.: um fake local em testes)."""
+    global _ocr_backend
+    _ocr_backend = backend
+
+# --- Extração de PDF ---
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def iter_pdf_pages(file_path: str, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+    """
+    Gera o texto de cada página do intervalo [start, end) à medida que é
+    extraído. Páginas sem texto (extract_text() retorna None) geram "".
+    """
     with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            full_text += page.extract_text() + "\n"
-    return full_text
+        for page in pdf.pages[start:end]:
+            yield page.extract_text() or ""
+            # Libera o cache de objetos da página (evita picos de memória)
+            page.flush_cache()
 
-def extract_text_from_image(file_path: str) -> str:
-    """Usa o Google Cloud Vision para extrair texto de uma imagem."""
-    client = vision.ImageAnnotatorClient()
+def _extract_page_range(page_range: Tuple[str, int, int]) -> List[str]:
+    file_path, start, end = page_range
+    return list(iter_pdf_pages(file_path, start, end))
 
-    with open(file_path, "rb") as image_file:
-        content = image_file.read()
+def _iter_pdf_pages_parallel(file_path: str, num_pages: int) -> Iterator[str]:
+    """
+    Distribui intervalos de páginas entre processos, preservando a ordem.
+    Os processos são criados pelo billiard (o multiprocessing do Celery),
+    que permite criar filhos mesmo dentro dos processos daemônicos do pool
+    prefork do worker. Se o consumidor parar antes do fim (orçamento
+    atingido), os intervalos ainda não iniciados são cancelados.
+    """
+    workers = min(PDF_EXTRACTION_WORKERS, num_pages)
+    range_size = -(-num_pages // (workers * 4))  # ~4 intervalos por processo
+    ranges = [(file_path, start, min(start + range_size, num_pages)) for start in range(0, num_pages, range_size)]
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=billiard.get_context("fork"))
+    try:
+        futures = [executor.submit(_extract_page_range, page_range) for page_range in ranges]
+        for future in futures:
+            yield from future.result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _ocr_pdf_pages(file_path: str, page_numbers: List[int]) -> dict[int, str]:
+    """
+    Faz OCR apenas das páginas informadas (renderizadas como PNG), usando o
+    cache por (hash do arquivo, página) para nunca repetir o OCR de uma página.
+    """
+    backend = get_ocr_backend()
+    file_hash = file_sha256(file_path)
+
+    results: dict[int, str] = {}
+    missing: List[int] = []
+    for page_number in page_numbers:
+        cached = ai_cache.lookup(ai_cache.make_ocr_page_key(file_hash, page_number, backend.name), "ocr_page")
+        if cached is not None:
+            results[page_number] = cached
+        else:
+            missing.append(page_number)
+
+    if missing:
+        images: List[bytes] = []
+        with pdfplumber.open(file_path) as pdf:
+            for page_number in missing:
+                buffer = io.BytesIO()
+                pdf.pages[page_number].to_image(resolution=OCR_RENDER_RESOLUTION).save(buffer, format="PNG")
+                images.append(buffer.getvalue())
+
+        for page_number, text in zip(missing, backend.recognize_batch(images)):
+            if text is None:
+                # Falhas não vão para o cache: a página é tentada de novo depois
+                results[page_number] = ""
+                continue
+            ai_cache.store(ai_cache.make_ocr_page_key(file_hash, page_number, backend.name), text)
+            results[page_number] = text
 
-    image = vision.Image(content=content)
-    
-    response = client.text_detection(image=image)
-    texts = response.text_annotations
+    return results
 
-    if response.error.message:
-        raise Exception(
-            f"{response.error.message}\nPara mais detalhes, veja https://cloud.google.com/apis/design/errors"
-        )
+def extract_text_from_pdf(
+    file_path: str, max_pages: int = MAX_PDF_PAGES, max_chars: int = MAX_EXTRACTED_CHARS
+) -> str:
+    """
+    Extrai texto de um arquivo PDF página a página, respeitando o orçamento
+    de páginas e de caracteres. PDFs grandes são extraídos em paralelo.
+    Páginas sem camada de texto (escaneadas) passam por OCR individualmente.
+    """
+    with pdfplumber.open(file_path) as pdf:
+        total_pages = len(pdf.pages)
+
+    num_pages = min(total_pages, max_pages)
+    if num_pages < total_pages:
+        print(f"⚠️ PDF com {total_pages} páginas: extraindo apenas as primeiras {num_pages}.")
+
+    if num_pages >= PARALLEL_PDF_MIN_PAGES and PDF_EXTRACTION_WORKERS > 1:
+        pages = _iter_pdf_pages_parallel(file_path, num_pages)
+    else:
+        pages = iter_pdf_pages(file_path, 0, num_pages)
+
+    # Consome as páginas só até o orçamento de caracteres: ao atingi-lo, o
+    # gerador é fechado e as páginas restantes nem chegam a ser extraídas
+    page_texts: List[str] = []
+    text_chars = 0
+    try:
+        for page_text in pages:
+            page_texts.append(page_text)
+            text_chars += len(page_text) + 1
+            if text_chars > max_chars:
+                break
+    finally:
+        pages.close()
+
+    # OCR apenas das páginas vazias dentro do trecho consumido
+    image_only_pages = [
+        page_number for page_number, text in enumerate(page_texts)
+        if len(text.strip()) < OCR_MIN_PAGE_CHARS
+    ][:MAX_OCR_PAGES]
+    if image_only_pages:
+        print(f"🔎 {len(image_only_pages)} página(s) sem texto: aplicando OCR.")
+        for page_number, text in _ocr_pdf_pages(file_path, image_only_pages).items():
+            page_texts[page_number] = text
+
+    parts: List[str] = []
+    total_chars = 0
+    for page_text in page_texts:
+        if total_chars + len(page_text) > max_chars:
+            parts.append(page_text[:max_chars - total_chars])
+            print(f"⚠️ Limite de {max_chars} caracteres atingido; restante do PDF ignorado.")
+            break
+        parts.append(page_text)
+        total_chars += len(page_text) + 1
+    return "\n".join(parts)
+
+def extract_text_from_image(file_path: str) -> str:
+    """Usa o backend de OCR (Google Cloud Vision por padrão) para extrair texto de uma imagem."""
+    with open(file_path, "rb") as image_file:
+        content = image_file.read()
 
-    # O primeiro texto retornado é o texto completo detectado na imagem.
-    return texts[0].description if texts else ""
\ No newline at end of file
+    return get_ocr_backend().recognize(content)
@@ -0,0 +1,157 @@
+# back/app/text_index.py
+"""
+Índice BM25 dos trechos de um documento, para o chat buscar só as partes
+relevantes do texto (em vez dos primeiros caracteres). É construído uma vez,
+quando o texto é extraído, e roda localmente, sem serviços externos.
+O índice guarda só as posições (início, fim) de cada trecho no texto, que já
+fica salvo em DocumentText; os trechos são recortados na hora da busca.
+"""
+import os
+import re
+import math
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# Versão do formato do índice; índices de outra versão são reconstruídos
+TEXT_INDEX_VERSION = 2
+
+PASSAGE_MAX_CHARS = int(os.getenv("TEXT_INDEX_PASSAGE_CHARS", 700))
+RETRIEVAL_TOP_K = int(os.getenv("CHAT_CONTEXT_TOP_K", 4))
+RETRIEVAL_MAX_CHARS = 3000
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Palavras muito frequentes em português que não ajudam a ranquear
+STOPWORDS = frozenset("""
+a ao aos as com como da das de dela dele do dos e ela ele em entre era essa esse esta este eu
+foi ha isso isto ja la lhe mais mas me mesmo muito na nao nas nem no nos o os ou para pela pelo
+por qual quando que quem se sem ser seu sua sao tambem te tem um uma umas uns voce
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sem acentos, sem stopwords nem tokens de um caractere."""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return [tok for tok in _TOKEN_RE.findall(normalized) if len(tok) > 1 and tok not in STOPWORDS]
+
+def _normalized_length(text: str) -> int:
+    return len(" ".join(text.split()))
+
+def passage_text(text: str, span: Tuple[int, int]) -> str:
+    """Texto de um trecho, com os espaços e quebras de linha normalizados."""
+    start, end = span
+    return " ".join(text[start:end].split())
+
+def split_passages(text: str, max_chars: int = PASSAGE_MAX_CHARS) -> List[Tuple[int, int]]:
+    """
+    Divide o texto em trechos de até max_chars (após normalizar os espaços),
+    respeitando parágrafos e, dentro de parágrafos longos, frases. Parágrafos
+    curtos são agrupados. Retorna as posições (início, fim) de cada trecho.
+    """
+    pieces: List[Tuple[int, int, int]] = []  # (início, fim, tamanho normalizado)
+    paragraph_start = 0
+    for separator in [*re.finditer(r"\n\s*\n", text), None]:
+        paragraph_end = separator.start() if separator else len(text)
+        paragraph = text[paragraph_start:paragraph_end]
+        offset = paragraph_start
+        paragraph_start = separator.end() if separator else len(text)
+
+        stripped = paragraph.strip()
+        if not stripped:
+            continue
+        offset += paragraph.index(stripped)
+        length = _normalized_length(stripped)
+        if length <= max_chars:
+            pieces.append((offset, offset + len(stripped), length))
+            continue
+
+        sentence_start = 0
+        for boundary in [*_SENTENCE_END_RE.finditer(stripped), None]:
+            sentence_end = boundary.start() if boundary else len(stripped)
+            # Frases maiores que o limite são cortadas sem cerimônia
+            for cut in range(sentence_start, sentence_end, max_chars):
+                cut_end = min(cut + max_chars, sentence_end)
+                pieces.append((offset + cut, offset + cut_end, _normalized_length(stripped[cut:cut_end])))
+            sentence_start = boundary.end() if boundary else len(stripped)
+
+    passages: List[Tuple[int, int]] = []
+    current = None  # [início, fim, tamanho normalizado]
+    for start, end, length in pieces:
+        if current and current[2] + 1 + length > max_chars:
+            passages.append((current[0], current[1]))
+            current = None
+        if current:
+            current[1] = end
+            current[2] += 1 + length
+        else:
+            current = [start, end, length]
+    if current:
+        passages.append((current[0], current[1]))
+    return passages
+
+def build_index(text: str) -> Dict[str, Any]:
+    """Monta o índice (serializável em JSON) a partir do texto extraído."""
+    passages = split_passages(text)
+    term_freqs = [dict(Counter(tokenize(passage_text(text, span)))) for span in passages]
+    lengths = [sum(tf.values()) for tf in term_freqs]
+    doc_freqs: Counter = Counter()
+    for tf in term_freqs:
+        doc_freqs.update(tf.keys())
+    return {
+        "version": TEXT_INDEX_VERSION,
+        "passages": [list(span) for span in passages],
+        "term_freqs": term_freqs,
+        "lengths": lengths,
+        "doc_freqs": dict(doc_freqs),
+        "avg_length": (sum(lengths) / len(lengths)) if lengths else 0.0,
+    }
+
+def _bm25_scores(index: Dict[str, Any], query: str) -> List[float]:
+    total = len(index["passages"])
+    avg_length = index["avg_length"] or 1.0
+    query_terms = set(tokenize(query))
+    scores = [0.0] * total
+    for term in query_terms:
+        df = index["doc_freqs"].get(term)
+        if not df:
+            continue
+        idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+        for i, tf in enumerate(index["term_freqs"]):
+            freq = tf.get(term)
+            if freq:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * index["lengths"][i] / avg_length)
+                scores[i] += idf * freq * (BM25_K1 + 1) / (freq + norm)
+    return scores
+
+def retrieve_context(
+    index: Dict[str, Any], text: str, query: str,
+    top_k: int = RETRIEVAL_TOP_K, max_chars: int = RETRIEVAL_MAX_CHARS
+) -> str:
+    """
+    Contexto para o prompt: os top_k trechos mais relevantes para a consulta
+    (até max_chars), na ordem em que aparecem no documento. Se nenhum trecho
+    tiver termos da consulta, usa o início do documento (comportamento antigo).
+    text é o texto a partir do qual o índice foi construído.
+    """
+    spans = index["passages"]
+    scores = _bm25_scores(index, query)
+    ranked = [i for i in sorted(range(len(spans)), key=lambda i: -scores[i]) if scores[i] > 0]
+    if not ranked:
+        ranked = list(range(len(spans)))
+
+    selected: Dict[int, str] = {}
+    used = 0
+    for i in ranked:
+        if len(selected) >= top_k:
+            break
+        passage = passage_text(text, spans[i])
+        if used + len(passage) > max_chars:
+            continue
+        selected[i] = passage
+        used += len(passage)
+    return "\n\n".join(selected[i] for i in sorted(selected))
@@ -0,0 +1,42 @@
+# back/app/text_storage.py
+import os
+import zlib
+from typing import Tuple
+
+# zstd é opcional: se o pacote zstandard não estiver instalado, cai para zlib
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - depende do ambiente
+    zstandard = None
+
+# --- Configuração ---
+# "zstd", "zlib" ou "none"; por padrão usa zstd quando disponível
+TEXT_COMPRESSION = os.getenv("TEXT_COMPRESSION", "zstd" if zstandard else "zlib").lower()
+ZSTD_LEVEL = int(os.getenv("TEXT_ZSTD_LEVEL", "3"))
+ZLIB_LEVEL = 6
+
+def compress_text(text: str) -> Tuple[str, bytes]:
+    """
+    Codifica o texto extraído para armazenamento.
+    Retorna (algoritmo, bytes) — o algoritmo é gravado junto para a leitura.
+    """
+    raw = text.encode("utf-8")
+    if TEXT_COMPRESSION == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if TEXT_COMPRESSION in ("zstd", "zlib"):
+        return "zlib", zlib.compress(raw, ZLIB_LEVEL)
+    return "none", raw
+
+def decompress_text(compression: str, data: bytes) -> str:
+    """Inverso de compress_text."""
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Texto comprimido com zstd, mas o pacote zstandard não está instalado.")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif compression == "zlib":
+        raw = zlib.decompress(data)
+    elif compression == "none":
+        raw = data
+    else:
+        raise ValueError(f"Compressão de texto desconhecida: {compression}")
+    return raw.decode("utf-8")
@@ -0,0 +1,74 @@
+# app/upload_limit.py
+"""
+Limite de tamanho do corpo das rotas de upload, aplicado antes do parsing
+do formulário multipart. O Starlette grava o corpo inteiro (em disco) antes
+de o handler rodar, então a checagem dentro da rota chega tarde demais:
+aqui o 413 sai pelo Content-Length, sem ler o corpo, e uploads sem
+Content-Length (chunked) são interrompidos assim que passam do limite.
+"""
+import json
+from typing import Iterable
+
+from fastapi import HTTPException, status
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Folga para os outros campos do formulário e os delimitadores do multipart
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+TOO_LARGE_DETAIL = "Arquivo excede o tamanho máximo permitido."
+
+class _BodyTooLarge(HTTPException):
+    # HTTPException para o FastAPI não converter em 400 ao ler o formulário
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=TOO_LARGE_DETAIL)
+
+class UploadSizeLimitMiddleware:
+    def __init__(self, app: ASGIApp, max_body_bytes: int, paths: Iterable[str]):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if response_started:
+                raise
+            await self._reject(send)
+
+    @staticmethod
+    async def _reject(send: Send) -> None:
+        body = json.dumps({"detail": TOO_LARGE_DETAIL}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
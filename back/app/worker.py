@@ -24,6 +24,11 @@ celery_app.conf.update(
             'task': 'send_incomplete_deck_emails',
             'schedule': crontab(minute=0, hour='*/6'),  # 0h, 6h, 12h, 18h
         },
+        # Limpeza de arquivos/textos de documentos excluídos: todo dia às 4h (UTC)
+        'cleanup-orphan-document-blobs': {
+            'task': 'cleanup_orphan_document_blobs',
+            'schedule': crontab(hour=4, minute=0),
+        },
     },
     timezone='UTC',
 )
\ No newline at end of file
@@ -0,0 +1,52 @@
+# back/tests/conftest.py
+"""
+Fixtures compartilhadas. Os testes que usam o banco precisam de um Postgres
+descartável em TEST_DATABASE_URL (as tabelas são recriadas a cada teste) e
+são ignorados quando a variável não está definida.
+"""
+import os
+
+import pytest
+from sqlmodel import Session, SQLModel, create_engine
+
+# Os módulos da app exigem a chave da IA ao serem importados
+os.environ.setdefault("AI_BACKEND", "fake")
+
+from app import models
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+@pytest.fixture(scope="session")
+def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL não definida")
+    engine = create_engine(TEST_DATABASE_URL)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def session(engine):
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+@pytest.fixture
+def user(session):
+    db_user = models.User(username="estudante", email="estudante@example.com")
+    session.add(db_user)
+    session.commit()
+    session.refresh(db_user)
+    return db_user
+
+@pytest.fixture
+def make_document(session, user):
+    def make_document(**fields) -> models.Document:
+        fields.setdefault("file_path", "deck.pdf")
+        fields.setdefault("status", models.DocumentStatus.COMPLETED)
+        db_document = models.Document(user_id=user.id, **fields)
+        session.add(db_document)
+        session.commit()
+        session.refresh(db_document)
+        return db_document
+    return make_document
@@ -0,0 +1,140 @@
+# back/tests/test_bulk_inserts.py
+"""
+Os INSERTs em lote com RETURNING (sort_by_parameter_order=True) devem
+devolver as linhas na ordem dos parâmetros, para que cada objeto retornado
+corresponda ao item enviado e as alternativas fiquem na pergunta certa. E
+usam um número fixo de comandos SQL, ao contrário do caminho antigo (ORM
+com um refresh por objeto).
+"""
+import random
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlmodel import select
+
+from app import crud, models, schemas
+
+def test_flashcards_are_returned_in_input_order(session, make_document):
+    document = make_document()
+    flashcards_data = [{"front": f"Pergunta {i}", "back": f"Resposta {i}"} for i in range(50)]
+    flashcards_data.insert(10, {"front": "sem verso"})  # ignorado
+
+    db_flashcards = crud.create_flashcards_for_document(session, flashcards_data, document.id)
+
+    assert [fc.front for fc in db_flashcards] == [f"Pergunta {i}" for i in range(50)]
+    stored = {fc.id: fc for fc in session.exec(select(models.Flashcard)).all()}
+    for db_flashcard in db_flashcards:
+        assert stored[db_flashcard.id].front == db_flashcard.front
+        assert stored[db_flashcard.id].back == db_flashcard.back
+
+def test_quiz_answers_belong_to_their_questions(session, make_document):
+    document = make_document()
+    quiz_data = schemas.QuizCreate(
+        title="Quiz",
+        questions=[
+            {
+                "text": f"Pergunta {q}",
+                "answers": [
+                    {"text": f"P{q} alternativa {a}", "is_correct": a == 0, "explanation": f"P{q}"}
+                    for a in range(4)
+                ],
+            }
+            for q in range(20)
+        ],
+    )
+
+    db_quiz = crud.create_quiz_for_document(session, quiz_data, document.id)
+    added = crud.add_questions_to_quiz(
+        session, db_quiz.id,
+        [{"text": f"Nova {q}", "answers": [{"text": f"N{q} alternativa", "is_correct": True}]} for q in range(5)],
+    )
+
+    assert [q.text for q in db_quiz.questions] == [f"Pergunta {q}" for q in range(20)]
+    assert [q.text for q in added] == [f"Nova {q}" for q in range(5)]
+    for question in [*db_quiz.questions, *added]:
+        prefix = question.text.replace("Pergunta ", "P").replace("Nova ", "N")
+        assert question.answers
+        assert all(answer.text.startswith(f"{prefix} ") for answer in question.answers)
+
+    stored_answers = session.exec(select(models.Answer)).all()
+    stored_questions = {q.id: q.text for q in session.exec(select(models.Question)).all()}
+    for answer in stored_answers:
+        prefix = stored_questions[answer.question_id].replace("Pergunta ", "P").replace("Nova ", "N")
+        assert answer.text.startswith(f"{prefix} ")
+
+def old_create_flashcards_for_document(session, flashcards_data: list[dict], document_id: int):
+    """Caminho antigo: add_all, commit e um refresh por flashcard."""
+    db_flashcards = [
+        models.Flashcard(**fc_data, document_id=document_id)
+        for fc_data in flashcards_data if "front" in fc_data and "back" in fc_data
+    ]
+    if db_flashcards:
+        session.add_all(db_flashcards)
+        session.commit()
+        for db_fc in db_flashcards:
+            session.refresh(db_fc)
+    return db_flashcards
+
+def old_create_quiz_for_document(session, quiz_data: schemas.QuizCreate, document_id: int):
+    """Caminho antigo: objetos ORM em cascata, commit e refresh do quiz."""
+    questions_to_create = []
+    for question_schema in quiz_data.questions:
+        shuffled_answers = question_schema.answers.copy()
+        random.shuffle(shuffled_answers)
+        questions_to_create.append(models.Question(
+            text=question_schema.text, answers=[models.Answer(**ans.model_dump()) for ans in shuffled_answers]
+        ))
+    db_quiz = models.Quiz(title=quiz_data.title, document_id=document_id, questions=questions_to_create)
+    session.add(db_quiz)
+    session.commit()
+    session.refresh(db_quiz)
+    return db_quiz
+
+@contextmanager
+def count_statements(engine):
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+def _deck_content():
+    flashcards_data = [{"front": f"Pergunta {i}", "back": f"Resposta {i}"} for i in range(50)]
+    quiz_data = schemas.QuizCreate(
+        title="Quiz",
+        questions=[
+            {"text": f"Pergunta {q}", "answers": [{"text": f"Alternativa {a}", "is_correct": a == 0} for a in range(4)]}
+            for q in range(25)
+        ],
+    )
+    return flashcards_data, quiz_data
+
+def _serialize(flashcards, quiz) -> None:
+    """Lê o que as rotas devolvem (ids, perguntas e alternativas)."""
+    [(fc.id, fc.front, fc.back) for fc in flashcards]
+    [(question.id, [(answer.id, answer.text) for answer in question.answers]) for question in quiz.questions]
+
+def test_bulk_path_runs_fewer_statements_than_the_old_path(engine, session, make_document):
+    flashcards_data, quiz_data = _deck_content()
+
+    # ids lidos antes: o commit do fixture expira o documento
+    old_document_id, new_document_id = make_document().id, make_document().id
+    with count_statements(engine) as old_statements:
+        _serialize(
+            old_create_flashcards_for_document(session, flashcards_data, old_document_id),
+            old_create_quiz_for_document(session, quiz_data, old_document_id),
+        )
+
+    with count_statements(engine) as new_statements:
+        _serialize(
+            crud.create_flashcards_for_document(session, flashcards_data, new_document_id),
+            crud.create_quiz_for_document(session, quiz_data, new_document_id),
+        )
+
+    # Um INSERT por tabela (flashcards, quiz, perguntas, alternativas)
+    assert len(new_statements) == 4
+    # Caminho antigo: um refresh por flashcard e uma carga de alternativas por pergunta
+    assert len(old_statements) >= 50 + 25
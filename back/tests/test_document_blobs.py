@@ -0,0 +1,66 @@
+# back/tests/test_document_blobs.py
+"""
+Migração de bancos anteriores ao DocumentBlob e limpeza dos blobs que
+nenhum documento referencia mais.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text as sql_text
+
+from app import crud, models
+
+def test_legacy_schema_gets_content_hash_and_text_backfill(session, make_document):
+    document = make_document()
+    # Esquema de antes: sem content_hash (nem as tabelas de blob/texto), com extracted_text
+    session.exec(sql_text("ALTER TABLE document DROP COLUMN content_hash"))
+    session.exec(sql_text("DROP TABLE documenttextindex, documenttext, documentblob"))
+    session.exec(sql_text("ALTER TABLE document ADD COLUMN extracted_text TEXT"))
+    session.exec(
+        sql_text("UPDATE document SET extracted_text = :text WHERE id = :id")
+        .bindparams(text="Texto extraído antes da migração.", id=document.id)
+    )
+    session.commit()
+
+    assert crud.migrate_legacy_document_texts(session) == 1
+    assert crud.migrate_legacy_document_texts(session) == 0
+    assert crud.migrate_document_content_hash(session) is False
+
+    foreign_keys = session.exec(sql_text(
+        "SELECT count(*) FROM pg_constraint "
+        "WHERE conrelid = 'document'::regclass AND contype = 'f' "
+        "AND pg_get_constraintdef(oid) LIKE '%documentblob(content_hash)%'"
+    )).one()[0]
+    assert foreign_keys == 1
+    assert session.exec(sql_text(
+        "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_document_content_hash'"
+    )).first() is not None
+
+    session.expire_all()
+    document = session.get(models.Document, document.id)
+    assert document.content_hash is not None
+    assert crud.get_document_text(session, document) == "Texto extraído antes da migração."
+    assert session.get(models.DocumentTextIndex, document.content_hash) is not None
+
+def test_orphan_blobs_are_deleted_with_text_and_file(session, make_document, tmp_path):
+    old = datetime.now(timezone.utc) - timedelta(days=2)
+    files = {}
+    for name in ("usado", "orfao", "recente"):
+        files[name] = tmp_path / f"{name}.pdf"
+        files[name].write_bytes(name.encode())
+        session.add(models.DocumentBlob(
+            content_hash=name, storage_path=str(files[name]), size_bytes=1,
+            created_at=old if name != "recente" else datetime.now(timezone.utc),
+        ))
+    session.commit()
+    crud.store_document_text(session, "orfao", "Texto do documento excluído.")
+    session.commit()
+    make_document(content_hash="usado")
+
+    assert crud.delete_orphan_document_blobs(session) == 1
+
+    session.expire_all()
+    assert session.get(models.DocumentBlob, "orfao") is None
+    assert session.get(models.DocumentText, "orfao") is None
+    assert session.get(models.DocumentTextIndex, "orfao") is None
+    assert not files["orfao"].exists()
+    assert files["usado"].exists() and files["recente"].exists()
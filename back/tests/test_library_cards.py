@@ -0,0 +1,129 @@
+# back/tests/test_library_cards.py
+"""
+Os cards da biblioteca montados pela query agregada devem bater com as
+contagens feitas a partir dos próprios objetos, e a paginação por keyset
+deve percorrer todos os decks uma única vez, na ordem (created_at, id).
+O número de comandos SQL da biblioteca não pode crescer com o número de
+decks. Bancos antigos recebem os índices dessas consultas pela migração.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, text as sql_text
+
+from app import crud, models
+from app.routers.folders import get_library_data
+
+def test_document_cards_match_per_document_counts(session, user, make_document):
+    folder = models.Folder(name="Pasta", user_id=user.id)
+    session.add(folder)
+    session.commit()
+
+    created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    documents = [
+        make_document(
+            file_path=f"deck_{i}.pdf",
+            folder_id=folder.id if i % 2 else None,
+            # Alguns decks compartilham o mesmo created_at (desempate pelo id)
+            created_at=created_at + timedelta(minutes=i // 3),
+        )
+        for i in range(9)
+    ]
+    for i, document in enumerate(documents):
+        crud.create_flashcards_for_document(
+            session, [{"front": f"F{n}", "back": f"B{n}"} for n in range(i)], document.id
+        )
+        if i % 3 == 0:
+            session.add(models.Quiz(title="Quiz", document_id=document.id))
+        if i:
+            crud.create_study_log(session, user.id, document.flashcards[0].id, accuracy=1.0)
+    session.commit()
+
+    cards = {card.id: card for card in crud.get_document_cards_for_user(session, user.id)}
+
+    assert set(cards) == {document.id for document in documents}
+    for document in documents:
+        session.refresh(document)
+        card = cards[document.id]
+        assert card.total_flashcards == len(document.flashcards)
+        assert card.studied_flashcards == (1 if document.flashcards else 0)
+        assert card.has_quiz == (document.quiz is not None)
+        assert card.folder_id == document.folder_id
+
+    in_folder = crud.get_document_cards_for_user(session, user.id, in_folder=True)
+    assert {card.id for card in in_folder} == {d.id for d in documents if d.folder_id is not None}
+
+def test_keyset_pagination_visits_every_document_once(session, make_document):
+    created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    documents = [make_document(created_at=created_at + timedelta(minutes=i // 4)) for i in range(11)]
+    user_id = documents[0].user_id
+
+    pages = []
+    cursor = (None, None)
+    while True:
+        page = crud.get_document_cards_for_user(
+            session, user_id, limit=3, before_created_at=cursor[0], before_id=cursor[1]
+        )
+        if not page:
+            break
+        pages.extend(page)
+        cursor = (page[-1].created_at, page[-1].id)
+
+    expected = sorted(documents, key=lambda d: (d.created_at, d.id), reverse=True)
+    assert [card.id for card in pages] == [d.id for d in expected]
+
+def _seed_library(session, owner: models.User, num_decks: int) -> None:
+    folders = [models.Folder(name=f"Pasta {n}", user_id=owner.id) for n in range(2)]
+    session.add_all(folders)
+    session.commit()
+    for i in range(num_decks):
+        document = models.Document(
+            user_id=owner.id, file_path=f"deck_{i}.pdf",
+            folder_id=folders[i % 2].id if i % 3 else None,
+        )
+        session.add(document)
+        session.commit()
+        flashcards = crud.create_flashcards_for_document(
+            session, [{"front": f"F{n}", "back": f"B{n}"} for n in range(3)], document.id
+        )
+        session.add(models.Quiz(title="Quiz", document_id=document.id))
+        crud.create_study_log(session, owner.id, flashcards[0].id, accuracy=1.0)
+
+def test_library_statement_count_does_not_grow_with_decks(engine, session):
+    owners = [models.User(username=f"leitor{n}", email=f"leitor{n}@example.com") for n in range(2)]
+    session.add_all(owners)
+    session.commit()
+    _seed_library(session, owners[0], 1)
+    _seed_library(session, owners[1], 50)
+
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    counts = []
+    for owner in owners:
+        session.refresh(owner)
+        statements.clear()
+        event.listen(engine, "before_cursor_execute", count_statement)
+        try:
+            library = get_library_data(current_user=owner, db=session)
+        finally:
+            event.remove(engine, "before_cursor_execute", count_statement)
+        counts.append(len(statements))
+        assert len(library.root_documents) + sum(len(f.documents) for f in library.folders) == len(owner.documents)
+
+    # Uma consulta para as pastas e uma para os cards, com 1 ou 50 decks
+    assert counts == [2, 2]
+
+def test_missing_indexes_are_created_concurrently(engine, session):
+    names = [name for name, _, _ in crud.CONCURRENT_INDEXES]
+    for name in names:
+        session.exec(sql_text(f"DROP INDEX {name}"))
+    session.commit()
+
+    assert crud.create_missing_indexes(engine) == names
+    assert crud.create_missing_indexes(engine) == []
+
+    existing = session.exec(sql_text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE i.indisvalid"
+    )).all()
+    assert set(names) <= {row[0] for row in existing}
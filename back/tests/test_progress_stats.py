@@ -0,0 +1,152 @@
+# back/tests/test_progress_stats.py
+"""
+As estatísticas de /progress/stats agregadas no banco (sequência de dias,
+atividade semanal, precisão e quizzes, estes vindos dos resumos diários)
+devem bater com a implementação antiga, que carregava todos os registos de
+estudo e tentativas de quiz e calculava tudo em Python.
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import crud, models
+from app.routers.progress import get_progress_stats
+
+def old_progress_stats(
+    study_logs: list[tuple[datetime, float]], quiz_attempts: list[tuple[datetime, float]], utc_offset_minutes: int
+) -> dict:
+    """Cálculo original (em Python) a partir de (momento, precisão/nota)."""
+    user_timezone_delta = timedelta(minutes=-utc_offset_minutes)
+    user_now = datetime.now(timezone.utc) + user_timezone_delta
+    local_study_log_times = [log_time + user_timezone_delta for log_time, _ in study_logs]
+
+    one_week_ago_date = user_now.date() - timedelta(days=7)
+    cards_studied_week = sum(1 for log_time in local_study_log_times if log_time.date() > one_week_ago_date)
+
+    flashcard_weekly_activity = [0] * 7
+    start_of_week = user_now.date() - timedelta(days=6)
+    for day_offset in range(7):
+        current_day_local = start_of_week + timedelta(days=day_offset)
+        flashcard_weekly_activity[current_day_local.weekday()] = sum(
+            1 for log_time in local_study_log_times if log_time.date() == current_day_local
+        )
+
+    flashcard_accuracy = 0.0
+    if study_logs:
+        flashcard_accuracy = round(sum(accuracy for _, accuracy in study_logs) / len(study_logs) * 100, 1)
+
+    streak_days = 0
+    if local_study_log_times:
+        study_dates = sorted(set(log_time.date() for log_time in local_study_log_times), reverse=True)
+        if study_dates[0] >= user_now.date() - timedelta(days=1):
+            streak_days = 1
+            for i in range(len(study_dates) - 1):
+                if (study_dates[i] - study_dates[i + 1]).days == 1:
+                    streak_days += 1
+                else:
+                    break
+
+    local_quiz_attempt_times = [completed_at + user_timezone_delta for completed_at, _ in quiz_attempts]
+    quizzes_completed_week = sum(1 for attempt_time in local_quiz_attempt_times if attempt_time.date() > one_week_ago_date)
+
+    quiz_average_score = 0.0
+    if quiz_attempts:
+        quiz_average_score = round(sum(score for _, score in quiz_attempts) / len(quiz_attempts), 1)
+
+    return {
+        "cards_studied_week": cards_studied_week,
+        "flashcard_weekly_activity": flashcard_weekly_activity,
+        "flashcard_accuracy": flashcard_accuracy,
+        "streak_days": streak_days,
+        "quizzes_completed_week": quizzes_completed_week,
+        "quiz_average_score": quiz_average_score,
+    }
+
+def random_study_times(rng: random.Random, now: datetime) -> list[datetime]:
+    """Sessões de estudo nos últimos 20 dias, com sequências e buracos."""
+    times = []
+    for days_ago in range(20):
+        if rng.random() < 0.6:
+            for _ in range(rng.randint(1, 3)):
+                times.append(now - timedelta(days=days_ago, minutes=rng.randint(0, 24 * 60 - 1)))
+    return times
+
+@pytest.mark.parametrize("utc_offset_minutes", [0, 180, -330, 600, -720])
+@pytest.mark.parametrize("seed", range(6))
+def test_stats_match_old_python_implementation(session, user, make_document, seed, utc_offset_minutes):
+    rng = random.Random(seed)
+    document = make_document()
+    flashcard = models.Flashcard(front="Pergunta", back="Resposta", document_id=document.id)
+    quiz = models.Quiz(title="Quiz", document_id=document.id)
+    session.add_all([flashcard, quiz])
+    session.commit()
+
+    now = datetime.now(timezone.utc)
+    study_logs = [(moment, rng.choice([0.0, 0.5, 1.0])) for moment in random_study_times(rng, now)]
+    quiz_attempts = [(moment, float(rng.choice([0, 20, 40, 60, 80, 100]))) for moment in random_study_times(rng, now)]
+    session.add_all(
+        models.StudyLog(user_id=user.id, flashcard_id=flashcard.id, studied_at=moment, accuracy=accuracy)
+        for moment, accuracy in study_logs
+    )
+    session.add_all(
+        models.QuizAttempt(
+            user_id=user.id, quiz_id=quiz.id, completed_at=moment, score=score,
+            correct_answers=int(score) // 20, total_questions=5,
+        )
+        for moment, score in quiz_attempts
+    )
+    session.commit()
+    # Os registos foram gravados direto nas tabelas brutas: preenche os resumos
+    crud.backfill_progress_summaries(session)
+
+    stats = get_progress_stats(current_user=user, session=session, utc_offset_minutes=utc_offset_minutes)
+
+    expected = old_progress_stats(study_logs, quiz_attempts, utc_offset_minutes)
+    assert stats.streak_days == expected["streak_days"]
+    assert stats.cards_studied_week == expected["cards_studied_week"]
+    assert stats.flashcard_weekly_activity == expected["flashcard_weekly_activity"]
+    assert stats.flashcard_accuracy == expected["flashcard_accuracy"]
+    assert stats.quizzes_completed_week == expected["quizzes_completed_week"]
+    assert stats.quiz_average_score == expected["quiz_average_score"]
+
+def test_streak_is_zero_when_last_study_is_older_than_yesterday(session, user, make_document):
+    document = make_document()
+    flashcard = models.Flashcard(front="Pergunta", back="Resposta", document_id=document.id)
+    session.add(flashcard)
+    session.commit()
+    now = datetime.now(timezone.utc)
+    session.add_all(
+        models.StudyLog(user_id=user.id, flashcard_id=flashcard.id, studied_at=now - timedelta(days=days_ago))
+        for days_ago in (3, 4, 5)
+    )
+    session.commit()
+
+    stats = get_progress_stats(current_user=user, session=session, utc_offset_minutes=0)
+
+    assert stats.streak_days == 0
+
+def test_summaries_are_backfilled_once_from_existing_history(session, user, make_document):
+    document = make_document()
+    flashcard = models.Flashcard(front="Pergunta", back="Resposta", document_id=document.id)
+    quiz = models.Quiz(title="Quiz", document_id=document.id)
+    session.add_all([flashcard, quiz])
+    session.commit()
+    assert crud.backfill_progress_summaries(session) is False
+
+    # Histórico gravado antes de os resumos existirem
+    session.add_all([
+        models.StudyLog(user_id=user.id, flashcard_id=flashcard.id, accuracy=1.0),
+        models.StudyLog(user_id=user.id, flashcard_id=flashcard.id, accuracy=0.0),
+        models.QuizAttempt(user_id=user.id, quiz_id=quiz.id, score=80.0, correct_answers=4, total_questions=5),
+    ])
+    session.commit()
+
+    assert crud.backfill_progress_summaries(session) is True
+    assert crud.backfill_progress_summaries(session) is False
+
+    totals = crud.get_user_activity_totals(session, user_id=user.id)
+    assert totals["cards_studied"] == 2
+    assert totals["accuracy_sum"] == 1.0
+    assert totals["quizzes_completed"] == 1
+    assert crud.get_deck_progress(session, user_id=user.id, document_id=document.id).studied_flashcards == 1
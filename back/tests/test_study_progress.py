@@ -0,0 +1,192 @@
+# back/tests/test_study_progress.py
+"""
+Resumos de estudo: o "primeiro estudo" de um flashcard conta uma única vez
+em DeckProgress (mesmo com revisões concorrentes), a exclusão de um deck
+desconta as suas atividades de UserDailyActivity, a fila de revisão inclui
+os flashcards ainda não estudados e bancos antigos recebem client_event_id.
+A reconstrução dos resumos deve bater com as contagens das tabelas brutas.
+"""
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text as sql_text
+from sqlmodel import Session, select
+
+from app import crud, models
+
+def _deck(session, make_document, size: int):
+    document = make_document()
+    flashcards = crud.create_flashcards_for_document(
+        session, [{"front": f"F{n}", "back": f"B{n}"} for n in range(size)], document.id
+    )
+    return document, flashcards
+
+def _studied(session, user_id: int, document_id: int) -> int:
+    session.expire_all()
+    progress = session.get(models.DeckProgress, (user_id, document_id))
+    return progress.studied_flashcards if progress else 0
+
+def test_repeated_reviews_count_once(session, user, make_document):
+    document, flashcards = _deck(session, make_document, 2)
+
+    crud.create_study_log(session, user.id, flashcards[0].id, accuracy=1.0)
+    crud.create_study_log(session, user.id, flashcards[0].id, accuracy=0.0)
+    now = datetime.now(timezone.utc)
+    crud.create_study_logs_batch(
+        session, user.id,
+        [
+            {"flashcard_id": flashcards[1].id, "accuracy": 1.0, "studied_at": now, "client_event_id": "a"},
+            {"flashcard_id": flashcards[1].id, "accuracy": 0.5, "studied_at": now - timedelta(hours=1), "client_event_id": "b"},
+            {"flashcard_id": flashcards[0].id, "accuracy": 1.0, "studied_at": now, "client_event_id": "c"},
+        ],
+        {fc.id: document.id for fc in flashcards},
+    )
+
+    assert _studied(session, user.id, document.id) == 2
+    state = session.get(models.FlashcardReviewState, (user.id, flashcards[1].id))
+    assert state.last_reviewed_at == now
+    assert state.repetitions == 2
+
+def test_concurrent_first_reviews_count_once(engine, session, user, make_document):
+    document, flashcards = _deck(session, make_document, 1)
+    # Lidos antes das threads: a sessão do teste não pode ser usada em paralelo
+    user_id, flashcard_id = user.id, flashcards[0].id
+    barrier = threading.Barrier(4)
+    errors = []
+
+    def review():
+        try:
+            with Session(engine) as worker_session:
+                barrier.wait()
+                crud.create_study_log(worker_session, user_id, flashcard_id, accuracy=1.0)
+        except Exception as e:  # pragma: no cover - falha reportada abaixo
+            errors.append(e)
+
+    threads = [threading.Thread(target=review) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert _studied(session, user.id, document.id) == 1
+
+def test_deleting_a_deck_discounts_daily_activity(session, user, make_document):
+    document, flashcards = _deck(session, make_document, 1)
+    crud.create_study_log(session, user.id, flashcards[0].id, accuracy=1.0)
+    quiz = models.Quiz(title="Quiz", document_id=document.id)
+    session.add(quiz)
+    session.commit()
+    crud.create_quiz_attempt(session, quiz, user.id, score=80.0, correct_answers=4, total_questions=5)
+
+    assert crud.delete_document_and_related_data(session, document.id)
+
+    totals = crud.get_user_activity_totals(session, user.id)
+    assert totals["cards_studied"] == 0
+    assert totals["quizzes_completed"] == 0
+    assert totals["quiz_score_sum"] == 0.0
+
+def test_due_queue_includes_unseen_cards_after_overdue_ones(session, user, make_document):
+    document, flashcards = _deck(session, make_document, 3)
+    crud.create_study_logs_batch(
+        session, user.id,
+        [{
+            "flashcard_id": flashcards[2].id, "accuracy": 0.0,
+            "studied_at": datetime.now(timezone.utc) - timedelta(days=3), "client_event_id": "old",
+        }],
+        {fc.id: document.id for fc in flashcards},
+    )
+    crud.create_study_log(session, user.id, flashcards[1].id, accuracy=1.0)  # vence amanhã
+
+    due = crud.get_due_flashcards(session, user.id, limit=10)
+
+    assert [fc.id for fc in due] == [flashcards[2].id, flashcards[0].id]
+    assert [fc.id for fc in crud.get_due_flashcards(session, user.id, limit=1)] == [flashcards[2].id]
+
+def test_client_event_id_migration_enables_idempotent_sync(session, user, make_document):
+    document, flashcards = _deck(session, make_document, 1)
+    # Esquema de antes da sincronização offline
+    session.exec(sql_text("ALTER TABLE studylog DROP COLUMN client_event_id"))
+    session.commit()
+
+    assert crud.migrate_study_log_client_event_ids(session) is True
+    assert crud.migrate_study_log_client_event_ids(session) is False
+
+    event = {"flashcard_id": flashcards[0].id, "accuracy": 1.0,
+             "studied_at": datetime.now(timezone.utc), "client_event_id": "evento-1"}
+    owners = {flashcards[0].id: document.id}
+    assert crud.create_study_logs_batch(session, user.id, [event], owners) == 1
+    assert crud.create_study_logs_batch(session, user.id, [event], owners) == 0
+
+def test_rebuild_matches_raw_history(session):
+    rng = random.Random(7)
+    users = [models.User(username=f"aluno{n}", email=f"aluno{n}@example.com") for n in range(2)]
+    session.add_all(users)
+    session.commit()
+    decks = []
+    for owner in users:
+        for _ in range(2):
+            document = models.Document(user_id=owner.id, file_path="deck.pdf")
+            session.add(document)
+            session.commit()
+            flashcards = crud.create_flashcards_for_document(
+                session, [{"front": f"F{n}", "back": f"B{n}"} for n in range(4)], document.id
+            )
+            quiz = models.Quiz(title="Quiz", document_id=document.id)
+            session.add(quiz)
+            session.commit()
+            decks.append((owner.id, document.id, [fc.id for fc in flashcards], quiz.id))
+
+    now = datetime.now(timezone.utc)
+    logs, attempts = [], []
+    for user_id, document_id, flashcard_ids, quiz_id in decks:
+        for _ in range(rng.randint(5, 15)):
+            logs.append(models.StudyLog(
+                user_id=user_id, flashcard_id=rng.choice(flashcard_ids), accuracy=rng.choice([0.0, 0.5, 1.0]),
+                studied_at=now - timedelta(days=rng.randint(0, 10), minutes=rng.randint(0, 1439)),
+            ))
+        for _ in range(rng.randint(0, 4)):
+            attempts.append(models.QuizAttempt(
+                user_id=user_id, quiz_id=quiz_id, score=float(rng.choice([0, 20, 40, 60, 80, 100])),
+                correct_answers=0, total_questions=5,
+                completed_at=now - timedelta(days=rng.randint(0, 10), minutes=rng.randint(0, 1439)),
+            ))
+    session.add_all(logs + attempts)
+    # Resumo divergente que a reconstrução deve corrigir
+    session.add(models.UserDailyActivity(user_id=users[0].id, activity_date=now.date(), cards_studied=99))
+    session.commit()
+    expected_decks, expected_days = {}, {}
+    document_of_flashcard = {fc_id: document_id for _, document_id, fc_ids, _ in decks for fc_id in fc_ids}
+    document_of_quiz = {quiz_id: document_id for _, document_id, _, quiz_id in decks}
+    for log in logs:
+        expected_decks.setdefault((log.user_id, document_of_flashcard[log.flashcard_id]), [set(), []])[0].add(log.flashcard_id)
+        day = expected_days.setdefault((log.user_id, log.studied_at.astimezone(timezone.utc).date()), [0, 0.0, 0, 0.0])
+        day[0] += 1
+        day[1] += log.accuracy
+    for attempt in attempts:
+        expected_decks.setdefault((attempt.user_id, document_of_quiz[attempt.quiz_id]), [set(), []])[1].append(attempt)
+        day = expected_days.setdefault((attempt.user_id, attempt.completed_at.astimezone(timezone.utc).date()), [0, 0.0, 0, 0.0])
+        day[2] += 1
+        day[3] += attempt.score
+
+    crud.rebuild_progress_summaries(session)
+
+    session.expire_all()
+    deck_rows = {(row.user_id, row.document_id): row for row in session.exec(select(models.DeckProgress))}
+    assert set(deck_rows) == set(expected_decks)
+    for key, (studied, deck_attempts) in expected_decks.items():
+        row = deck_rows[key]
+        assert row.studied_flashcards == len(studied)
+        assert row.quiz_attempts == len(deck_attempts)
+        assert row.quiz_score_sum == sum(attempt.score for attempt in deck_attempts)
+        if deck_attempts:
+            latest = max(deck_attempts, key=lambda attempt: attempt.completed_at)
+            assert (row.last_quiz_score, row.last_quiz_at) == (latest.score, latest.completed_at)
+
+    day_rows = {(row.user_id, row.activity_date): row for row in session.exec(select(models.UserDailyActivity))}
+    assert set(day_rows) == set(expected_days)
+    for key, (cards_studied, accuracy_sum, quizzes_completed, quiz_score_sum) in expected_days.items():
+        row = day_rows[key]
+        assert (row.cards_studied, row.accuracy_sum) == (cards_studied, accuracy_sum)
+        assert (row.quizzes_completed, row.quiz_score_sum) == (quizzes_completed, quiz_score_sum)
@@ -0,0 +1,53 @@
+# back/tests/test_text_extractor.py
+"""
+A extração paralela de PDF roda dentro dos processos do pool prefork do
+worker, que são daemônicos: os filhos criados pelo billiard precisam
+funcionar ali e devolver as páginas na ordem da extração sequencial.
+"""
+import os
+import threading
+
+import pdfplumber
+import pytest
+from celery.concurrency.prefork import TaskPool
+
+from app import text_extractor
+from app.worker import celery_app
+
+SAMPLE_PDF = "/usr/share/doc/shared-mime-info/shared-mime-info-spec.pdf"
+
+def _extract_in_pool_process(file_path: str, num_pages: int):
+    import billiard
+    return billiard.current_process().daemon, list(text_extractor._iter_pdf_pages_parallel(file_path, num_pages))
+
+@pytest.mark.skipif(not os.path.exists(SAMPLE_PDF), reason="PDF de exemplo não disponível")
+def test_parallel_extraction_runs_inside_the_prefork_pool(monkeypatch):
+    with pdfplumber.open(SAMPLE_PDF) as pdf:
+        num_pages = len(pdf.pages)
+    # Herdado pelos processos do pool (fork)
+    monkeypatch.setattr(text_extractor, "PDF_EXTRACTION_WORKERS", 2)
+
+    finished = threading.Event()
+    outcome = {}
+    def on_result(result):
+        outcome["result"] = result
+        finished.set()
+    def on_error(error):
+        outcome["error"] = error
+        finished.set()
+
+    pool = TaskPool(limit=1, initargs=(celery_app, "test-worker"))
+    pool.start()
+    try:
+        pool.apply_async(
+            _extract_in_pool_process, args=(SAMPLE_PDF, num_pages),
+            callback=on_result, error_callback=on_error,
+        )
+        assert finished.wait(120)
+    finally:
+        pool.stop()
+
+    assert "error" not in outcome, outcome.get("error")
+    daemon, pages = outcome["result"]
+    assert daemon
+    assert pages == list(text_extractor.iter_pdf_pages(SAMPLE_PDF, 0, num_pages))
@@ -0,0 +1,67 @@
+# back/tests/test_text_index.py
+"""
+Índice BM25 do texto: os trechos são guardados como posições no texto, e o
+índice só é gravado quando o texto do conteúdo é gravado pela primeira vez
+ou pela migração; a leitura pelo chat nunca grava.
+"""
+from unittest.mock import patch
+
+from sqlalchemy import text as sql_text
+
+from app import crud, models, text_index
+
+TEXT = (
+    "A fotossíntese acontece nos cloroplastos.\n\n"
+    "A clorofila absorve   a luz\nvermelha e azul. " + "A planta libera oxigênio. " * 60 + "\n\n"
+    "As raízes absorvem água e sais minerais."
+)
+
+def test_passages_are_offsets_into_the_text():
+    spans = text_index.split_passages(TEXT, max_chars=200)
+
+    passages = [text_index.passage_text(TEXT, span) for span in spans]
+    assert all(len(passage) <= 200 for passage in passages)
+    assert "".join(passages).replace(" ", "") == "".join(TEXT.split())
+    assert passages[0].startswith("A fotossíntese acontece nos cloroplastos. A clorofila absorve a luz vermelha")
+
+def test_retrieve_context_cuts_relevant_passages_from_the_text():
+    index = text_index.build_index(TEXT)
+
+    context = text_index.retrieve_context(index, TEXT, "raízes e sais minerais", top_k=1)
+
+    assert context.endswith("As raízes absorvem água e sais minerais.")
+    assert "cloroplastos" not in context
+
+def test_index_is_built_only_when_the_text_is_inserted(session):
+    session.add(models.DocumentBlob(content_hash="abc", size_bytes=len(TEXT)))
+    session.commit()
+
+    with patch.object(text_index, "build_index", wraps=text_index.build_index) as build_index:
+        crud.store_document_text(session, "abc", TEXT)
+        crud.store_document_text(session, "abc", TEXT)
+        session.commit()
+
+    assert build_index.call_count == 1
+    row = session.get(models.DocumentTextIndex, "abc")
+    assert row.version == text_index.TEXT_INDEX_VERSION
+
+def test_missing_index_is_built_in_memory_and_persisted_by_the_migration(session, make_document):
+    session.add(models.DocumentBlob(content_hash="abc", size_bytes=len(TEXT)))
+    session.commit()
+    crud.store_document_text(session, "abc", TEXT)
+    # Texto gravado antes do índice existir
+    session.exec(sql_text("DELETE FROM documenttextindex"))
+    session.commit()
+    document = make_document(content_hash="abc")
+
+    index = crud.get_document_text_index(session, document, TEXT)
+
+    assert index["version"] == text_index.TEXT_INDEX_VERSION
+    session.rollback()
+    assert session.get(models.DocumentTextIndex, "abc") is None
+
+    crud.migrate_legacy_document_texts(session)
+
+    row = session.get(models.DocumentTextIndex, "abc")
+    assert row.version == text_index.TEXT_INDEX_VERSION
+    assert crud.rebuild_document_text_indexes(session) == 0
@@ -296,4 +296,15 @@ data class AddFlashcardsRequest(
 data class AddQuestionsRequest(
     @SerializedName("num_questions") val numQuestions: Int,
     val difficulty: String = "Médio"
+)
+
+// Job de geração enfileirado no backend (add-flashcards / add-questions)
+data class JobResponse(
+    @SerializedName("job_id") val jobId: String,
+    val kind: String,
+    @SerializedName("document_id") val documentId: Int,
+    val state: String,
+    @SerializedName("current_step") val currentStep: String?,
+    @SerializedName("processing_progress") val processingProgress: Int,
+    val error: String?
 )
\ No newline at end of file
@@ -209,14 +209,20 @@ interface ApiService {
         @Header("Authorization") token: String,
         @Path("document_id") documentId: Int,
         @Body request: com.example.flashify.model.data.AddFlashcardsRequest
-    ): List<FlashcardResponse>
+    ): com.example.flashify.model.data.JobResponse
 
     @POST("documents/{document_id}/add-questions")
     suspend fun addMoreQuestions(
         @Header("Authorization") token: String,
         @Path("document_id") documentId: Int,
         @Body request: com.example.flashify.model.data.AddQuestionsRequest
-    ): com.example.flashify.model.data.QuizResponse
+    ): com.example.flashify.model.data.JobResponse
+
+    @GET("jobs/{job_id}")
+    suspend fun getJob(
+        @Header("Authorization") token: String,
+        @Path("job_id") jobId: String
+    ): com.example.flashify.model.data.JobResponse
 }
 
 object Api {
@@ -397,35 +397,16 @@ class DeckViewModel @Inject constructor(
 
             try {
                 val request = com.example.flashify.model.data.AddFlashcardsRequest(numFlashcards = quantity)
-                apiService.addMoreFlashcards(token, documentId, request)
+                val job = waitForJob(token, apiService.addMoreFlashcards(token, documentId, request))
 
-                Log.d("DeckViewModel", "✅ Requisição de flashcards enviada ao backend")
-
-                kotlinx.coroutines.delay(2000)
-
-                try {
-                    fetchDecks(showLoading = false)
-                    fetchDeckStats(documentId, showLoading = false)
-                    checkGenerationLimit()
-
-                    Log.d("DeckViewModel", "📥 Dados atualizados buscados")
-
-                    kotlinx.coroutines.delay(1000)
-
-                    val currentStats = _deckStatsState.value
-                    if (currentStats is DeckStatsState.Success) {
-                        Log.d("DeckViewModel", "✅ Stats confirmadas: ${currentStats.stats.flashcards.total} flashcards")
-                        _syncCompleted.value = true
-                    } else {
-                        Log.w("DeckViewModel", "⚠️ Stats ainda não carregadas, forçando sync")
-                        _syncCompleted.value = true
-                    }
-
-                } catch (e: Exception) {
-                    Log.e("DeckViewModel", "❌ Erro na sincronização: ${e.message}")
-                    _syncCompleted.value = true
+                Log.d("DeckViewModel", "✅ Job de flashcards ${job.jobId} terminou: ${job.state}")
+                if (job.state != "SUCCESS") {
+                    _addContentState.value = AddContentState.Error(jobErrorMessage(job, "Erro ao adicionar flashcards"))
+                    return@launch
                 }
 
+                refreshAfterAddingContent(documentId)
+
                 _addContentState.value = AddContentState.Success("Novos flashcards adicionados com sucesso!")
 
             } catch (e: Exception) {
@@ -448,35 +429,16 @@ class DeckViewModel @Inject constructor(
 
             try {
                 val request = com.example.flashify.model.data.AddQuestionsRequest(numQuestions = quantity)
-                apiService.addMoreQuestions(token, documentId, request)
-
-                Log.d("DeckViewModel", "✅ Requisição de perguntas enviada ao backend")
-
-                kotlinx.coroutines.delay(2000)
-
-                try {
-                    fetchDecks(showLoading = false)
-                    fetchDeckStats(documentId, showLoading = false)
-                    checkGenerationLimit()
-
-                    Log.d("DeckViewModel", "📥 Dados atualizados buscados")
+                val job = waitForJob(token, apiService.addMoreQuestions(token, documentId, request))
 
-                    kotlinx.coroutines.delay(1000)
-
-                    val currentStats = _deckStatsState.value
-                    if (currentStats is DeckStatsState.Success) {
-                        Log.d("DeckViewModel", "✅ Stats confirmadas")
-                        _syncCompleted.value = true
-                    } else {
-                        Log.w("DeckViewModel", "⚠️ Stats ainda não carregadas, forçando sync")
-                        _syncCompleted.value = true
-                    }
-
-                } catch (e: Exception) {
-                    Log.e("DeckViewModel", "❌ Erro na sincronização: ${e.message}")
-                    _syncCompleted.value = true
+                Log.d("DeckViewModel", "✅ Job de perguntas ${job.jobId} terminou: ${job.state}")
+                if (job.state != "SUCCESS") {
+                    _addContentState.value = AddContentState.Error(jobErrorMessage(job, "Erro ao adicionar perguntas"))
+                    return@launch
                 }
 
+                refreshAfterAddingContent(documentId)
+
                 _addContentState.value = AddContentState.Success("Novas perguntas adicionadas com sucesso!")
 
             } catch (e: Exception) {
@@ -486,6 +448,40 @@ class DeckViewModel @Inject constructor(
         }
     }
 
+    // Consulta o job até o Celery reportar um estado final
+    private suspend fun waitForJob(
+        token: String,
+        job: com.example.flashify.model.data.JobResponse
+    ): com.example.flashify.model.data.JobResponse {
+        var current = job
+        while (current.state !in listOf("SUCCESS", "FAILURE", "REVOKED")) {
+            kotlinx.coroutines.delay(2000)
+            current = apiService.getJob(token, current.jobId)
+            Log.d("DeckViewModel", "⏳ Job ${current.jobId}: ${current.state} (${current.currentStep})")
+        }
+        return current
+    }
+
+    private fun jobErrorMessage(job: com.example.flashify.model.data.JobResponse, default: String): String {
+        return when (job.state) {
+            "REVOKED" -> "Geração cancelada"
+            else -> job.error ?: default
+        }
+    }
+
+    // Busca o deck atualizado depois que o job terminou
+    private suspend fun refreshAfterAddingContent(documentId: Int) {
+        try {
+            fetchDecks(showLoading = false)
+            fetchDeckStats(documentId, showLoading = false)
+            checkGenerationLimit()
+            Log.d("DeckViewModel", "📥 Dados atualizados buscados")
+        } catch (e: Exception) {
+            Log.e("DeckViewModel", "❌ Erro na sincronização: ${e.message}")
+        }
+        _syncCompleted.value = true
+    }
+
     fun resetAddContentState() {
         _addContentState.value = AddContentState.Idle
         _syncCompleted.value = false